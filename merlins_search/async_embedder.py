@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Async Bulk Embedder
+Concurrency-bounded Gemini embedding with a token-bucket rate limiter.
+"""
+
+import asyncio
+import random
+import time
+from typing import List, Dict, Any, Optional, Tuple
+import httpx
+from gemini_api import (
+    GEMINI_API_BASE,
+    GEMINI_BATCH_MAX_BYTES,
+    RETRYABLE_STATUS_CODES,
+    batch_embed_contents_url,
+    batch_embed_request,
+    embed_content_url,
+    embed_request,
+    pack_batches,
+    parse_batch_response,
+    parse_retry_after
+)
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursting up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until ``tokens`` are available, then consume them."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AsyncGeminiBulkEmbedder:
+    """Embeds many texts concurrently against the Gemini embedding endpoints.
+
+    With ``batch_size`` > 1 each request is a batchEmbedContents call. A
+    throttled batch is resent whole with backoff; only a batch the API
+    rejects (a 400, or the wrong number of embeddings) is bisected, so only
+    the bad items end up as individual embedContent requests.
+    """
+
+    def __init__(self, api_key: str, max_in_flight: int = 8, qps: float = 20.0, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0, timeout: float = 30.0,
+                 api_base: str = GEMINI_API_BASE, batch_size: int = 1,
+                 max_batch_bytes: int = GEMINI_BATCH_MAX_BYTES):
+        """Configure concurrency, the provider QPS quota, batching and retry policy."""
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.qps = qps
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.url = embed_content_url(api_base)
+        self.batch_url = batch_embed_contents_url(api_base)
+
+        # Filled in after each run
+        self.last_run_stats: Dict[str, Any] = {}
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _post(self, client: httpx.AsyncClient, bucket: TokenBucket, semaphore: asyncio.Semaphore,
+                    url: str, payload: Dict[str, Any], label: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """POST with rate limiting, retrying retryable failures.
+
+        Returns (JSON body, False) on success, (None, True) when the API
+        rejected the request itself, and (None, False) when retryable
+        failures outlasted the retries. A Retry-After header is honoured in
+        place of the backoff delay.
+        """
+        error = None
+        for attempt in range(self.max_retries + 1):
+            delay = None
+            async with semaphore:
+                await bucket.acquire()
+                self.last_run_stats['requests'] += 1
+                try:
+                    response = await client.post(url, params={'key': self.api_key}, json=payload)
+                except httpx.TransportError as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        if response.is_success:
+                            return response.json(), False
+                        print(f"Error creating embeddings for {label}: HTTP {response.status_code}")
+                        return None, True
+                    error = f"HTTP {response.status_code}"
+                    delay = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt < self.max_retries:
+                self.last_run_stats['retries'] += 1
+                # Sleep outside the semaphore so other requests can use the slot
+                await asyncio.sleep(self.backoff_delay(attempt) if delay is None else delay)
+
+        print(f"Giving up on {label} after {self.max_retries + 1} attempts ({error})")
+        return None, False
+
+    async def _embed_one(self, client: httpx.AsyncClient, bucket: TokenBucket, semaphore: asyncio.Semaphore,
+                         index: int, text: str) -> Optional[List[float]]:
+        """Embed a single text with one embedContent request."""
+        result, _ = await self._post(client, bucket, semaphore, self.url, embed_request(text), f"item {index}")
+        try:
+            return result['embedding']['values'] if result else None
+        except (KeyError, TypeError) as e:
+            print(f"Malformed embedding response for item {index}: {e}")
+            return None
+
+    async def _embed_batch(self, client: httpx.AsyncClient, bucket: TokenBucket, semaphore: asyncio.Semaphore,
+                           indices: List[int], texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed one packed batch; a rejected batch is split in half until the bad items are isolated.
+
+        A batch still throttled or failing after its retries is not split,
+        which would only add load; its items come back as None.
+        """
+        batch_texts = [texts[i] for i in indices]
+        label = f"batch of {len(indices)} starting at item {indices[0]}"
+        result, rejected = await self._post(client, bucket, semaphore, self.batch_url,
+                                            batch_embed_request(batch_texts), label)
+        if result is not None:
+            try:
+                return parse_batch_response(result, len(indices))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Malformed batch response for {label}: {e}")
+        elif not rejected:
+            return [None] * len(indices)
+
+        if len(indices) == 1:
+            return [await self._embed_one(client, bucket, semaphore, indices[0], texts[indices[0]])]
+        middle = len(indices) // 2
+        halves = await asyncio.gather(
+            self._embed_batch(client, bucket, semaphore, indices[:middle], texts),
+            self._embed_batch(client, bucket, semaphore, indices[middle:], texts)
+        )
+        return halves[0] + halves[1]
+
+    async def embed_all(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed all texts; results are returned in input order."""
+        self.last_run_stats = {'retries': 0, 'requests': 0}
+        bucket = TokenBucket(self.qps)
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        limits = httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+
+        start_time = time.time()
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits,
+                                     headers={'Content-Type': 'application/json'}) as client:
+            if self.batch_size > 1:
+                batches = pack_batches(texts, self.batch_size, self.max_batch_bytes)
+                batch_results = await asyncio.gather(*[
+                    self._embed_batch(client, bucket, semaphore, batch, texts) for batch in batches
+                ])
+                embeddings: List[Optional[List[float]]] = [None] * len(texts)
+                for batch, vectors in zip(batches, batch_results):
+                    for i, vector in zip(batch, vectors):
+                        embeddings[i] = vector
+            else:
+                embeddings = list(await asyncio.gather(*[
+                    self._embed_one(client, bucket, semaphore, i, text) for i, text in enumerate(texts)
+                ]))
+        elapsed = time.time() - start_time
+
+        succeeded = sum(1 for embedding in embeddings if embedding is not None)
+        throughput = succeeded / elapsed if elapsed > 0 else 0.0
+        self.last_run_stats.update({
+            'total': len(texts),
+            'succeeded': succeeded,
+            'failed': len(texts) - succeeded,
+            'elapsed_seconds': elapsed,
+            'embeddings_per_second': throughput
+        })
+        print(f"Embedded {succeeded}/{len(texts)} texts in {elapsed:.2f}s "
+              f"({throughput:.1f} embeddings/sec, {self.last_run_stats['requests']} requests, "
+              f"{self.last_run_stats['retries']} retries)")
+
+        return embeddings
+
+    def embed_texts(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Synchronous entry point for scripts."""
+        return asyncio.run(self.embed_all(texts))
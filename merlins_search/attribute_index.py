@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Attribute Index
+Columnar listing attributes for structured filtering ahead of the text and
+vector scans.
+"""
+
+import re
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+
+# Numeric columns stored as float64 arrays, NaN where missing
+NUMERIC_ATTRIBUTES = ['price', 'bedrooms', 'bathrooms', 'sqft', 'lot_acres', 'days_on_market']
+
+# Text columns stored dictionary-encoded: one int32 code per listing
+CATEGORICAL_ATTRIBUTES = ['city', 'zip_code', 'architectural_style', 'status']
+
+# Request filter -> (numeric attribute, bound). Bounds are inclusive
+RANGE_FILTERS = {
+    'min_price': ('price', 'min'),
+    'max_price': ('price', 'max'),
+    'min_bedrooms': ('bedrooms', 'min'),
+    'min_bathrooms': ('bathrooms', 'min'),
+    'min_sqft': ('sqft', 'min'),
+    'max_sqft': ('sqft', 'max'),
+    'min_acres': ('lot_acres', 'min'),
+    'max_acres': ('lot_acres', 'max'),
+    'max_days_on_market': ('days_on_market', 'max'),
+}
+
+# Request filter -> categorical attribute it is matched against
+CATEGORY_FILTERS = {
+    'city': 'city',
+    'zip_code': 'zip_code',
+    'architectural_style': 'architectural_style',
+    'property_type': 'architectural_style',
+    'status': 'status',
+}
+
+# Every filter name accepted by AttributeIndex.mask()
+FILTER_NAMES = list(RANGE_FILTERS) + list(CATEGORY_FILTERS) + ['price_range']
+
+# Styles are comma-separated lists ("Ranch,Contemporary"); a filter matches any member
+MULTI_VALUED_ATTRIBUTES = {'architectural_style'}
+
+PRICE_AMOUNT = r'\$?\s*(\d+(?:\.\d+)?)\s*([km]?)'
+PRICE_MULTIPLIERS = {'': 1, 'k': 1_000, 'm': 1_000_000}
+
+
+def _number(value: Any) -> float:
+    """Numeric attribute value, parsing the leading number of strings like "3 (4)"."""
+    if isinstance(value, bool) or value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value))
+    return float(match.group(1)) if match else np.nan
+
+
+def _category(value: Any) -> Optional[str]:
+    """Normalised category key: lowercased, trimmed text; None when missing."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    text = str(value).strip().lower()
+    return text or None
+
+
+def _price(amount: str, suffix: str) -> float:
+    return float(amount) * PRICE_MULTIPLIERS[suffix]
+
+
+def parse_price_range(price_range: str) -> Tuple[Optional[float], Optional[float]]:
+    """Parse "300k-500k", "500000+", "under 400k" or "over 1m" into (min, max) prices.
+
+    Raises ValueError for anything else.
+    """
+    text = price_range.strip().lower().replace(',', '')
+    patterns = [
+        (rf'^{PRICE_AMOUNT}\s*(?:-|to)\s*{PRICE_AMOUNT}$', lambda m: (_price(*m.group(1, 2)), _price(*m.group(3, 4)))),
+        (rf'^{PRICE_AMOUNT}\s*\+$', lambda m: (_price(*m.group(1, 2)), None)),
+        (rf'^(?:over|above|from|>=?)\s*{PRICE_AMOUNT}$', lambda m: (_price(*m.group(1, 2)), None)),
+        (rf'^(?:under|below|up to|<=?)\s*{PRICE_AMOUNT}$', lambda m: (None, _price(*m.group(1, 2)))),
+    ]
+    for pattern, bounds in patterns:
+        match = re.match(pattern, text)
+        if match:
+            return bounds(match)
+    raise ValueError(f"Unrecognised price_range '{price_range}'; use e.g. '300k-500k', '500k+' or 'under 400k'")
+
+
+class AttributeIndex:
+    """Column store of listing attributes, row-aligned with a listing list.
+
+    Built once at load time. Filters are evaluated as boolean masks over
+    whole columns; categorical filters compare small integer codes, and a
+    value is resolved to its codes through the (short) category list rather
+    than by touching every listing.
+
+    Rows removed by ``with_changes()`` stay in the columns as tombstones and
+    are cleared in ``alive``, which every mask is ANDed with.
+    """
+
+    def __init__(self, listings: List[Dict[str, Any]]):
+        self.size = len(listings)
+        # None while no row is tombstoned, so unfiltered searches skip masking
+        self.alive: Optional[np.ndarray] = None
+        self.numeric: Dict[str, np.ndarray] = {
+            name: np.array([_number(listing.get(name)) for listing in listings], dtype=np.float64)
+            for name in NUMERIC_ATTRIBUTES
+        }
+
+        self.codes: Dict[str, np.ndarray] = {}
+        self.categories: Dict[str, List[str]] = {}
+        for name in CATEGORICAL_ATTRIBUTES:
+            lookup: Dict[str, int] = {}
+            codes = np.full(self.size, -1, dtype=np.int32)
+            for row, listing in enumerate(listings):
+                key = _category(listing.get(name))
+                if key is not None:
+                    codes[row] = lookup.setdefault(key, len(lookup))
+            self.codes[name] = codes
+            self.categories[name] = list(lookup)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def deleted(self) -> int:
+        """Number of tombstoned rows."""
+        return 0 if self.alive is None else self.size - int(np.count_nonzero(self.alive))
+
+    def with_changes(self, appended: List[Dict[str, Any]], deleted_rows: Sequence[int]) -> 'AttributeIndex':
+        """A new index with ``appended`` listings as extra rows and ``deleted_rows`` tombstoned.
+
+        Columns are extended rather than rebuilt, and this index is left
+        untouched for searches still reading it.
+        """
+        index = AttributeIndex.__new__(AttributeIndex)
+        index.size = self.size + len(appended)
+        index.numeric = {
+            name: np.concatenate([column, [_number(listing.get(name)) for listing in appended]])
+            for name, column in self.numeric.items()
+        }
+        index.codes = {}
+        index.categories = {}
+        for name, codes in self.codes.items():
+            lookup = {category: code for code, category in enumerate(self.categories[name])}
+            new_codes = np.full(len(appended), -1, dtype=np.int32)
+            for row, listing in enumerate(appended):
+                key = _category(listing.get(name))
+                if key is not None:
+                    new_codes[row] = lookup.setdefault(key, len(lookup))
+            index.codes[name] = np.concatenate([codes, new_codes])
+            index.categories[name] = list(lookup)
+
+        index.alive = None
+        if self.alive is not None or len(deleted_rows):
+            index.alive = np.ones(index.size, dtype=bool)
+            if self.alive is not None:
+                index.alive[:self.size] = self.alive
+            index.alive[np.asarray(deleted_rows, dtype=np.intp)] = False
+        return index
+
+    def category_codes(self, name: str, value: Any) -> np.ndarray:
+        """Codes of ``name`` categories matching ``value`` (any member, for multi-valued styles)."""
+        key = _category(value)
+        if name in MULTI_VALUED_ATTRIBUTES:
+            matches = [code for code, category in enumerate(self.categories[name])
+                       if key in (member.strip() for member in category.split(','))]
+        else:
+            matches = [code for code, category in enumerate(self.categories[name]) if category == key]
+        return np.array(matches, dtype=np.int32)
+
+    def mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Boolean row mask for the given request filters; None when every row passes.
+
+        ``filters`` maps RANGE_FILTERS / CATEGORY_FILTERS names (plus
+        ``price_range``) to values; None values are ignored. Unknown names
+        raise ValueError. Listings missing a filtered attribute, and
+        tombstoned rows, never match.
+        """
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if 'price_range' in filters:
+            low, high = parse_price_range(filters.pop('price_range'))
+            if low is not None:
+                filters['min_price'] = max(low, filters.get('min_price', low))
+            if high is not None:
+                filters['max_price'] = min(high, filters.get('max_price', high))
+        if not filters:
+            return None if self.alive is None else self.alive
+
+        mask = np.ones(self.size, dtype=bool) if self.alive is None else self.alive.copy()
+        for name, value in filters.items():
+            if name in RANGE_FILTERS:
+                attribute, bound = RANGE_FILTERS[name]
+                column = self.numeric[attribute]
+                # NaN compares False, so missing values drop out
+                mask &= column >= value if bound == 'min' else column <= value
+            elif name in CATEGORY_FILTERS:
+                attribute = CATEGORY_FILTERS[name]
+                codes = self.category_codes(attribute, value)
+                if len(codes) == 1:
+                    mask &= self.codes[attribute] == codes[0]
+                else:
+                    mask &= np.isin(self.codes[attribute], codes)
+            else:
+                raise ValueError(f"Unknown filter '{name}'")
+        return mask
+
+    def rows(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Sorted rows passing ``filters``; None when every row passes."""
+        mask = self.mask(filters)
+        return None if mask is None else np.flatnonzero(mask)
@@ -4,27 +4,91 @@ Cached Gemini Property Embedder
 High-performance version with query caching and optimizations
 """
 
+import asyncio
+import concurrent.futures
 import json
 import os
+import threading
 import time
+from collections import deque
 from typing import List, Dict, Any, Optional
+import httpx
 import requests
 import hashlib
 from functools import lru_cache
+from gemini_api import (
+    GEMINI_API_BASE,
+    GEMINI_BATCH_MAX_BYTES,
+    GEMINI_BATCH_MAX_COUNT,
+    GEMINI_BATCH_READ_TIMEOUT,
+    GEMINI_CONNECT_TIMEOUT,
+    GEMINI_READ_TIMEOUT,
+    batch_embed_contents_url,
+    batch_embed_request,
+    embed_content_url,
+    embed_in_batches,
+    embed_request,
+    pack_batches,
+    parse_batch_response,
+    request_headers
+)
+from circuit_breaker import CircuitBreaker
+from query_cache import DEFAULT_MAX_BYTES, PersistentQueryEmbeddingCache, QueryEmbeddingCache, normalize_query
+from single_flight import SingleFlight
 
 try:
     import numpy as np
+    from embedding_store import load_embedding_store
+    from vector_index import PropertyVectorIndex
     NUMPY_AVAILABLE = True
 except ImportError:
     import math
     NUMPY_AVAILABLE = False
     print("Warning: numpy not available, using pure Python (slower)")
 
+# Keep-alive connections the async client holds open to the embedding API
+ASYNC_MAX_CONNECTIONS = 64
+ASYNC_MAX_KEEPALIVE = 16
+
+# Worker threads running budgeted create_embedding calls, so a caller can stop waiting at the deadline
+SYNC_BUDGET_WORKERS = 16
+
+# Hedging waits for the p95 of the last HEDGE_WINDOW call latencies, once
+# HEDGE_MIN_SAMPLES calls have been timed, and never less than HEDGE_MIN_DELAY
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+# Written by gemini_embedder.py; the binary store is preferred over the JSON file
+EMBEDDING_STORE_PATH = "property_embeddings_gemini.npy"
+EMBEDDINGS_JSON_PATH = "property_embeddings_gemini.json"
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Whether an error means the embedding API is unhealthy, rather than the request being bad."""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is None or status == 429 or status >= 500
+
 class CachedGeminiPropertyEmbedder:
     """Optimized Gemini embedder with caching and performance improvements."""
     
-    def __init__(self, api_key: str = None, cache_size: int = 100):
-        """Initialize with API key and cache configuration."""
+    def __init__(self, api_key: str = None, cache_size: int = 100, api_base: str = None,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES, cache_ttl: Optional[float] = None,
+                 persistent_cache: Optional[PersistentQueryEmbeddingCache] = None,
+                 latency_budget: Optional[float] = None, breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = False):
+        """Initialize with API key and cache configuration.
+
+        The query cache holds at most ``cache_size`` embeddings and
+        ``cache_max_bytes`` of vector data; ``cache_ttl`` (seconds) expires
+        entries, e.g. after a model change. Memory misses fall through to
+        ``persistent_cache``, when given, before calling the API.
+
+        ``latency_budget`` caps the seconds one query embedding call may take.
+        While ``breaker`` is open, misses return None at once instead of calling
+        the API. With ``hedge``, an async call still unanswered after the
+        recent p95 latency is raced against a second request.
+        """
         if api_key:
             self.api_key = api_key
         else:
@@ -33,11 +97,31 @@ class CachedGeminiPropertyEmbedder:
                 raise ValueError("Gemini API key required")
             self.api_key = api_key
         
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent"
+        self.api_base = api_base or os.getenv('GEMINI_API_BASE', GEMINI_API_BASE)
+        self.base_url = embed_content_url(self.api_base)
+        self.batch_url = batch_embed_contents_url(self.api_base)
         
-        # Query embedding cache
-        self.query_cache = {}
+        # Query embedding cache, shared by request threads
+        self.query_cache = QueryEmbeddingCache(max_bytes=cache_max_bytes, max_entries=cache_size, ttl=cache_ttl)
         self.cache_size = cache_size
+        self.persistent_cache = persistent_cache
+        
+        # Concurrent misses for the same query share one API call
+        self.in_flight = SingleFlight()
+        
+        # Pooled client for create_embedding_async, bound to the loop that created it
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop = None
+        
+        # Threads for create_embedding calls under a latency budget, created on first use
+        self._sync_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._sync_pool_lock = threading.Lock()
+        
+        # Latency protection for the query path
+        self.latency_budget = latency_budget
+        self.breaker = breaker
+        self.hedge = hedge
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
         
         # Precomputed common queries
         self.common_queries = self._load_precomputed_queries()
@@ -46,9 +130,71 @@ class CachedGeminiPropertyEmbedder:
         self.stats = {
             'api_calls': 0,
             'cache_hits': 0,
+            'disk_hits': 0,
             'precomputed_hits': 0,
+            'breaker_rejections': 0,
+            'hedged_calls': 0,
             'total_queries': 0
         }
+        self._stats_lock = threading.Lock()
+    
+    def _count(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+    
+    def _breaker_allows(self) -> bool:
+        if self.breaker is None or self.breaker.allow():
+            return True
+        self._count('breaker_rejections')
+        return False
+    
+    def _record_call(self, success: Optional[bool], duration: float, hedge_sample: bool = True):
+        """Report a call to the breaker (None: no outcome) and time successful ones for hedging."""
+        if self.breaker is not None:
+            if success is None:
+                self.breaker.release()
+            else:
+                self.breaker.record(success, duration)
+        if success and hedge_sample:
+            with self._stats_lock:
+                self._latencies.append(duration)
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None when not hedging yet."""
+        with self._stats_lock:
+            if not self.hedge or len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return max(latencies[int(0.95 * (len(latencies) - 1))], HEDGE_MIN_DELAY)
+    
+    def _timeout(self):
+        """(connect, read) timeout for a query embedding request, each within the latency budget."""
+        if self.latency_budget is None:
+            return (GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT)
+        return (min(GEMINI_CONNECT_TIMEOUT, self.latency_budget), min(GEMINI_READ_TIMEOUT, self.latency_budget))
+    
+    def _post_within_budget(self, url: str, data: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+        """POST for create_embedding, returning or raising requests.Timeout within the latency budget.
+
+        requests' timeouts apply per connect and per socket read, so together
+        they cannot bound a call. Under a budget the request runs on a worker
+        thread that the caller stops waiting for at the deadline; the thread
+        itself ends within those timeouts.
+        """
+        if self.latency_budget is None:
+            return requests.post(url, json=data, headers=headers, timeout=self._timeout())
+        
+        deadline = time.monotonic() + self.latency_budget
+        with self._sync_pool_lock:
+            if self._sync_pool is None:
+                self._sync_pool = concurrent.futures.ThreadPoolExecutor(max_workers=SYNC_BUDGET_WORKERS,
+                                                                        thread_name_prefix='embed')
+        future = self._sync_pool.submit(requests.post, url, json=data, headers=headers, timeout=self._timeout())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise requests.Timeout(f"No response within the {self.latency_budget}s latency budget")
     
     def _load_precomputed_queries(self) -> Dict[str, List[float]]:
         """Load precomputed embeddings for common queries."""
@@ -57,60 +203,322 @@ class CachedGeminiPropertyEmbedder:
     
     def _cache_key(self, query: str) -> str:
         """Generate cache key for query."""
-        return hashlib.md5(query.lower().strip().encode()).hexdigest()
+        return hashlib.md5(normalize_query(query).encode()).hexdigest()
+    
+    def _lookup_cache(self, text: str) -> Optional[List[float]]:
+        """Cached embedding from memory, else from the persistent cache (promoted to memory)."""
+        cache_key = self._cache_key(text)
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            self._count('cache_hits')
+            return cached.tolist()
+        if self.persistent_cache is not None:
+            stored = self.persistent_cache.get(text)
+            if stored is not None:
+                self._count('disk_hits')
+                self.query_cache.put(cache_key, stored)
+                return stored.tolist()
+        return None
     
     def create_embedding(self, text: str, use_cache: bool = True) -> Optional[List[float]]:
         """Create embedding with caching support."""
-        self.stats['total_queries'] += 1
+        self._count('total_queries')
         
         # Check precomputed queries first
         if text.lower().strip() in self.common_queries:
-            self.stats['precomputed_hits'] += 1
+            self._count('precomputed_hits')
             return self.common_queries[text.lower().strip()]
         
         # Check cache
         if use_cache:
-            cache_key = self._cache_key(text)
-            if cache_key in self.query_cache:
-                self.stats['cache_hits'] += 1
-                return self.query_cache[cache_key]
+            cached = self._lookup_cache(text)
+            if cached is not None:
+                return cached
         
-        # Make API call
+        # Callers missing on a query that is already being fetched wait for that call
+        return self.in_flight.do((self._cache_key(text), use_cache), lambda: self._fetch_embedding(text, use_cache))
+    
+    def _fetch_embedding(self, text: str, use_cache: bool) -> Optional[List[float]]:
+        """Call embedContent for ``text``, caching the result when ``use_cache``."""
+        if not self._breaker_allows():
+            return None
+        
+        start_time = time.time()
+        success = None
         try:
-            start_time = time.time()
-            self.stats['api_calls'] += 1
-            
-            headers = {'Content-Type': 'application/json'}
-            data = {
-                'model': 'models/text-embedding-004',
-                'content': {'parts': [{'text': text}]}
-            }
+            self._count('api_calls')
             
-            url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, json=data, headers=headers)
+            data = embed_request(text)
+            response = self._post_within_budget(self.base_url, data, request_headers(self.api_key))
             response.raise_for_status()
             
             result = response.json()
             embedding = result['embedding']['values']
+            success = True
             
+        except Exception as e:
+            success = not _is_provider_failure(e)
+            print(f"Error creating embedding: {e!r}")
+            return None
+        finally:
             api_time = time.time() - start_time
+            self._record_call(success, api_time)
+        
+        # Cache the result
+        if use_cache:
+            self._store_in_cache(text, embedding)
+        
+        print(f"API call completed in {api_time:.3f}s")
+        return embedding
+    
+    def _client(self) -> httpx.AsyncClient:
+        """Keep-alive client for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                headers=request_headers(self.api_key),
+                timeout=httpx.Timeout(GEMINI_READ_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                    max_keepalive_connections=ASYNC_MAX_KEEPALIVE)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def aclose(self):
+        """Close the async client's pooled connections."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+    
+    async def create_embedding_async(self, text: str, use_cache: bool = True) -> Optional[List[float]]:
+        """Create embedding like create_embedding, without blocking the event loop.
+
+        The API call is awaited on a pooled keep-alive connection, and
+        persistent-cache reads and writes run in worker threads. Async and
+        threaded callers of the same query share one call, which as a whole
+        (hedge included) is bounded by the latency budget.
+        """
+        self._count('total_queries')
+        
+        normalized = text.lower().strip()
+        if normalized in self.common_queries:
+            self._count('precomputed_hits')
+            return self.common_queries[normalized]
+        
+        if use_cache:
+            cached = self.query_cache.get(self._cache_key(text))
+            if cached is not None:
+                self._count('cache_hits')
+                return cached.tolist()
+        
+        return await self.in_flight.do_async((self._cache_key(text), use_cache),
+                                             lambda: self._fetch_embedding_async(text, use_cache))
+    
+    async def _fetch_embedding_async(self, text: str, use_cache: bool) -> Optional[List[float]]:
+        """Persistent-cache lookup, then embedContent, for a memory-cache miss."""
+        if use_cache and self.persistent_cache is not None:
+            stored = await asyncio.to_thread(self.persistent_cache.get, text)
+            if stored is not None:
+                self._count('disk_hits')
+                self.query_cache.put(self._cache_key(text), stored)
+                return stored.tolist()
+        
+        if not self._breaker_allows():
+            return None
+        
+        start_time = time.time()
+        success = None
+        try:
+            self._count('api_calls')
             
-            # Cache the result
-            if use_cache:
-                # Implement LRU-style cache eviction
-                if len(self.query_cache) >= self.cache_size:
-                    # Remove oldest entry (simple FIFO for now)
-                    oldest_key = next(iter(self.query_cache))
-                    del self.query_cache[oldest_key]
-                
-                self.query_cache[cache_key] = embedding
-            
-            print(f"API call completed in {api_time:.3f}s")
-            return embedding
+            response = await asyncio.wait_for(self._post_hedged(self.base_url, embed_request(text)),
+                                              self.latency_budget)
+            response.raise_for_status()
+            embedding = response.json()['embedding']['values']
+            success = True
             
         except Exception as e:
-            print(f"Error creating embedding: {e}")
+            success = not _is_provider_failure(e)
+            print(f"Error creating embedding: {e!r}")
             return None
+        finally:
+            api_time = time.time() - start_time
+            self._record_call(success, api_time)
+        
+        if use_cache:
+            self.query_cache.put(self._cache_key(text), embedding)
+            if self.persistent_cache is not None:
+                await asyncio.to_thread(self.persistent_cache.put, text, embedding)
+        
+        print(f"API call completed in {api_time:.3f}s")
+        return embedding
+    
+    async def _post_hedged(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST, sending a second identical request if the first outlives the hedge delay.
+
+        The first successful response wins and the other request is cancelled.
+        """
+        client = self._client()
+        first = asyncio.ensure_future(client.post(url, json=payload))
+        delay = self._hedge_delay()
+        if delay is None:
+            return await first
+        
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                self._count('hedged_calls')
+                attempts.append(asyncio.ensure_future(client.post(url, json=payload)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+            return first.result()  # Every attempt failed: raise the first error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+    
+    async def create_embeddings_batch_async(self, texts: List[str],
+                                            use_cache: bool = True) -> List[Optional[List[float]]]:
+        """Embeddings for many queries, sending only the distinct misses to batchEmbedContents.
+
+        Misses are packed into batch requests that are sent concurrently and
+        bounded, together, by the latency budget. The breaker is consulted
+        once for the whole call; texts whose request failed come back as None.
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        misses: Dict[str, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            self._count('total_queries')
+            normalized = text.lower().strip()
+            if normalized in self.common_queries:
+                self._count('precomputed_hits')
+                embeddings[i] = self.common_queries[normalized]
+                continue
+            cached = self.query_cache.get(self._cache_key(text)) if use_cache else None
+            if cached is not None:
+                self._count('cache_hits')
+                embeddings[i] = cached.tolist()
+            else:
+                # Repeats of a query in one batch are embedded once
+                misses.setdefault(self._cache_key(text), []).append(i)
+        
+        miss_texts = [texts[positions[0]] for positions in misses.values()]
+        if use_cache and self.persistent_cache is not None and miss_texts:
+            stored = await asyncio.to_thread(lambda: [self.persistent_cache.get(text) for text in miss_texts])
+            for text, vector in zip(miss_texts, stored):
+                if vector is not None:
+                    self._count('disk_hits')
+                    self.query_cache.put(self._cache_key(text), vector)
+                    for i in misses.pop(self._cache_key(text)):
+                        embeddings[i] = vector.tolist()
+            miss_texts = [texts[positions[0]] for positions in misses.values()]
+        
+        if miss_texts and self._breaker_allows():
+            fetched = await self._post_batches_async(miss_texts)
+            for text, embedding in zip(miss_texts, fetched):
+                if embedding is None:
+                    continue
+                if use_cache:
+                    self.query_cache.put(self._cache_key(text), embedding)
+                for i in misses[self._cache_key(text)]:
+                    embeddings[i] = embedding
+            if use_cache and self.persistent_cache is not None:
+                stored = [(text, embedding) for text, embedding in zip(miss_texts, fetched) if embedding is not None]
+                await asyncio.to_thread(lambda: [self.persistent_cache.put(text, embedding)
+                                                 for text, embedding in stored])
+        
+        return embeddings
+    
+    async def _post_batches_async(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Send texts as concurrent batchEmbedContents requests and report the outcome to the breaker."""
+        batches = pack_batches(texts)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        
+        async def post(indices: List[int]) -> List[List[float]]:
+            self._count('api_calls')
+            response = await self._client().post(self.batch_url, json=batch_embed_request([texts[i] for i in indices]))
+            response.raise_for_status()
+            return parse_batch_response(response.json(), len(indices))
+        
+        start_time = time.time()
+        success = None
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*(post(batch) for batch in batches),
+                                                            return_exceptions=True), self.latency_budget)
+            errors = [result for result in results if isinstance(result, Exception)]
+            for error in errors:
+                print(f"Error creating batch embeddings: {error!r}")
+            success = not any(_is_provider_failure(error) for error in errors)
+            for batch, result in zip(batches, results):
+                if not isinstance(result, Exception):
+                    for i, embedding in zip(batch, result):
+                        embeddings[i] = embedding
+        except Exception as e:
+            success = not _is_provider_failure(e)
+            print(f"Error creating batch embeddings: {e!r}")
+        finally:
+            # Batch latencies would skew the single-query p95 used for hedging
+            self._record_call(success, time.time() - start_time, hedge_sample=False)
+        
+        return embeddings
+    
+    def _store_in_cache(self, text: str, embedding: List[float]):
+        """Add an embedding to the query cache (and the persistent cache); least recently used entries are evicted."""
+        self.query_cache.put(self._cache_key(text), embedding)
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(text, embedding)
+    
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed up to GEMINI_BATCH_MAX_COUNT texts with one batchEmbedContents call (raises on failure)."""
+        self._count('api_calls')
+        response = requests.post(self.batch_url, json=batch_embed_request(texts),
+                                 headers=request_headers(self.api_key),
+                                 timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_BATCH_READ_TIMEOUT))
+        response.raise_for_status()
+        return parse_batch_response(response.json(), len(texts))
+    
+    def create_embeddings_batch(self, texts: List[str], use_cache: bool = True,
+                                batch_size: int = GEMINI_BATCH_MAX_COUNT,
+                                max_batch_bytes: int = GEMINI_BATCH_MAX_BYTES) -> List[Optional[List[float]]]:
+        """Create embeddings for many texts, sending only cache misses to batchEmbedContents.
+
+        Misses are packed into requests under ``batch_size`` items and
+        ``max_batch_bytes``; a throttled batch is resent whole after a backoff,
+        and only items from a rejected batch are retried individually.
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        misses = []
+        
+        for i, text in enumerate(texts):
+            self._count('total_queries')
+            normalized = text.lower().strip()
+            if normalized in self.common_queries:
+                self._count('precomputed_hits')
+                embeddings[i] = self.common_queries[normalized]
+            elif use_cache:
+                embeddings[i] = self._lookup_cache(text)
+            if embeddings[i] is None:
+                misses.append(i)
+        
+        if misses:
+            miss_embeddings = embed_in_batches(
+                [texts[i] for i in misses],
+                self.embed_batch,
+                lambda text: self.create_embedding(text, use_cache=False),
+                max_count=batch_size,
+                max_bytes=max_batch_bytes
+            )
+            for i, embedding in zip(misses, miss_embeddings):
+                embeddings[i] = embedding
+                if use_cache and embedding is not None:
+                    self._store_in_cache(texts[i], embedding)
+        
+        return embeddings
     
     def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity with numpy optimization if available."""
@@ -141,8 +549,14 @@ class CachedGeminiPropertyEmbedder:
             
             return dot_product / (norm1 * norm2)
     
-    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Optimized property search with caching."""
+    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5,
+                                  index: 'PropertyVectorIndex' = None,
+                                  rows: Optional['np.ndarray'] = None) -> List[Dict[str, Any]]:
+        """Optimized property search with caching.
+
+        Pass a prebuilt ``index`` so the embedding matrix is not rebuilt per query,
+        and ``rows`` to score only those rows of it (e.g. after attribute filtering).
+        """
         start_time = time.time()
         
         print(f"Searching for: '{query}'")
@@ -157,29 +571,15 @@ class CachedGeminiPropertyEmbedder:
         
         # Calculate similarities
         calc_start = time.time()
-        similarities = []
         
         if NUMPY_AVAILABLE:
-            # Vectorized similarity calculation for better performance
-            query_vec = np.array(query_embedding)
-            query_norm = np.linalg.norm(query_vec)
-            
-            for listing in embeddings_data['listings']:
-                if 'embedding' in listing:
-                    prop_vec = np.array(listing['embedding'])
-                    prop_norm = np.linalg.norm(prop_vec)
-                    
-                    if query_norm > 0 and prop_norm > 0:
-                        similarity = float(np.dot(query_vec, prop_vec) / (query_norm * prop_norm))
-                    else:
-                        similarity = 0.0
-                    
-                    similarities.append({
-                        'listing': listing,
-                        'similarity': similarity
-                    })
+            # One matrix-vector product against the preloaded, normalised matrix
+            if index is None:
+                index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+            results = index.search(query_embedding, top_k, rows=rows)
         else:
             # Standard calculation
+            similarities = []
             for listing in embeddings_data['listings']:
                 if 'embedding' in listing:
                     similarity = self.calculate_similarity(query_embedding, listing['embedding'])
@@ -187,21 +587,20 @@ class CachedGeminiPropertyEmbedder:
                         'listing': listing,
                         'similarity': similarity
                     })
+            
+            # Sort and return top k
+            similarities.sort(key=lambda x: x['similarity'], reverse=True)
+            
+            results = []
+            for item in similarities[:top_k]:
+                result = item['listing'].copy()
+                result['similarity_score'] = item['similarity']
+                # Remove embedding to save space
+                if 'embedding' in result:
+                    del result['embedding']
+                results.append(result)
         
         calc_time = time.time() - calc_start
-        
-        # Sort and return top k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        results = []
-        for item in similarities[:top_k]:
-            result = item['listing'].copy()
-            result['similarity_score'] = item['similarity']
-            # Remove embedding to save space
-            if 'embedding' in result:
-                del result['embedding']
-            results.append(result)
-        
         total_time = time.time() - start_time
         
         print(f"Search completed in {total_time:.3f}s (embedding: {embedding_time:.3f}s, calc: {calc_time:.3f}s)")
@@ -214,21 +613,22 @@ class CachedGeminiPropertyEmbedder:
         total = self.stats['total_queries']
         if total > 0:
             cache_rate = (self.stats['cache_hits'] / total) * 100
+            disk_rate = (self.stats['disk_hits'] / total) * 100
             precomputed_rate = (self.stats['precomputed_hits'] / total) * 100
             api_rate = (self.stats['api_calls'] / total) * 100
             
-            print(f"Performance: {cache_rate:.1f}% cache hits, {precomputed_rate:.1f}% precomputed, {api_rate:.1f}% API calls")
+            print(f"Performance: {cache_rate:.1f}% cache hits, {disk_rate:.1f}% disk cache hits, "
+                  f"{precomputed_rate:.1f}% precomputed, {api_rate:.1f}% API calls")
     
     def populate_common_queries(self, queries: List[str]):
         """Pre-populate cache with common queries."""
         print(f"Pre-populating cache with {len(queries)} common queries...")
         
-        for query in queries:
-            print(f"Caching: '{query}'")
-            embedding = self.create_embedding(query, use_cache=True)
+        # One batchEmbedContents request per 100 queries instead of one call each
+        embeddings = self.create_embeddings_batch(queries, use_cache=True)
+        for query, embedding in zip(queries, embeddings):
             if embedding:
                 self.common_queries[query.lower().strip()] = embedding
-                time.sleep(0.1)  # Rate limiting
         
         print(f"Cache populated with {len(self.common_queries)} queries")
     
@@ -284,10 +684,17 @@ def main():
     embedder.save_precomputed_queries("precomputed_queries.json")
     
     # Test search performance
-    if os.path.exists("property_embeddings_gemini.json"):
-        with open("property_embeddings_gemini.json", 'r') as f:
+    embeddings_data = None
+    index = None
+    if NUMPY_AVAILABLE and os.path.exists(EMBEDDING_STORE_PATH):
+        embeddings_data = load_embedding_store(EMBEDDING_STORE_PATH)
+        index = PropertyVectorIndex.from_embedding_store(embeddings_data)
+    elif os.path.exists(EMBEDDINGS_JSON_PATH):
+        with open(EMBEDDINGS_JSON_PATH, 'r') as f:
             embeddings_data = json.load(f)
-        
+        index = PropertyVectorIndex.from_embeddings_data(embeddings_data) if NUMPY_AVAILABLE else None
+    
+    if embeddings_data is not None:
         # Test queries
         test_queries = ["cozy cottage", "luxury estate", "new query not cached"]
         
@@ -295,7 +702,7 @@ def main():
             print(f"\n{'='*50}")
             print(f"Testing: '{query}'")
             start = time.time()
-            results = embedder.search_similar_properties(query, embeddings_data, top_k=3)
+            results = embedder.search_similar_properties(query, embeddings_data, top_k=3, index=index)
             total_time = time.time() - start
             print(f"Total search time: {total_time:.3f}s")
 
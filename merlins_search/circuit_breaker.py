@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Circuit Breaker
+Stops calling a failing dependency so requests take the fallback path at once.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class CircuitBreaker:
+    """Thread-safe closed / open / half-open circuit breaker.
+
+    Closed: calls pass; ``failure_threshold`` consecutive failures open the
+    breaker. A call slower than ``slow_call_threshold`` seconds counts as a
+    failure even if it succeeded. Open: calls are refused until
+    ``reset_timeout`` seconds have passed, then the breaker goes half-open.
+    Half-open: a single probe call is let through; its success closes the
+    breaker, its failure opens it again.
+
+    Callers ask ``allow()`` before a call and report its outcome with
+    ``record()``, or ``release()`` if it ended without a verdict.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 slow_call_threshold: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._check_reset()
+            return self._state
+
+    def _check_reset(self):
+        """Move from open to half-open once the reset timeout has passed. Caller holds the lock."""
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+        self.opened += 1
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; a half-open breaker admits one probe at a time."""
+        with self._lock:
+            self._check_reset()
+            if self._state == self.OPEN or (self._state == self.HALF_OPEN and self._probing):
+                self.rejected += 1
+                return False
+            if self._state == self.HALF_OPEN:
+                self._probing = True
+            return True
+
+    def record(self, success: bool, duration: float = 0.0):
+        """Report the outcome of an allowed call and how long it took."""
+        slow = self.slow_call_threshold is not None and duration > self.slow_call_threshold
+        with self._lock:
+            if success and not slow:
+                self.consecutive_failures = 0
+                if self._state == self.HALF_OPEN:
+                    self._state = self.CLOSED
+                    self._probing = False
+                return
+            self.failures += 1
+            self.slow_calls += slow
+            self.consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED
+                                                 and self.consecutive_failures >= self.failure_threshold):
+                self._open()
+
+    def release(self):
+        """Forget an allowed call that ended without an outcome (e.g. it was cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        """State and counters, e.g. for a health endpoint."""
+        with self._lock:
+            self._check_reset()
+            return {
+                'state': self._state,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'slow_calls': self.slow_calls,
+                'rejected': self.rejected,
+                'opened': self.opened,
+                'retry_in': (max(0.0, self._opened_at + self.reset_timeout - self.clock())
+                             if self._state == self.OPEN else 0.0),
+            }
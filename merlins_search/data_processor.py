@@ -4,14 +4,97 @@ Merlin's Shack Semantic Search - Data Processor
 Enhances MLS listing descriptions for better vector embeddings and vibe-based search.
 """
 
+import argparse
+import contextlib
+import io
+import os
 import pandas as pd
+import numpy as np
 import re
 import json
-from typing import Dict, List, Any
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Set, Tuple
+from keyword_matcher import KeywordMatcher
+from listing_io import iter_listings, load_listings, write_listings
+from listing_manifest import (
+    ACTIVE_STATUSES,
+    apply_delta,
+    load_manifest,
+    row_hashes,
+    save_manifest,
+    write_delta
+)
+
+def rank_vibes(vibes: List[str]) -> List[str]:
+    """Unique vibes, most frequent first, ties broken by first appearance.
+
+    Deterministic (unlike set ordering under hash randomisation), so the same
+    listing always gets the same description and embedding text.
+    """
+    counts = Counter(vibes)  # Keys in order of first appearance
+    # Stable sort: equally frequent vibes keep their mapping order
+    return sorted(counts, key=lambda vibe: -counts[vibe])
+
+
+# Enhancer held by each pool worker, set once by _init_worker
+_worker_enhancer = None
+
+
+def _init_worker(enhancer: 'PropertyVibeEnhancer'):
+    global _worker_enhancer
+    _worker_enhancer = enhancer
+
+
+def _enhance_shard(shard: pd.DataFrame, vectorized: bool) -> Tuple[pd.DataFrame, str]:
+    """Enhance one shard in a pool worker, returning its records and console output."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        enhanced = _worker_enhancer.enhance_dataframe(shard, vectorized=vectorized)
+    return enhanced, output.getvalue()
+
 
 class PropertyVibeEnhancer:
     """Enhances property descriptions to capture vibes and emotional context."""
     
+    # Free-text columns scanned for location and lifestyle keywords
+    KEYWORD_TEXT_COLUMNS = ['Public Remarks', 'Exterior Features', 'Parking Features', 'Patio And Porch Features']
+    
+    # The only MLS columns the enhancer reads, with explicit dtypes so every
+    # chunk of a streamed CSV parses the same way regardless of missing values
+    SOURCE_DTYPES = {
+        'Listing Number': 'str',
+        'Address - Street Complete': 'str',
+        'Address - City': 'str',
+        'Address - Zip Code': 'str',
+        'List Price': 'float64',
+        'Bedrooms And Possible Bedrooms': 'str',
+        'Full Bathrooms': 'str',
+        'Square Footage': 'str',
+        'Lot Size - Acres': 'float64',
+        'Architectural Style': 'str',
+        'Public Remarks': 'str',
+        'Exterior Features': 'str',
+        'Parking Features': 'str',
+        'Patio And Porch Features': 'str',
+        'Pool': 'str',
+        '# of Fireplaces': 'str',
+        'Status': 'str',
+        'DOM': 'str'
+    }
+    
+    # Numeric columns read as text and converted by coerce_numeric_columns(), so one
+    # malformed cell (e.g. a ZIP+4 zip code) is a missing value, not a failed chunk
+    NUMERIC_DTYPES = {
+        'Listing Number': 'Int64',
+        'Address - Zip Code': 'Int64',
+        'Full Bathrooms': 'float64',
+        'Square Footage': 'Int64',
+        '# of Fireplaces': 'Int64',
+        'DOM': 'Int64'
+    }
+    
     def __init__(self):
         # Define vibe mappings for different property characteristics
         self.vibe_mappings = {
@@ -55,68 +138,63 @@ class PropertyVibeEnhancer:
             'retreat': ['private', 'peaceful', 'escape', 'secluded', 'relaxation'],
             'compound': ['multiple buildings', 'family', 'expansive', 'estate', 'generational']
         }
-
-    def enhance_property_description(self, row: pd.Series) -> str:
-        """Create enhanced, vibe-rich description for a property listing."""
-        
-        # Base information
-        address = f"{row['Address - Street Complete']}, {row['Address - City']}"
-        price = f"${row['List Price']:,.0f}" if pd.notna(row['List Price']) else "Price Available Upon Request"
-        bedrooms = str(row['Bedrooms And Possible Bedrooms']).replace('(', 'up to ').replace(')', '') if pd.notna(row['Bedrooms And Possible Bedrooms']) else 'Multiple'
-        bathrooms = str(int(row['Full Bathrooms'])) if pd.notna(row['Full Bathrooms']) else 'Multiple'
-        sqft = f"{row['Square Footage']:,.0f}" if pd.notna(row['Square Footage']) else ''
-        lot_size = f"{row['Lot Size - Acres']:.2f}" if pd.notna(row['Lot Size - Acres']) and row['Lot Size - Acres'] > 0 else ''
         
-        # Extract architectural style vibes
-        arch_vibes = []
-        if pd.notna(row['Architectural Style']):
-            styles = str(row['Architectural Style']).split(',')
-            for style in styles:
-                style = style.strip()
-                if style in self.vibe_mappings['architectural_styles']:
-                    arch_vibes.extend(self.vibe_mappings['architectural_styles'][style])
-        
-        # Extract location and lifestyle vibes from various fields
+        # All location/lifestyle keywords, matched in a single scan per listing
+        self.vibe_matcher = KeywordMatcher(
+            keyword
+            for category, mappings in self.vibe_mappings.items() if category != 'architectural_styles'
+            for keyword in mappings
+        )
+
+    def get_keyword_vibes(self, matched_keywords: Set[str]) -> Tuple[List[str], List[str]]:
+        """Location and lifestyle vibes for matched keywords, in mapping order."""
         location_vibes = []
         lifestyle_vibes = []
-        
-        # Analyze all text fields for vibe keywords
-        text_fields = [
-            str(row['Public Remarks']) if pd.notna(row['Public Remarks']) else '',
-            str(row['Exterior Features']) if pd.notna(row['Exterior Features']) else '',
-            str(row['Parking Features']) if pd.notna(row['Parking Features']) else '',
-            str(row['Patio And Porch Features']) if pd.notna(row['Patio And Porch Features']) else ''
-        ]
-        
-        combined_text = ' '.join(text_fields).lower()
-        
-        # Extract vibes based on content
         for category, mappings in self.vibe_mappings.items():
             if category == 'architectural_styles':
-                continue  # Already handled above
+                continue  # Matched against the Architectural Style column instead
             
             for keyword, vibes in mappings.items():
-                if keyword.lower() in combined_text:
+                if keyword.lower() in matched_keywords:
                     if category == 'location_vibes':
                         location_vibes.extend(vibes)
                     else:
                         lifestyle_vibes.extend(vibes)
-        
-        # Special property features
-        special_features = []
-        if pd.notna(row['Pool']) and str(row['Pool']).lower() == 'yes':
+        return location_vibes, lifestyle_vibes
+
+    def get_style_vibes(self, architectural_style: Any) -> List[str]:
+        """Vibes for a comma-separated Architectural Style value, in style order."""
+        arch_vibes = []
+        styles = str(architectural_style).split(',')
+        for style in styles:
+            style = style.strip()
+            if style in self.vibe_mappings['architectural_styles']:
+                arch_vibes.extend(self.vibe_mappings['architectural_styles'][style])
+        return arch_vibes
+
+    def add_feature_vibes(self, special_features: List[str], location_vibes: List[str],
+                          lifestyle_vibes: List[str], has_pool: bool, fireplaces: float, big_lot: bool):
+        """Append pool, fireplace and acreage features and their vibes."""
+        if has_pool:
             special_features.append('pool and spa amenities')
             lifestyle_vibes.extend(['resort-style', 'luxury', 'entertainment'])
         
-        if pd.notna(row['# of Fireplaces']) and row['# of Fireplaces'] > 0:
-            special_features.append(f"{int(row['# of Fireplaces'])} fireplace{'s' if row['# of Fireplaces'] > 1 else ''}")
+        if fireplaces is not None:
+            special_features.append(f"{int(fireplaces)} fireplace{'s' if fireplaces > 1 else ''}")
             lifestyle_vibes.extend(['cozy', 'warm', 'gathering'])
         
-        if pd.notna(row['Lot Size - Acres']) and row['Lot Size - Acres'] >= 5:
+        if big_lot:
             special_features.append('expansive acreage for privacy')
             location_vibes.extend(['spacious', 'private', 'estate-like'])
-        
-        # Build enhanced description
+
+    def assemble_description(self, address: str, bedrooms: str, bathrooms: str, sqft: str, lot_size: str,
+                             arch_vibes: List[str], location_vibes: List[str],
+                             lifestyle_vibes: List[str], special_features: List[str], remarks: str) -> str:
+        """Build the enhanced description from preformatted parts.
+
+        Shared by the per-row and column-wise paths so both produce the same text.
+        ``remarks`` is the whitespace-normalised Public Remarks, or None.
+        """
         enhanced_parts = []
         
         # Opening with vibe
@@ -142,36 +220,165 @@ class PropertyVibeEnhancer:
         
         # Lifestyle description
         if lifestyle_vibes:
-            unique_vibes = list(set(lifestyle_vibes))[:3]  # Top 3 unique vibes
+            unique_vibes = rank_vibes(lifestyle_vibes)[:3]  # Top 3 unique vibes
             enhanced_parts.append(f"Perfect for those seeking a {', '.join(unique_vibes)} lifestyle.")
         
         # Original description (cleaned up)
-        if pd.notna(row['Public Remarks']):
-            original = str(row['Public Remarks'])
-            # Clean up the original description
-            original = re.sub(r'\s+', ' ', original)  # Multiple spaces
-            original = original.strip()
-            if len(original) > 50:  # Only include if substantial
-                enhanced_parts.append(original)
+        if remarks is not None and len(remarks) > 50:  # Only include if substantial
+            enhanced_parts.append(remarks)
         
         # Add vibe tags for better matching
-        all_vibes = list(set(arch_vibes + location_vibes + lifestyle_vibes))
+        all_vibes = rank_vibes(arch_vibes + location_vibes + lifestyle_vibes)
         if all_vibes:
             vibe_tags = ', '.join(all_vibes[:5])  # Top 5 vibes
             enhanced_parts.append(f"Vibes: {vibe_tags}.")
         
         return ' '.join(enhanced_parts)
 
-    def process_listings_csv(self, csv_path: str, output_path: str = None) -> pd.DataFrame:
-        """Process the MLS CSV and create enhanced descriptions."""
+    def enhance_property_description(self, row: pd.Series) -> str:
+        """Create enhanced, vibe-rich description for a property listing."""
         
-        print(f"Loading MLS data from {csv_path}...")
-        # Handle potential parsing issues with quotes in descriptions
-        df = pd.read_csv(csv_path, quotechar='"', escapechar='\\', on_bad_lines='skip')
+        # Base information
+        address = f"{row['Address - Street Complete']}, {row['Address - City']}"
+        price = f"${row['List Price']:,.0f}" if pd.notna(row['List Price']) else "Price Available Upon Request"
+        bedrooms = str(row['Bedrooms And Possible Bedrooms']).replace('(', 'up to ').replace(')', '') if pd.notna(row['Bedrooms And Possible Bedrooms']) else 'Multiple'
+        bathrooms = str(int(row['Full Bathrooms'])) if pd.notna(row['Full Bathrooms']) else 'Multiple'
+        sqft = f"{row['Square Footage']:,.0f}" if pd.notna(row['Square Footage']) else ''
+        lot_size = f"{row['Lot Size - Acres']:.2f}" if pd.notna(row['Lot Size - Acres']) and row['Lot Size - Acres'] > 0 else ''
         
-        print(f"Processing {len(df)} property listings...")
+        # Extract architectural style vibes
+        arch_vibes = []
+        if pd.notna(row['Architectural Style']):
+            arch_vibes = self.get_style_vibes(row['Architectural Style'])
         
-        # Create enhanced descriptions
+        # Analyze all text fields for vibe keywords
+        text_fields = [
+            str(row[column]) if pd.notna(row[column]) else ''
+            for column in self.KEYWORD_TEXT_COLUMNS
+        ]
+        
+        combined_text = ' '.join(text_fields).lower()
+        
+        # Extract location and lifestyle vibes based on content
+        location_vibes, lifestyle_vibes = self.get_keyword_vibes(self.vibe_matcher.find(combined_text))
+        
+        # Special property features
+        special_features = []
+        has_pool = pd.notna(row['Pool']) and str(row['Pool']).lower() == 'yes'
+        has_fireplace = pd.notna(row['# of Fireplaces']) and row['# of Fireplaces'] > 0
+        big_lot = pd.notna(row['Lot Size - Acres']) and row['Lot Size - Acres'] >= 5
+        self.add_feature_vibes(special_features, location_vibes, lifestyle_vibes, has_pool,
+                               row['# of Fireplaces'] if has_fireplace else None, big_lot)
+        
+        remarks = None
+        if pd.notna(row['Public Remarks']):
+            # Clean up the original description
+            remarks = re.sub(r'\s+', ' ', str(row['Public Remarks'])).strip()
+        
+        return self.assemble_description(address, bedrooms, bathrooms, sqft, lot_size, arch_vibes,
+                                         location_vibes, lifestyle_vibes, special_features, remarks)
+
+    def enhance_dataframe_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Column-wise equivalent of calling enhance_property_description on every row.
+
+        Formatting, keyword matching and feature flags are computed over whole
+        columns; a single pass then assembles each description. Returns the same
+        records as the per-row path.
+        """
+        
+        def formatted(column: str, fmt: str, default: str) -> np.ndarray:
+            values = df[column]
+            return np.where(values.notna(), values.map(fmt.format, na_action='ignore'), default)
+        
+        def text(column: str) -> pd.Series:
+            values = df[column]
+            return values.map(str).where(values.notna(), '')
+        
+        street = df['Address - Street Complete'].map(str)
+        city = df['Address - City'].map(str)
+        addresses = (street + ', ' + city).tolist()
+        
+        # Not part of the text, but formatted so bad prices fail just like the per-row path
+        formatted('List Price', '${:,.0f}', "Price Available Upon Request")
+        bedrooms = np.where(
+            df['Bedrooms And Possible Bedrooms'].notna(),
+            df['Bedrooms And Possible Bedrooms'].map(str).str.replace('(', 'up to ', regex=False)
+                                                       .str.replace(')', '', regex=False),
+            'Multiple'
+        )
+        bathrooms = np.where(
+            df['Full Bathrooms'].notna(),
+            df['Full Bathrooms'].map(lambda value: str(int(value)), na_action='ignore'),
+            'Multiple'
+        )
+        sqfts = formatted('Square Footage', '{:,.0f}', '')
+        lots = df['Lot Size - Acres']
+        lot_sizes = np.where(lots.notna() & (lots > 0), lots.map('{:.2f}'.format, na_action='ignore'), '')
+        
+        # Dictionary-encode styles: each distinct value is split and looked up once
+        styles = df['Architectural Style']
+        style_vibes = {style: self.get_style_vibes(style) for style in styles.dropna().unique()}
+        arch_vibe_lists = [style_vibes[style] if present else []
+                           for style, present in zip(styles, styles.notna())]
+        
+        # One keyword-matcher scan per listing over the combined text
+        combined_text = text(self.KEYWORD_TEXT_COLUMNS[0])
+        for column in self.KEYWORD_TEXT_COLUMNS[1:]:
+            combined_text = combined_text + ' ' + text(column)
+        matched_keywords = combined_text.str.lower().map(self.vibe_matcher.find).tolist()
+        
+        pools = df['Pool']
+        has_pool = (pools.notna() & (pools.map(str).str.lower() == 'yes')).to_numpy(dtype=bool)
+        fireplaces = df['# of Fireplaces']
+        has_fireplace = (fireplaces.notna() & (fireplaces > 0)).to_numpy(dtype=bool)
+        big_lot = (lots.notna() & (lots >= 5)).to_numpy(dtype=bool)
+        
+        remarks = df['Public Remarks']
+        cleaned_remarks = remarks.map(str).str.replace(r'\s+', ' ', regex=True).str.strip()
+        cleaned_remarks = [cleaned if present else None
+                           for cleaned, present in zip(cleaned_remarks.tolist(), remarks.notna())]
+        fireplace_values = fireplaces.tolist()
+        
+        descriptions = []
+        for i in range(len(df)):
+            location_vibes, lifestyle_vibes = self.get_keyword_vibes(matched_keywords[i])
+            
+            special_features = []
+            self.add_feature_vibes(special_features, location_vibes, lifestyle_vibes, has_pool[i],
+                                   fireplace_values[i] if has_fireplace[i] else None, big_lot[i])
+            
+            descriptions.append(self.assemble_description(
+                addresses[i], bedrooms[i], bathrooms[i], sqfts[i], lot_sizes[i],
+                arch_vibe_lists[i], location_vibes, lifestyle_vibes, special_features, cleaned_remarks[i]
+            ))
+        
+        # Build columns from Python values, as the per-row path does, so dtype
+        # inference (e.g. object columns holding floats and 0) comes out the same
+        def values(column: str) -> List[Any]:
+            return df[column].tolist()
+        
+        def or_zero(column: str) -> List[Any]:
+            return df[column].where(df[column].notna(), 0).tolist()
+        
+        return pd.DataFrame({
+            'listing_id': values('Listing Number'),
+            'address': addresses,
+            'city': values('Address - City'),
+            'zip_code': values('Address - Zip Code'),
+            'price': or_zero('List Price'),
+            'bedrooms': values('Bedrooms And Possible Bedrooms'),
+            'bathrooms': or_zero('Full Bathrooms'),
+            'sqft': or_zero('Square Footage'),
+            'lot_acres': or_zero('Lot Size - Acres'),
+            'architectural_style': values('Architectural Style'),
+            'original_description': values('Public Remarks'),
+            'enhanced_description': descriptions,
+            'status': values('Status'),
+            'days_on_market': or_zero('DOM')
+        })
+
+    def enhance_dataframe_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Enhance listings one row at a time (the original ingestion path)."""
         enhanced_data = []
         
         for idx, row in df.iterrows():
@@ -204,7 +411,109 @@ class PropertyVibeEnhancer:
                 print(f"Error processing row {idx}: {e}")
                 continue
         
-        enhanced_df = pd.DataFrame(enhanced_data)
+        return pd.DataFrame(enhanced_data)
+
+    def enhance_dataframe(self, df: pd.DataFrame, vectorized: bool = True) -> pd.DataFrame:
+        """Enhance all listings, column-wise by default.
+
+        If the column-wise path cannot handle the data (e.g. unexpected dtypes),
+        the per-row path is used so malformed rows are reported and skipped as before.
+        """
+        if vectorized:
+            try:
+                return self.enhance_dataframe_columns(df)
+            except Exception as e:
+                print(f"Column-wise enhancement failed ({e}); falling back to per-row processing")
+        return self.enhance_dataframe_rows(df)
+
+    def coerce_numeric_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert the NUMERIC_DTYPES columns present in ``df``; unparseable cells become missing.
+
+        A zip code keeps its leading digits, so ZIP+4 "95945-1234" reads as 95945.
+        """
+        df = df.copy()
+        for column, dtype in self.NUMERIC_DTYPES.items():
+            if column not in df:
+                continue
+            values = df[column]
+            if column == 'Address - Zip Code':
+                values = values.astype('str').str.extract(r'^\s*(\d+)', expand=False)
+            numbers = pd.to_numeric(values, errors='coerce')
+            df[column] = (numbers.round() if dtype == 'Int64' else numbers).astype(dtype)
+        return df
+
+    def enhance_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Enhance one MLS record ({CSV column: value}), e.g. one sent to the listing update API.
+
+        The record is typed with SOURCE_DTYPES and NUMERIC_DTYPES like a CSV
+        chunk, so it comes out exactly as a batch run would write it. Raises
+        ValueError for a value that does not fit its column.
+        """
+        df = pd.DataFrame([{column: record.get(column) for column in self.SOURCE_DTYPES}])
+        enhanced = self.enhance_dataframe(self.coerce_numeric_columns(df.astype(self.SOURCE_DTYPES)))
+        if not len(enhanced):
+            raise ValueError("Listing could not be enhanced")
+        return json.loads(enhanced.to_json(orient='records'))[0]
+
+    def create_worker_pool(self, workers: int) -> ProcessPoolExecutor:
+        """Process pool whose workers each receive a copy of this enhancer once."""
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,))
+
+    def enhance_dataframe_parallel(self, df: pd.DataFrame, pool: ProcessPoolExecutor, workers: int,
+                                   vectorized: bool = True) -> pd.DataFrame:
+        """Enhance listings in shards across ``pool``, keeping input order.
+
+        Shards keep their original row labels, and each shard's console output
+        (progress and "Error processing row" messages) is replayed in shard
+        order, so the log reads as if one process had done the work.
+        """
+        # A few shards per worker so a slow shard does not idle the rest
+        shard_count = max(1, min(len(df), workers * 4))
+        bounds = np.linspace(0, len(df), shard_count + 1).astype(int)
+        shards = [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        
+        results = []
+        for enhanced, output in pool.map(_enhance_shard, shards, [vectorized] * len(shards)):
+            print(output, end='')
+            if len(enhanced):
+                results.append(enhanced)
+        
+        if not results:
+            return pd.DataFrame()
+        return pd.concat(results, ignore_index=True)
+
+    def enhance_chunk(self, df: pd.DataFrame, pool: ProcessPoolExecutor = None, workers: int = 1,
+                      vectorized: bool = True) -> pd.DataFrame:
+        """Enhance a chunk in this process, or across ``pool`` when one is given."""
+        if pool:
+            return self.enhance_dataframe_parallel(df, pool, workers, vectorized=vectorized)
+        return self.enhance_dataframe(df, vectorized=vectorized)
+
+    def read_csv_chunks(self, csv_path: str, chunksize: int):
+        """Iterate over the MLS CSV in chunks of the SOURCE_DTYPES columns, numeric columns coerced."""
+        reader = pd.read_csv(csv_path, quotechar='"', escapechar='\\', on_bad_lines='skip',
+                             usecols=list(self.SOURCE_DTYPES), dtype=self.SOURCE_DTYPES, chunksize=chunksize)
+        return (self.coerce_numeric_columns(chunk) for chunk in reader)
+
+    def process_listings_csv(self, csv_path: str, output_path: str = None, vectorized: bool = True,
+                             workers: int = 1) -> pd.DataFrame:
+        """Process the MLS CSV and create enhanced descriptions.
+
+        ``workers`` > 1 shards the enhancement across that many processes.
+        """
+        
+        print(f"Loading MLS data from {csv_path}...")
+        # Handle potential parsing issues with quotes in descriptions
+        df = self.coerce_numeric_columns(pd.read_csv(csv_path, quotechar='"', escapechar='\\', on_bad_lines='skip'))
+        
+        print(f"Processing {len(df)} property listings...")
+        
+        # Create enhanced descriptions
+        if workers > 1:
+            with self.create_worker_pool(workers) as pool:
+                enhanced_df = self.enhance_dataframe_parallel(df, pool, workers, vectorized=vectorized)
+        else:
+            enhanced_df = self.enhance_dataframe(df, vectorized=vectorized)
         
         if output_path:
             enhanced_df.to_json(output_path, orient='records', indent=2)
@@ -213,21 +522,152 @@ class PropertyVibeEnhancer:
         print(f"Successfully processed {len(enhanced_df)} properties")
         return enhanced_df
 
+    def process_listings_csv_streaming(self, csv_path: str, output_path: str, chunksize: int = 10000,
+                                       vectorized: bool = True, workers: int = 1) -> int:
+        """Enhance the MLS CSV chunk by chunk, appending NDJSON records to ``output_path``.
+
+        Only SOURCE_DTYPES columns are parsed, and each chunk is written as soon
+        as it is enhanced, so memory stays bounded by ``chunksize`` and readers
+        (see listing_io.iter_listings) can start on the file before it is done.
+        Returns the number of listings written. ``workers`` > 1 enhances each
+        chunk across a process pool that is created once for the whole run.
+        """
+        
+        print(f"Streaming MLS data from {csv_path} in chunks of {chunksize}...")
+        reader = self.read_csv_chunks(csv_path, chunksize)
+        
+        total_written = 0
+        pool = self.create_worker_pool(workers) if workers > 1 else None
+        with open(output_path, 'w') as f, pool or contextlib.nullcontext():
+            for chunk_number, chunk in enumerate(reader, 1):
+                enhanced_chunk = self.enhance_chunk(chunk, pool, workers, vectorized=vectorized)
+                if len(enhanced_chunk):
+                    records = enhanced_chunk.to_json(orient='records', lines=True)
+                    f.write(records if records.endswith('\n') else records + '\n')
+                    f.flush()
+                total_written += len(enhanced_chunk)
+                print(f"Chunk {chunk_number}: {total_written} properties written to {output_path}")
+        
+        print(f"Successfully processed {total_written} properties")
+        return total_written
+
+    def process_listings_incremental(self, csv_path: str, output_path: str, manifest_path: str,
+                                     delta_path: str, chunksize: int = 10000, vectorized: bool = True,
+                                     workers: int = 1) -> Dict[str, int]:
+        """Re-enhance only listings whose source columns changed since the last run.
+
+        The manifest maps each Listing Number to a hash of its SOURCE_DTYPES
+        columns and ``updated_at``, the start of the run that last changed
+        it. New or changed active listings are enhanced and written to
+        ``delta_path`` as upserts; listings that vanished from the CSV or whose
+        Status left ACTIVE_STATUSES become deletes, and vanished ones stay in
+        the manifest as inactive. The delta is then applied to
+        ``output_path``, and the manifest is saved last so an interrupted run
+        simply recomputes the same delta.
+        """
+        
+        started_at = time.time()
+        previous = load_manifest(manifest_path)
+        if previous and not os.path.exists(output_path):
+            print(f"{output_path} not found; re-enhancing every listing")
+            previous = {}
+        print(f"Comparing {csv_path} against {len(previous)} listings in {manifest_path}...")
+        
+        manifest = {}
+        upserts = []
+        deletes = []
+        columns = list(self.SOURCE_DTYPES)
+        pool = self.create_worker_pool(workers) if workers > 1 else None
+        with pool or contextlib.nullcontext():
+            for chunk in self.read_csv_chunks(csv_path, chunksize):
+                chunk = chunk[chunk['Listing Number'].notna()]
+                keys = [str(number) for number in chunk['Listing Number'].tolist()]
+                active = chunk['Status'].isin(ACTIVE_STATUSES).to_numpy(dtype=bool)
+                
+                changed = np.zeros(len(chunk), dtype=bool)
+                for i, (key, row_hash, is_active) in enumerate(zip(keys, row_hashes(chunk, columns), active)):
+                    old = previous.get(key)
+                    unchanged = old is not None and old['hash'] == row_hash and old['active'] == bool(is_active)
+                    manifest[key] = {'hash': row_hash, 'active': bool(is_active),
+                                     'updated_at': old.get('updated_at', 0.0) if unchanged else started_at}
+                    if is_active:
+                        changed[i] = old is None or old['hash'] != row_hash or not old['active']
+                    elif old is not None and old['active']:
+                        deletes.append(int(key))
+                
+                if not changed.any():
+                    continue
+                enhanced = self.enhance_chunk(chunk[changed], pool, workers, vectorized=vectorized)
+                records = json.loads(enhanced.to_json(orient='records')) if len(enhanced) else []
+                upserts.extend(records)
+                
+                # Rows that failed to enhance keep their old manifest entry and are retried next run
+                enhanced_keys = {str(record['listing_id']) for record in records}
+                for key, was_changed in zip(keys, changed):
+                    if was_changed and key not in enhanced_keys:
+                        if key in previous:
+                            manifest[key] = previous[key]
+                        else:
+                            del manifest[key]
+        
+        # Listings missing from this drop; the API needs to know when they were removed
+        for key, entry in previous.items():
+            if key not in manifest:
+                if entry['active']:
+                    deletes.append(int(key))
+                    entry = {**entry, 'active': False, 'updated_at': started_at}
+                manifest[key] = entry
+        
+        write_delta(delta_path, upserts, deletes)
+        listings = load_listings(output_path) if previous else []
+        write_listings(output_path, apply_delta(listings, upserts, deletes))
+        save_manifest(manifest_path, manifest)
+        
+        summary = {
+            'upserts': len(upserts),
+            'deletes': len(deletes),
+            'unchanged': sum(1 for entry in manifest.values() if entry['active']) - len(upserts)
+        }
+        print(f"Incremental run: {summary['upserts']} upserts, {summary['deletes']} deletes, "
+              f"{summary['unchanged']} unchanged; delta written to {delta_path}")
+        return summary
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enhance MLS listings for vibe-based search")
+    parser.add_argument('--csv', default="../Listing.csv", help="MLS export to process")
+    parser.add_argument('--output', default="enhanced_listings.json",
+                        help="Output file; a .ndjson path streams the CSV in chunks")
+    parser.add_argument('--chunksize', type=int, default=10000, help="Rows per chunk when streaming")
+    parser.add_argument('--workers', type=int, default=1, help="Processes to enhance listings with")
+    parser.add_argument('--manifest', help="Manifest of source hashes; enables incremental runs "
+                                           "that only re-enhance new or changed listings")
+    parser.add_argument('--delta', default="enhanced_listings.delta.ndjson",
+                        help="Where incremental runs write their upserts and deletes")
+    args = parser.parse_args()
+    
     enhancer = PropertyVibeEnhancer()
     
     # Process the MLS data
-    csv_path = "../Listing.csv"
-    output_path = "enhanced_listings.json"
+    csv_path = args.csv
+    output_path = args.output
     
-    enhanced_df = enhancer.process_listings_csv(csv_path, output_path)
+    if args.manifest:
+        enhancer.process_listings_incremental(csv_path, output_path, args.manifest, args.delta,
+                                              chunksize=args.chunksize, workers=args.workers)
+        sample = next(iter_listings(output_path), None)
+    elif output_path.endswith('.ndjson'):
+        enhancer.process_listings_csv_streaming(csv_path, output_path, chunksize=args.chunksize,
+                                                workers=args.workers)
+        sample = next(iter_listings(output_path), None)
+    else:
+        enhanced_df = enhancer.process_listings_csv(csv_path, output_path, workers=args.workers)
+        sample = enhanced_df.iloc[0] if len(enhanced_df) > 0 else None
     
     # Show a sample enhanced description
-    if len(enhanced_df) > 0:
+    if sample is not None:
         print("\n" + "="*80)
         print("SAMPLE ENHANCED DESCRIPTION:")
         print("="*80)
-        sample = enhanced_df.iloc[0]
         print(f"Address: {sample['address']}")
         print(f"Price: ${sample['price']:,.0f}")
         print(f"Enhanced Description:")
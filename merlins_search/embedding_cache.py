@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Embedding Cache
+Persistent, content-addressed cache so re-runs only embed changed listings.
+"""
+
+import hashlib
+import sqlite3
+import time
+from typing import List, Optional, Callable
+import numpy as np
+
+
+class EmbeddingCache:
+    """SQLite cache of float32 vectors keyed by hash(model, dimension, text).
+
+    Any change to the embedding text, model or dimension produces a new key,
+    so stale vectors are never returned; unchanged listings hit the cache.
+    """
+
+    def __init__(self, path: str, model: str, dimension: int):
+        self.path = path
+        self.model = model
+        self.dimension = dimension
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def key(self, text: str) -> str:
+        """Content address for an embedding text under this model and dimension."""
+        material = f"{self.model}\x1f{self.dimension}\x1f{text}".encode('utf-8')
+        return hashlib.sha256(material).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up texts; returns a vector or None per text, in order."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: List[Optional[List[float]]]):
+        """Store embeddings for texts, skipping failed (None) entries."""
+        now = time.time()
+        rows = [
+            (self.key(text), self.model, self.dimension,
+             np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+            if embedding is not None and len(embedding) == self.dimension
+        ]
+        self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def get_stat(self, name: str, default: float = None) -> Optional[float]:
+        row = self.conn.execute("SELECT value FROM stats WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_stat(self, name: str, value: float):
+        self.conn.execute("INSERT OR REPLACE INTO stats VALUES (?, ?)", (name, value))
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def embed_with_cache(texts: List[str], embed_fn: Callable[[List[str]], List[Optional[List[float]]]],
+                     cache: EmbeddingCache) -> List[Optional[List[float]]]:
+    """Embed only cache misses with ``embed_fn`` and assemble the rest from disk.
+
+    Prints hit/miss counts and an estimate of the API time saved, based on the
+    average seconds per embedding measured on previous runs.
+    """
+    embeddings = cache.get_many(texts)
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    hits = len(texts) - len(misses)
+    print(f"Embedding cache: {hits} hits, {len(misses)} misses ({cache.path})")
+
+    if misses:
+        start_time = time.time()
+        miss_texts = [texts[i] for i in misses]
+        miss_embeddings = embed_fn(miss_texts)
+        elapsed = time.time() - start_time
+
+        for i, embedding in zip(misses, miss_embeddings):
+            embeddings[i] = embedding
+        cache.put_many(miss_texts, miss_embeddings)
+        cache.set_stat('seconds_per_embedding', elapsed / len(misses))
+
+    seconds_per_embedding = cache.get_stat('seconds_per_embedding')
+    if hits and seconds_per_embedding:
+        print(f"Estimated time saved by cache: {hits * seconds_per_embedding:.1f}s")
+
+    return embeddings
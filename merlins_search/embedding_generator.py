@@ -4,6 +4,8 @@ Merlin's Shack Semantic Search - Embedding Generator
 Creates vector embeddings for property listings using OpenAI's API.
 """
 
+import argparse
+import functools
 import json
 import os
 import time
@@ -11,6 +13,13 @@ from typing import List, Dict, Any
 import openai
 import numpy as np
 from openai import OpenAI
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embedding_journal import EmbeddingJournal, embed_with_journal, journal_path_for
+from embedding_store import apply_delta_to_store, save_embedding_store
+from embedding_text import build_embedding_text, content_hash, get_price_range
+from listing_io import default_listings_path, load_listings
+from listing_manifest import read_delta
+from vector_index import PropertyVectorIndex
 
 class PropertyEmbeddingGenerator:
     """Generates and manages vector embeddings for property listings."""
@@ -27,6 +36,7 @@ class PropertyEmbeddingGenerator:
             self.client = OpenAI(api_key=api_key)
         
         self.embedding_model = "text-embedding-ada-002"
+        self.embedding_dimension = 1536
         self.embeddings_cache = {}
     
     def create_embedding(self, text: str) -> List[float]:
@@ -68,39 +78,42 @@ class PropertyEmbeddingGenerator:
                 
         return embeddings
     
-    def process_enhanced_listings(self, json_path: str, output_path: str = None) -> Dict[str, Any]:
-        """Process enhanced listings and create embeddings."""
+    def process_enhanced_listings(self, json_path: str, output_path: str = None,
+                                  cache_path: str = None, resume: bool = False) -> Dict[str, Any]:
+        """Process enhanced listings and create embeddings.
+
+        ``json_path`` may be a JSON array or an NDJSON file from streaming ingestion.
+        An ``output_path`` ending in .npy is written as a binary embedding store
+        (see embedding_store.py); any other path gets the legacy JSON format.
+        With ``cache_path``, only texts missing from the embedding cache are sent
+        to the API. When writing to ``output_path``, finished embeddings are
+        journaled as the job runs; ``resume`` skips listings already journaled.
+        """
         
         print(f"Loading enhanced listings from {json_path}...")
-        with open(json_path, 'r') as f:
-            listings = json.load(f)
+        listings = load_listings(json_path)
         
         print(f"Creating embeddings for {len(listings)} properties...")
         
         # Prepare texts for embedding
-        texts = []
-        for listing in listings:
-            # Combine enhanced description with key features for embedding
-            embedding_text = listing['enhanced_description']
-            
-            # Add key searchable features
-            if listing.get('architectural_style'):
-                embedding_text += f" Architectural style: {listing['architectural_style']}"
-            
-            if listing.get('price') and listing['price'] > 0:
-                price_range = self.get_price_range(listing['price'])
-                embedding_text += f" Price range: {price_range}"
-            
-            if listing.get('lot_acres') and listing['lot_acres'] > 0:
-                if listing['lot_acres'] >= 5:
-                    embedding_text += " Large acreage estate property"
-                elif listing['lot_acres'] >= 1:
-                    embedding_text += " Spacious lot with acreage"
-            
-            texts.append(embedding_text)
+        texts = [build_embedding_text(listing) for listing in listings]
         
         # Create embeddings
-        embeddings = self.create_embeddings_batch(texts)
+        embed_texts = self.create_embeddings_batch
+        cache = None
+        if cache_path:
+            cache = EmbeddingCache(cache_path, self.embedding_model, self.embedding_dimension)
+            embed_texts = functools.partial(embed_with_cache, embed_fn=embed_texts, cache=cache)
+        
+        journal = EmbeddingJournal(journal_path_for(output_path)) if output_path else None
+        if journal:
+            listing_ids = [listing.get('listing_id') for listing in listings]
+            embeddings = embed_with_journal(listing_ids, texts, embed_texts, journal, resume=resume)
+        else:
+            embeddings = embed_texts(texts)
+        
+        if cache:
+            cache.close()
         
         # Combine listings with embeddings
         processed_data = {
@@ -114,10 +127,12 @@ class PropertyEmbeddingGenerator:
         }
         
         successful_embeddings = 0
-        for listing, embedding in zip(listings, embeddings):
+        content_hashes = []
+        for listing, text, embedding in zip(listings, texts, embeddings):
             if embedding is not None:
                 listing['embedding'] = embedding
                 processed_data['listings'].append(listing)
+                content_hashes.append(content_hash(text))
                 successful_embeddings += 1
             else:
                 print(f"Skipping listing {listing.get('listing_id', 'unknown')} due to embedding failure")
@@ -126,26 +141,30 @@ class PropertyEmbeddingGenerator:
         
         if output_path:
             print(f"Saving embeddings to {output_path}...")
-            with open(output_path, 'w') as f:
-                json.dump(processed_data, f, indent=2)
+            if output_path.endswith('.npy'):
+                save_embedding_store(
+                    output_path,
+                    processed_data['listings'],
+                    [listing['embedding'] for listing in processed_data['listings']],
+                    processed_data['metadata'],
+                    content_hashes
+                )
+            else:
+                with open(output_path, 'w') as f:
+                    json.dump(processed_data, f)
             print(f"Embeddings saved to {output_path}")
+            
+            # The saved artifact now holds everything the journal did
+            if len(processed_data['listings']) == len(listings):
+                journal.reset()
+            else:
+                print(f"Journal kept at {journal.path}; rerun with --resume to retry failed listings")
         
         return processed_data
     
     def get_price_range(self, price: float) -> str:
         """Convert price to descriptive range."""
-        if price < 300000:
-            return "affordable starter home"
-        elif price < 500000:
-            return "mid-range family home"
-        elif price < 800000:
-            return "upscale residential"
-        elif price < 1200000:
-            return "luxury home"
-        elif price < 2000000:
-            return "luxury estate"
-        else:
-            return "ultra-luxury estate"
+        return get_price_range(price)
     
     def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings."""
@@ -165,8 +184,13 @@ class PropertyEmbeddingGenerator:
         
         return dot_product / (norm1 * norm2)
     
-    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for properties similar to a query."""
+    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5,
+                                  index: PropertyVectorIndex = None, rows=None) -> List[Dict[str, Any]]:
+        """Search for properties similar to a query.
+
+        Pass a prebuilt ``index`` to avoid rebuilding the embedding matrix on every call,
+        and ``rows`` to search only those index rows (e.g. the ones passing a filter).
+        """
         
         print(f"Searching for: '{query}'")
         
@@ -176,33 +200,25 @@ class PropertyEmbeddingGenerator:
             print("Failed to create query embedding")
             return []
         
-        # Calculate similarities
-        similarities = []
-        for listing in embeddings_data['listings']:
-            if 'embedding' in listing:
-                similarity = self.calculate_similarity(query_embedding, listing['embedding'])
-                similarities.append({
-                    'listing': listing,
-                    'similarity': similarity
-                })
-        
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        results = []
-        for item in similarities[:top_k]:
-            result = item['listing'].copy()
-            result['similarity_score'] = item['similarity']
-            # Remove embedding from result to save space
-            if 'embedding' in result:
-                del result['embedding']
-            results.append(result)
-        
-        return results
+        if index is None:
+            index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+        
+        # Single matrix-vector product plus top-k selection
+        return index.search(query_embedding, top_k, rows)
 
 def main():
     """Main function to demonstrate embedding generation."""
     
+    parser = argparse.ArgumentParser(description="Create OpenAI embeddings for enhanced listings")
+    parser.add_argument('--cache-path', default="embedding_cache.sqlite3",
+                        help="Embedding cache file; only changed listings are re-embedded")
+    parser.add_argument('--no-cache', action='store_true', help="Re-embed every listing")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run, skipping listings already journaled")
+    parser.add_argument('--delta', help="Apply a data_processor.py delta file to the existing store "
+                                        "instead of re-embedding every listing")
+    args = parser.parse_args()
+    
     # Get OpenAI API key from user input if not in environment
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key:
@@ -214,16 +230,28 @@ def main():
     generator = PropertyEmbeddingGenerator()
     
     # Process enhanced listings
-    enhanced_path = "enhanced_listings.json"
-    embeddings_path = "property_embeddings.json"
+    enhanced_path = default_listings_path() or "enhanced_listings.json"
+    embeddings_path = "property_embeddings.npy"
     
     if not os.path.exists(enhanced_path):
         print(f"Enhanced listings file not found: {enhanced_path}")
         print("Please run data_processor.py first to create enhanced listings.")
         return
     
+    if args.delta:
+        if not os.path.exists(embeddings_path):
+            print(f"Embedding store not found: {embeddings_path}; run without --delta first")
+            return
+        upserts, deletes = read_delta(args.delta)
+        apply_delta_to_store(embeddings_path, upserts, deletes, generator.create_embeddings_batch)
+        return
+    
     # Generate embeddings
-    embeddings_data = generator.process_enhanced_listings(enhanced_path, embeddings_path)
+    embeddings_data = generator.process_enhanced_listings(
+        enhanced_path, embeddings_path, cache_path=None if args.no_cache else args.cache_path,
+        resume=args.resume
+    )
+    index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
     
     # Test some searches
     test_queries = [
@@ -242,7 +270,7 @@ def main():
         print(f"\nQuery: '{query}'")
         print("-" * 40)
         
-        results = generator.search_similar_properties(query, embeddings_data, top_k=3)
+        results = generator.search_similar_properties(query, embeddings_data, top_k=3, index=index)
         
         for i, result in enumerate(results, 1):
             print(f"{i}. {result['address']} - ${result['price']:,.0f}")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Embedding Journal
+Append-only checkpoint of finished embeddings so a crashed job can resume.
+"""
+
+import json
+import os
+from typing import List, Dict, Optional, Callable, Tuple
+from embedding_text import content_hash
+
+# Texts embedded between journal checkpoints
+JOURNAL_CHUNK_SIZE = 500
+
+
+def journal_path_for(store_path: str) -> str:
+    """Return the journal path for an output, e.g. foo.npy -> foo.journal.ndjson."""
+    base, _ = os.path.splitext(store_path)
+    return f"{base}.journal.ndjson"
+
+
+class EmbeddingJournal:
+    """NDJSON file of {"listing_id", "content_hash", "embedding"} records.
+
+    Records are only ever appended and fsync'd after each chunk, so a crash
+    loses at most the chunk in flight. A torn final line from a crash is
+    cut off on load, so records appended by the resumed run start on a
+    line of their own; a later record for the same listing wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[Tuple[str, str], List[float]]:
+        """Read journaled embeddings keyed by (listing_id, content_hash), truncating a torn final line."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                print(f"Discarding {len(data) - complete} bytes of a torn journal record in {self.path}")
+                f.truncate(complete)
+                f.flush()
+                os.fsync(f.fileno())
+
+        for line in data[:complete].decode('utf-8').splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Ignoring corrupt journal record in {self.path}")
+                continue
+            records[(record['listing_id'], record['content_hash'])] = record['embedding']
+        return records
+
+    def append(self, records: List[Dict]):
+        """Durably append finished records."""
+        with open(self.path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def embed_with_journal(listing_ids: List[str], texts: List[str],
+                       embed_fn: Callable[[List[str]], List[Optional[List[float]]]],
+                       journal: EmbeddingJournal, resume: bool = False,
+                       chunk_size: int = JOURNAL_CHUNK_SIZE) -> List[Optional[List[float]]]:
+    """Embed texts chunk by chunk, journaling each finished chunk.
+
+    With ``resume``, listings already journaled with the same text are not
+    embedded again; without it any old journal is discarded first. Failed
+    (None) embeddings are not journaled, so a resumed run retries them.
+    """
+    hashes = [content_hash(text) for text in texts]
+
+    if resume:
+        journaled = journal.load()
+        print(f"Resuming: {len(journaled)} embeddings already journaled in {journal.path}")
+    else:
+        journal.reset()
+        journaled = {}
+
+    embeddings = [journaled.get((listing_id, text_hash)) for listing_id, text_hash in zip(listing_ids, hashes)]
+    pending = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if resume:
+        print(f"Skipping {len(texts) - len(pending)} journaled listings, {len(pending)} left to embed")
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        vectors = embed_fn([texts[i] for i in chunk])
+
+        records = []
+        for i, vector in zip(chunk, vectors):
+            embeddings[i] = vector
+            if vector is not None:
+                records.append({'listing_id': listing_ids[i], 'content_hash': hashes[i], 'embedding': vector})
+        journal.append(records)
+        print(f"Checkpoint: {min(start + chunk_size, len(pending))}/{len(pending)} pending listings processed")
+
+    return embeddings
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Binary Embedding Store
+Stores embeddings as a float32 .npy matrix plus a compact JSON sidecar,
+so the search servers can memory-map them instead of parsing JSON floats.
+The sidecar still holds the listings (without embeddings): search_api.py
+and the vector index serve results from the store alone.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import List, Dict, Any, Optional, Callable, Iterable
+import numpy as np
+from embedding_text import build_embedding_text, content_hash
+from vector_index import normalize_rows
+
+STORE_FORMAT_VERSION = 1
+
+# Rows hashed per update when digesting a matrix, so a memory-mapped store is never read in one piece
+DIGEST_BLOCK_ROWS = 65536
+
+# Length of the random generation id written after the .npy data and into the sidecar
+GENERATION_BYTES = 16
+
+# Times a load re-reads a store whose matrix and sidecar disagree, in case it caught a save mid-publish
+LOAD_ATTEMPTS = 5
+LOAD_RETRY_DELAY = 0.05
+
+
+def sidecar_path(store_path: str) -> str:
+    """Return the sidecar path for a store, e.g. foo.npy -> foo.meta.json."""
+    base, _ = os.path.splitext(store_path)
+    return f"{base}.meta.json"
+
+
+def matrix_digest(matrix: np.ndarray) -> str:
+    """BLAKE2b digest of a matrix's shape and float32 contents."""
+    digest = hashlib.blake2b(repr(matrix.shape).encode(), digest_size=16)
+    for start in range(0, matrix.shape[0], DIGEST_BLOCK_ROWS):
+        digest.update(np.ascontiguousarray(matrix[start:start + DIGEST_BLOCK_ROWS]).tobytes())
+    return digest.hexdigest()
+
+
+def save_embedding_store(store_path: str, listings: List[Dict[str, Any]], embeddings: List[List[float]],
+                         metadata: Dict[str, Any], content_hashes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Write an L2-normalised float32 matrix and its sidecar.
+
+    ``listings`` and ``embeddings`` must be aligned; listings are stored without
+    their 'embedding' key. Both files are written to temporary names first and
+    then renamed, so a reader never sees a half-written store. The matrix
+    file ends with a random generation id that the sidecar repeats, so a
+    reader that catches the matrix and sidecar of different saves (between
+    the two renames) can tell without reading the matrix. The sidecar also
+    records the matrix digest for verify_embedding_store().
+    """
+    if embeddings:
+        matrix = normalize_rows(np.array(embeddings, dtype=np.float32))
+    else:
+        matrix = np.zeros((0, metadata.get('embedding_dimension') or 0), dtype=np.float32)
+
+    if content_hashes is None:
+        content_hashes = [content_hash(build_embedding_text(listing)) for listing in listings]
+
+    stored_listings = [{key: value for key, value in listing.items() if key != 'embedding'}
+                       for listing in listings]
+
+    sidecar = {
+        'format_version': STORE_FORMAT_VERSION,
+        'metadata': {
+            **metadata,
+            'total_properties': len(stored_listings),
+            'embedding_dimension': int(matrix.shape[1]),
+            'dtype': 'float32',
+            'normalized': True
+        },
+        'generation': os.urandom(GENERATION_BYTES // 2).hex(),
+        'matrix_digest': matrix_digest(matrix),
+        'listing_ids': [listing.get('listing_id') for listing in stored_listings],
+        'content_hashes': content_hashes,
+        'listings': stored_listings
+    }
+
+    matrix_tmp = f"{store_path}.tmp"
+    sidecar_tmp = f"{sidecar_path(store_path)}.tmp"
+    with open(matrix_tmp, 'wb') as f:
+        np.save(f, matrix)
+        # np.load reads only the array, so the trailing id is invisible to it
+        f.write(sidecar['generation'].encode('ascii'))
+    with open(sidecar_tmp, 'w') as f:
+        json.dump(sidecar, f, separators=(',', ':'))
+
+    # Matrix first: a new sidecar must never point at an old matrix; the reverse is caught by the generation id
+    os.replace(matrix_tmp, store_path)
+    os.replace(sidecar_tmp, sidecar_path(store_path))
+
+    return sidecar
+
+
+def read_generation(f) -> Optional[str]:
+    """Generation id at the end of an open matrix file; None for a store saved without one."""
+    f.seek(0, os.SEEK_END)
+    if f.tell() < GENERATION_BYTES:
+        return None
+    f.seek(-GENERATION_BYTES, os.SEEK_END)
+    try:
+        return f.read(GENERATION_BYTES).decode('ascii')
+    except UnicodeDecodeError:
+        return None
+
+
+def load_embedding_store(store_path: str, mmap: bool = True) -> Dict[str, Any]:
+    """Open a store in the {'listings': [...], 'metadata': {...}} shape used by the APIs.
+
+    The returned dict also carries 'matrix' (a read-only np.memmap when ``mmap``
+    is set), 'listing_ids' and 'content_hashes'. Listings have no 'embedding' key.
+
+    A matrix whose generation id or shape does not match its sidecar is
+    re-read a few times, since a save may be between its two renames; after
+    that ValueError is raised. The check never reads the matrix itself, so a
+    memory-mapped load stays cheap; see verify_embedding_store().
+    """
+    for attempt in range(LOAD_ATTEMPTS):
+        with open(sidecar_path(store_path), 'r') as f:
+            sidecar = json.load(f)
+
+        if sidecar.get('format_version') != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version: {sidecar.get('format_version')}")
+
+        with open(store_path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            generation = read_generation(f)
+        matrix = np.load(store_path, mmap_mode='r' if mmap else None)
+        # Stores saved before generation ids were recorded are only checked for shape
+        expected = sidecar.get('generation')
+        if (matrix.dtype == np.float32 and matrix.ndim == 2 and matrix.shape[0] == len(sidecar['listing_ids'])
+                and (expected is None or (generation == expected and os.stat(store_path).st_ino == inode))):
+            break
+        if attempt + 1 == LOAD_ATTEMPTS:
+            raise ValueError(f"Embedding store {store_path} does not match its sidecar")
+        time.sleep(LOAD_RETRY_DELAY)
+
+    return {
+        'listings': sidecar['listings'],
+        'metadata': sidecar['metadata'],
+        'listing_ids': sidecar['listing_ids'],
+        'content_hashes': sidecar['content_hashes'],
+        'matrix': matrix
+    }
+
+
+def verify_embedding_store(store_path: str) -> Dict[str, Any]:
+    """Load a store and check its matrix against the sidecar's digest; raises ValueError on a mismatch.
+
+    Reads the whole matrix, so it is for explicit checks, not every load.
+    """
+    store = load_embedding_store(store_path)
+    with open(sidecar_path(store_path), 'r') as f:
+        digest = json.load(f).get('matrix_digest')
+    if digest is not None and digest != matrix_digest(store['matrix']):
+        raise ValueError(f"Embedding store {store_path} matrix does not match its digest")
+    return store
+
+
+def apply_delta_to_store(store_path: str, upserts: List[Dict[str, Any]], deletes: Iterable[Any],
+                         embed_texts: Callable[[List[str]], List[Optional[List[float]]]]) -> Dict[str, Any]:
+    """Update a store from a listing delta, embedding only the upserted listings.
+
+    Deleted listings are dropped and upserted ones replace their old rows (or
+    are appended). If an upsert fails to embed, its previous row is kept.
+    """
+    store = load_embedding_store(store_path, mmap=False)
+    texts = [build_embedding_text(listing) for listing in upserts]
+    vectors = embed_texts(texts) if texts else []
+
+    embedded = [(listing, text, vector) for listing, text, vector in zip(upserts, texts, vectors)
+                if vector is not None]
+    failed = len(upserts) - len(embedded)
+    if failed:
+        print(f"WARNING: {failed} upserted listings failed to embed; keeping their previous embeddings")
+
+    replaced = set(deletes) | {listing['listing_id'] for listing, _, _ in embedded}
+    keep = [i for i, listing_id in enumerate(store['listing_ids']) if listing_id not in replaced]
+
+    listings = [store['listings'][i] for i in keep] + [listing for listing, _, _ in embedded]
+    embeddings = list(store['matrix'][keep]) + [vector for _, _, vector in embedded]
+    content_hashes = ([store['content_hashes'][i] for i in keep] +
+                      [content_hash(text) for _, text, _ in embedded])
+    metadata = {**store['metadata'], 'updated_timestamp': time.time()}
+
+    sidecar = save_embedding_store(store_path, listings, embeddings, metadata, content_hashes)
+    print(f"Applied delta to {store_path}: {len(embedded)} listings embedded, "
+          f"{len(store['listing_ids']) - len(keep)} old rows dropped, {len(listings)} listings now")
+    return sidecar
+
+
+def convert_json_embeddings(json_path: str, store_path: str) -> Dict[str, Any]:
+    """Convert a legacy property_embeddings*.json file into a binary store."""
+    print(f"Loading JSON embeddings from {json_path}...")
+    start_time = time.time()
+    with open(json_path, 'r') as f:
+        embeddings_data = json.load(f)
+
+    listings = [listing for listing in embeddings_data.get('listings', []) if listing.get('embedding')]
+    embeddings = [listing['embedding'] for listing in listings]
+    metadata = dict(embeddings_data.get('metadata', {}))
+    metadata['converted_from'] = os.path.basename(json_path)
+
+    sidecar = save_embedding_store(store_path, listings, embeddings, metadata)
+
+    json_size = os.path.getsize(json_path)
+    store_size = os.path.getsize(store_path) + os.path.getsize(sidecar_path(store_path))
+    print(f"Converted {len(listings)} embeddings in {time.time() - start_time:.2f}s")
+    print(f"Size: {json_size / 1e6:.1f} MB JSON -> {store_size / 1e6:.1f} MB binary store")
+    return sidecar
+
+
+def main():
+    """Convert existing JSON embeddings files to the binary store format."""
+    parser = argparse.ArgumentParser(description="Convert JSON embeddings to a memory-mappable binary store")
+    parser.add_argument('json_path', nargs='?', help="Existing embeddings file, e.g. property_embeddings_gemini.json")
+    parser.add_argument('store_path', nargs='?', help="Output .npy path (defaults to the JSON name with .npy)")
+    parser.add_argument('--verify', metavar='STORE', help="Check an existing store's matrix against its digest instead")
+    args = parser.parse_args()
+
+    if args.verify:
+        store = verify_embedding_store(args.verify)
+        print(f"Embedding store {args.verify} is intact ({len(store['listing_ids'])} embeddings)")
+        return
+    if not args.json_path:
+        parser.error("json_path is required unless --verify is given")
+
+    store_path = args.store_path or f"{os.path.splitext(args.json_path)[0]}.npy"
+    convert_json_embeddings(args.json_path, store_path)
+    print(f"Embedding store saved to {store_path} (+ {sidecar_path(store_path)})")
+
+
+if __name__ == "__main__":
+    main()
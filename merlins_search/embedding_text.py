@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Embedding Text
+Builds the exact text that gets embedded for each listing, shared by all embedders.
+"""
+
+import hashlib
+from typing import Dict, Any
+
+
+def get_price_range(price: float) -> str:
+    """Convert price to descriptive range."""
+    if price < 300000:
+        return "affordable starter home"
+    elif price < 500000:
+        return "mid-range family home"
+    elif price < 800000:
+        return "upscale residential"
+    elif price < 1200000:
+        return "luxury home"
+    elif price < 2000000:
+        return "luxury estate"
+    else:
+        return "ultra-luxury estate"
+
+
+def build_embedding_text(listing: Dict[str, Any]) -> str:
+    """Combine enhanced description with key searchable features for embedding."""
+    embedding_text = listing['enhanced_description']
+
+    # Add key searchable features
+    if listing.get('architectural_style'):
+        embedding_text += f" Architectural style: {listing['architectural_style']}"
+
+    if listing.get('price') and listing['price'] > 0:
+        price_range = get_price_range(listing['price'])
+        embedding_text += f" Price range: {price_range}"
+
+    if listing.get('lot_acres') and listing['lot_acres'] > 0:
+        if listing['lot_acres'] >= 5:
+            embedding_text += " Large acreage estate property"
+        elif listing['lot_acres'] >= 1:
+            embedding_text += " Spacious lot with acreage"
+
+    return embedding_text
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of an embedding text, used to detect changed listings."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
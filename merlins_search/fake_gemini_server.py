@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Gemini embedding endpoints for tests and benchmarks.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Set
+import numpy as np
+
+
+def fake_embedding(text: str, dimension: int = 8) -> List[float]:
+    """Deterministic pseudo-embedding for a text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).normal(size=dimension).tolist()
+
+
+class FakeGeminiServer:
+    """Threaded HTTP server that answers :embedContent and :batchEmbedContents.
+
+    ``fail_first`` maps a text to the number of leading requests containing it
+    that receive ``fail_status`` before it succeeds. Any request containing a
+    text in ``reject_texts`` always gets a 400, like an oversized input would.
+    ``latency`` delays every response; ``slow_first`` maps a text to the
+    number of leading requests containing it that are delayed by a further
+    ``slow_latency`` seconds. ``retry_after``, if set, is sent as the
+    Retry-After header of ``fail_status`` responses. Attributes may be
+    changed while serving, e.g. to simulate a provider brownout.
+    """
+
+    def __init__(self, dimension: int = 8, latency: float = 0.0, fail_first: Optional[Dict[str, int]] = None,
+                 fail_status: int = 429, reject_texts: Optional[Set[str]] = None,
+                 slow_first: Optional[Dict[str, int]] = None, slow_latency: float = 1.0,
+                 retry_after: Optional[str] = None):
+        self.dimension = dimension
+        self.latency = latency
+        self.slow_first = dict(slow_first or {})
+        self.slow_latency = slow_latency
+        self.fail_first = dict(fail_first or {})
+        self.fail_status = fail_status
+        self.reject_texts = set(reject_texts or ())
+        self.retry_after = retry_after
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.batch_request_count = 0
+        self.texts_seen: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self) -> 'FakeGeminiServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'FakeGeminiServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _failure_status(self, texts: List[str]) -> Optional[int]:
+        """Status code to fail a request for these texts with, if any."""
+        with self.lock:
+            if any(text in self.reject_texts for text in texts):
+                return 400
+            failing = [text for text in texts if self.fail_first.get(text, 0) > 0]
+            for text in failing:
+                self.fail_first[text] -= 1
+            return self.fail_status if failing else None
+
+    def _extra_latency(self, texts: List[str]) -> float:
+        """Additional delay for a request containing these texts."""
+        with self.lock:
+            slow = [text for text in texts if self.slow_first.get(text, 0) > 0]
+            for text in slow:
+                self.slow_first[text] -= 1
+            return self.slow_latency if slow else 0.0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+
+                with server.lock:
+                    server.request_count += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    self._handle(request)
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def _handle(self, request: Dict):
+                method = self.path.split('?')[0].rsplit(':', 1)[-1]
+                if method == 'embedContent':
+                    texts = [request['content']['parts'][0]['text']]
+                elif method == 'batchEmbedContents':
+                    texts = [item['content']['parts'][0]['text'] for item in request['requests']]
+                    with server.lock:
+                        server.batch_request_count += 1
+                else:
+                    self._send_json(404, {'error': {'code': 404, 'message': 'Unknown method'}})
+                    return
+
+                with server.lock:
+                    server.texts_seen.extend(texts)
+                delay = server._extra_latency(texts)
+                if delay:
+                    time.sleep(delay)
+                status = server._failure_status(texts)
+                if status:
+                    headers = {'Retry-After': server.retry_after} if server.retry_after and status != 400 else None
+                    self._send_json(status, {'error': {'code': status}}, headers)
+                elif method == 'embedContent':
+                    self._send_json(200, {'embedding': {'values': fake_embedding(texts[0], server.dimension)}})
+                else:
+                    embeddings = [{'values': fake_embedding(text, server.dimension)} for text in texts]
+                    self._send_json(200, {'embeddings': embeddings})
+
+        return Handler
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Gemini API helpers
+Request payloads and batch packing shared by the Gemini embedders.
+"""
+
+import email.utils
+import random
+import time
+from typing import List, Dict, Any, Optional, Callable
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+GEMINI_EMBEDDING_DIMENSION = 768
+
+# batchEmbedContents accepts up to 100 requests per call; keep payloads well
+# under the request size limit as well
+GEMINI_BATCH_MAX_COUNT = 100
+GEMINI_BATCH_MAX_BYTES = 512 * 1024
+
+# Query embedding timeouts in seconds: give up quickly on an unreachable
+# host, but allow the model time to answer
+GEMINI_CONNECT_TIMEOUT = 3.0
+GEMINI_READ_TIMEOUT = 10.0
+# Batch requests carry up to 100 texts, so allow them longer to answer
+GEMINI_BATCH_READ_TIMEOUT = 60.0
+
+# Approximate JSON wrapper size around each text in a batch request
+REQUEST_OVERHEAD_BYTES = 96
+
+# Responses worth resending unchanged: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Longest wait honoured from a Retry-After header, and the cap on backoff delays
+MAX_RETRY_DELAY = 60.0
+
+
+def request_headers(api_key: str) -> Dict[str, str]:
+    """Headers for a Gemini API call, carrying the key so it is never part of a URL that errors would print."""
+    return {'Content-Type': 'application/json', 'x-goog-api-key': api_key}
+
+
+def embed_content_url(api_base: str = GEMINI_API_BASE) -> str:
+    return f"{api_base}/{GEMINI_EMBEDDING_MODEL}:embedContent"
+
+
+def batch_embed_contents_url(api_base: str = GEMINI_API_BASE) -> str:
+    return f"{api_base}/{GEMINI_EMBEDDING_MODEL}:batchEmbedContents"
+
+
+def embed_request(text: str) -> Dict[str, Any]:
+    """Body for a single embedContent request."""
+    return {
+        'model': GEMINI_EMBEDDING_MODEL,
+        'content': {'parts': [{'text': text}]}
+    }
+
+
+def batch_embed_request(texts: List[str]) -> Dict[str, Any]:
+    """Body for a batchEmbedContents request."""
+    return {'requests': [embed_request(text) for text in texts]}
+
+
+def parse_batch_response(result: Dict[str, Any], expected: int) -> List[List[float]]:
+    """Extract embeddings from a batchEmbedContents response, in request order."""
+    embeddings = [item['values'] for item in result.get('embeddings', [])]
+    if len(embeddings) != expected:
+        raise ValueError(f"Batch response has {len(embeddings)} embeddings, expected {expected}")
+    return embeddings
+
+
+def pack_batches(texts: List[str], max_count: int = GEMINI_BATCH_MAX_COUNT,
+                 max_bytes: int = GEMINI_BATCH_MAX_BYTES) -> List[List[int]]:
+    """Group text indices into batches under both a count and a byte cap.
+
+    A single text larger than ``max_bytes`` still gets a batch of its own.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+
+    for i, text in enumerate(texts):
+        size = len(text.encode('utf-8')) + REQUEST_OVERHEAD_BYTES
+        if current and (len(current) >= max_count or current_bytes + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(i)
+        current_bytes += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed request should be resent as it is: a 429, a 5xx, a timeout or a connection failure.
+
+    Other failures (a 400, or a response with the wrong number of
+    embeddings) point at the request's contents instead.
+    """
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # requests' connection errors and timeouts are OSErrors
+    return isinstance(error, (OSError, TimeoutError))
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait in the Retry-After header of a failed request's response; None if absent."""
+    response = getattr(error, 'response', None)
+    return parse_retry_after(getattr(response, 'headers', {}).get('Retry-After') if response is not None else None)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait for a Retry-After value (seconds or HTTP date), capped at MAX_RETRY_DELAY; None if absent."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_DELAY)
+
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = MAX_RETRY_DELAY) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def embed_in_batches(texts: List[str], post_batch: Callable[[List[str]], List[List[float]]],
+                     post_single: Callable[[str], Optional[List[float]]],
+                     max_count: int = GEMINI_BATCH_MAX_COUNT, max_bytes: int = GEMINI_BATCH_MAX_BYTES,
+                     max_retries: int = 3, base_delay: float = 1.0) -> List[Optional[List[float]]]:
+    """Embed texts with batch requests, retrying only the items that fail.
+
+    ``post_batch`` must return one embedding per text or raise. A batch that
+    fails transiently (429, 5xx, timeout) is resent whole, up to
+    ``max_retries`` times, after the Retry-After delay or a jittered
+    exponential backoff; if it never gets through, its items come back as
+    None rather than being split into more traffic. A batch the API rejects
+    for its contents (e.g. a 400, or the wrong number of embeddings) is split
+    in half and each half resent, so a single bad text is isolated in
+    O(log n) requests while its neighbours still go out batched. Isolated
+    items are retried with ``post_single`` (returning None on failure) with
+    backoff before every pass; items that never succeed come back as None.
+    """
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    failed = []
+
+    def post_with_retries(batch_texts: List[str]) -> List[List[float]]:
+        for attempt in range(max_retries + 1):
+            try:
+                return post_batch(batch_texts)
+            except Exception as e:
+                if attempt == max_retries or not is_transient_error(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt, base_delay)
+                print(f"Batch of {len(batch_texts)} failed ({e}); resending it in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_group(indices: List[int]):
+        try:
+            vectors = post_with_retries([texts[i] for i in indices])
+        except Exception as e:
+            if is_transient_error(e):
+                # Still throttled or down; splitting the batch would only add load
+                print(f"Giving up on a batch of {len(indices)} after {max_retries + 1} attempts ({e})")
+                return
+            if len(indices) == 1:
+                failed.append(indices[0])
+                return
+            print(f"Batch of {len(indices)} failed ({e}); splitting to isolate the failing items")
+            middle = len(indices) // 2
+            embed_group(indices[:middle])
+            embed_group(indices[middle:])
+            return
+        for i, vector in zip(indices, vectors):
+            embeddings[i] = vector
+
+    batches = pack_batches(texts, max_count, max_bytes)
+    for batch_number, batch in enumerate(batches, 1):
+        print(f"Processing batch {batch_number}/{len(batches)} ({len(batch)} properties)")
+        embed_group(batch)
+
+    for attempt in range(max_retries):
+        if not failed:
+            break
+        time.sleep(backoff_delay(attempt, base_delay))
+        still_failed = []
+        for i in failed:
+            embeddings[i] = post_single(texts[i])
+            if embeddings[i] is None:
+                still_failed.append(i)
+        failed = still_failed
+
+    if failed:
+        print(f"Warning: {len(failed)} items failed after {max_retries} individual retries")
+    return embeddings
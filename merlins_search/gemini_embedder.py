@@ -4,18 +4,44 @@ Merlin's Shack Semantic Search - Gemini Embedding Generator
 Creates vector embeddings for property listings using Google's Gemini API.
 """
 
+import argparse
+import functools
 import json
 import os
 import time
 from typing import List, Dict, Any
 import requests
 import numpy as np
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embedding_journal import EmbeddingJournal, embed_with_journal, journal_path_for
+from embedding_store import apply_delta_to_store, save_embedding_store
+from embedding_text import build_embedding_text, content_hash, get_price_range
+from gemini_api import (
+    GEMINI_API_BASE,
+    GEMINI_BATCH_MAX_BYTES,
+    GEMINI_BATCH_MAX_COUNT,
+    GEMINI_BATCH_READ_TIMEOUT,
+    GEMINI_CONNECT_TIMEOUT,
+    GEMINI_EMBEDDING_DIMENSION,
+    GEMINI_EMBEDDING_MODEL,
+    GEMINI_READ_TIMEOUT,
+    batch_embed_contents_url,
+    batch_embed_request,
+    embed_content_url,
+    embed_in_batches,
+    embed_request,
+    parse_batch_response,
+    request_headers
+)
+from listing_io import default_listings_path, load_listings
+from listing_manifest import read_delta
+from vector_index import PropertyVectorIndex
 
 class GeminiPropertyEmbedder:
     """Generates embeddings using Google Gemini API."""
     
-    def __init__(self, api_key: str = None):
-        """Initialize with Gemini API key."""
+    def __init__(self, api_key: str = None, api_base: str = None):
+        """Initialize with Gemini API key (and an optional API base URL, e.g. a local fake)."""
         if api_key:
             self.api_key = api_key
         else:
@@ -25,24 +51,17 @@ class GeminiPropertyEmbedder:
                 raise ValueError("Gemini API key required. Set GEMINI_API_KEY environment variable or pass api_key parameter.")
             self.api_key = api_key
         
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent"
+        self.api_base = api_base or os.getenv('GEMINI_API_BASE', GEMINI_API_BASE)
+        self.base_url = embed_content_url(self.api_base)
+        self.batch_url = batch_embed_contents_url(self.api_base)
         
     def create_embedding(self, text: str) -> List[float]:
         """Create embedding for a single text string using Gemini."""
         try:
-            headers = {
-                'Content-Type': 'application/json',
-            }
-            
-            data = {
-                'model': 'models/text-embedding-004',
-                'content': {
-                    'parts': [{'text': text}]
-                }
-            }
+            data = embed_request(text)
             
-            url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, json=data, headers=headers)
+            response = requests.post(self.base_url, json=data, headers=request_headers(self.api_key),
+                                     timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
             response.raise_for_status()
             
             result = response.json()
@@ -52,58 +71,91 @@ class GeminiPropertyEmbedder:
             print(f"Error creating embedding: {e}")
             return None
     
-    def create_embeddings_batch(self, texts: List[str], batch_size: int = 5) -> List[List[float]]:
-        """Create embeddings for multiple texts (Gemini doesn't support true batching, so we do sequential)."""
-        embeddings = []
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed up to GEMINI_BATCH_MAX_COUNT texts with one batchEmbedContents call (raises on failure)."""
+        response = requests.post(self.batch_url, json=batch_embed_request(texts),
+                                 headers=request_headers(self.api_key),
+                                 timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_BATCH_READ_TIMEOUT))
+        response.raise_for_status()
+        return parse_batch_response(response.json(), len(texts))
+    
+    def create_embeddings_batch(self, texts: List[str], batch_size: int = GEMINI_BATCH_MAX_COUNT,
+                                max_batch_bytes: int = GEMINI_BATCH_MAX_BYTES) -> List[List[float]]:
+        """Create embeddings for multiple texts using batchEmbedContents.
+
+        Texts are packed into requests under ``batch_size`` items and
+        ``max_batch_bytes``. A throttled batch is resent whole after a backoff;
+        only items from a rejected batch are retried individually, so one bad
+        text cannot sink its neighbours.
+        """
+        return embed_in_batches(
+            texts,
+            self.embed_batch,
+            self.create_embedding,
+            max_count=batch_size,
+            max_bytes=max_batch_bytes
+        )
+    
+    def create_embeddings_bulk(self, texts: List[str], max_in_flight: int = 8, qps: float = 20.0) -> List[List[float]]:
+        """Create embeddings concurrently with a bounded number of in-flight requests.
+
+        Texts are sent as batchEmbedContents requests paced by a token bucket at
+        ``qps``; 429/5xx responses are retried with jittered exponential backoff.
+        Results keep input order, with None for texts that still failed.
+        """
+        from async_embedder import AsyncGeminiBulkEmbedder
         
-        for i, text in enumerate(texts):
-            print(f"Processing property {i+1}/{len(texts)}")
-            
-            embedding = self.create_embedding(text)
-            embeddings.append(embedding)
-            
-            # Small delay to be respectful to API
-            if i % 10 == 0 and i > 0:
-                print(f"Processed {i} properties, taking a short break...")
-                time.sleep(1)
-            else:
-                time.sleep(0.1)
-                
-        return embeddings
+        bulk_embedder = AsyncGeminiBulkEmbedder(
+            self.api_key,
+            max_in_flight=max_in_flight,
+            qps=qps,
+            api_base=self.api_base,
+            batch_size=GEMINI_BATCH_MAX_COUNT
+        )
+        return bulk_embedder.embed_texts(texts)
     
-    def process_enhanced_listings(self, json_path: str, output_path: str = None) -> Dict[str, Any]:
-        """Process enhanced listings and create embeddings."""
+    def process_enhanced_listings(self, json_path: str, output_path: str = None,
+                                  max_in_flight: int = None, qps: float = 20.0,
+                                  cache_path: str = None, resume: bool = False) -> Dict[str, Any]:
+        """Process enhanced listings and create embeddings.
+
+        ``json_path`` may be a JSON array or an NDJSON file from streaming ingestion.
+        An ``output_path`` ending in .npy is written as a binary embedding store
+        (see embedding_store.py); any other path gets the legacy JSON format.
+        Setting ``max_in_flight`` switches to the concurrent bulk embedding mode.
+        With ``cache_path``, only texts missing from the embedding cache are sent
+        to the API. When writing to ``output_path``, finished embeddings are
+        journaled as the job runs; ``resume`` skips listings already journaled.
+        """
         
         print(f"Loading enhanced listings from {json_path}...")
-        with open(json_path, 'r') as f:
-            listings = json.load(f)
+        listings = load_listings(json_path)
         
         print(f"Creating Gemini embeddings for {len(listings)} properties...")
         
         # Prepare texts for embedding
-        texts = []
-        for listing in listings:
-            # Combine enhanced description with key features for embedding
-            embedding_text = listing['enhanced_description']
-            
-            # Add key searchable features
-            if listing.get('architectural_style'):
-                embedding_text += f" Architectural style: {listing['architectural_style']}"
-            
-            if listing.get('price') and listing['price'] > 0:
-                price_range = self.get_price_range(listing['price'])
-                embedding_text += f" Price range: {price_range}"
-            
-            if listing.get('lot_acres') and listing['lot_acres'] > 0:
-                if listing['lot_acres'] >= 5:
-                    embedding_text += " Large acreage estate property"
-                elif listing['lot_acres'] >= 1:
-                    embedding_text += " Spacious lot with acreage"
-            
-            texts.append(embedding_text)
+        texts = [build_embedding_text(listing) for listing in listings]
         
         # Create embeddings
-        embeddings = self.create_embeddings_batch(texts)
+        if max_in_flight:
+            embed_texts = functools.partial(self.create_embeddings_bulk, max_in_flight=max_in_flight, qps=qps)
+        else:
+            embed_texts = self.create_embeddings_batch
+        
+        cache = None
+        if cache_path:
+            cache = EmbeddingCache(cache_path, GEMINI_EMBEDDING_MODEL, GEMINI_EMBEDDING_DIMENSION)
+            embed_texts = functools.partial(embed_with_cache, embed_fn=embed_texts, cache=cache)
+        
+        journal = EmbeddingJournal(journal_path_for(output_path)) if output_path else None
+        if journal:
+            listing_ids = [listing.get('listing_id') for listing in listings]
+            embeddings = embed_with_journal(listing_ids, texts, embed_texts, journal, resume=resume)
+        else:
+            embeddings = embed_texts(texts)
+        
+        if cache:
+            cache.close()
         
         # Combine listings with embeddings
         processed_data = {
@@ -112,43 +164,55 @@ class GeminiPropertyEmbedder:
                 'total_properties': len(listings),
                 'embedding_model': 'gemini-text-embedding-004',
                 'created_timestamp': time.time(),
-                'embedding_dimension': len(embeddings[0]) if embeddings and embeddings[0] else None
+                'embedding_dimension': next((len(e) for e in embeddings if e is not None), None),
+                'failed_listing_ids': []
             }
         }
         
         successful_embeddings = 0
-        for listing, embedding in zip(listings, embeddings):
+        content_hashes = []
+        for listing, text, embedding in zip(listings, texts, embeddings):
             if embedding is not None:
                 listing['embedding'] = embedding
                 processed_data['listings'].append(listing)
+                content_hashes.append(content_hash(text))
                 successful_embeddings += 1
             else:
                 print(f"Skipping listing {listing.get('listing_id', 'unknown')} due to embedding failure")
+                processed_data['metadata']['failed_listing_ids'].append(listing.get('listing_id'))
         
         print(f"Successfully created embeddings for {successful_embeddings} properties")
+        failed_count = len(processed_data['metadata']['failed_listing_ids'])
+        if failed_count:
+            print(f"WARNING: {failed_count} listings have no embedding after retries: "
+                  f"{processed_data['metadata']['failed_listing_ids']}")
         
         if output_path:
             print(f"Saving embeddings to {output_path}...")
-            with open(output_path, 'w') as f:
-                json.dump(processed_data, f, indent=2)
+            if output_path.endswith('.npy'):
+                save_embedding_store(
+                    output_path,
+                    processed_data['listings'],
+                    [listing['embedding'] for listing in processed_data['listings']],
+                    processed_data['metadata'],
+                    content_hashes
+                )
+            else:
+                with open(output_path, 'w') as f:
+                    json.dump(processed_data, f)
             print(f"Embeddings saved to {output_path}")
+            
+            # The saved artifact now holds everything the journal did
+            if len(processed_data['listings']) == len(listings):
+                journal.reset()
+            else:
+                print(f"Journal kept at {journal.path}; rerun with --resume to retry failed listings")
         
         return processed_data
     
     def get_price_range(self, price: float) -> str:
         """Convert price to descriptive range."""
-        if price < 300000:
-            return "affordable starter home"
-        elif price < 500000:
-            return "mid-range family home"
-        elif price < 800000:
-            return "upscale residential"
-        elif price < 1200000:
-            return "luxury home"
-        elif price < 2000000:
-            return "luxury estate"
-        else:
-            return "ultra-luxury estate"
+        return get_price_range(price)
     
     def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings."""
@@ -168,8 +232,13 @@ class GeminiPropertyEmbedder:
         
         return dot_product / (norm1 * norm2)
     
-    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for properties similar to a query."""
+    def search_similar_properties(self, query: str, embeddings_data: Dict[str, Any], top_k: int = 5,
+                                  index: PropertyVectorIndex = None, rows=None) -> List[Dict[str, Any]]:
+        """Search for properties similar to a query.
+
+        Pass a prebuilt ``index`` to avoid rebuilding the embedding matrix on every call,
+        and ``rows`` to search only those index rows (e.g. the ones passing a filter).
+        """
         
         print(f"Searching for: '{query}'")
         
@@ -179,33 +248,29 @@ class GeminiPropertyEmbedder:
             print("Failed to create query embedding")
             return []
         
-        # Calculate similarities
-        similarities = []
-        for listing in embeddings_data['listings']:
-            if 'embedding' in listing:
-                similarity = self.calculate_similarity(query_embedding, listing['embedding'])
-                similarities.append({
-                    'listing': listing,
-                    'similarity': similarity
-                })
-        
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        results = []
-        for item in similarities[:top_k]:
-            result = item['listing'].copy()
-            result['similarity_score'] = item['similarity']
-            # Remove embedding from result to save space
-            if 'embedding' in result:
-                del result['embedding']
-            results.append(result)
+        if index is None:
+            index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
         
-        return results
+        # Single matrix-vector product plus top-k selection
+        return index.search(query_embedding, top_k, rows)
 
 def main():
     """Main function to demonstrate embedding generation."""
     
+    parser = argparse.ArgumentParser(description="Create Gemini embeddings for enhanced listings")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="Embed with this many in-flight requests (async bulk mode)")
+    parser.add_argument('--qps', type=float, default=20.0,
+                        help="Provider requests-per-second quota for bulk mode")
+    parser.add_argument('--cache-path', default="embedding_cache.sqlite3",
+                        help="Embedding cache file; only changed listings are re-embedded")
+    parser.add_argument('--no-cache', action='store_true', help="Re-embed every listing")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run, skipping listings already journaled")
+    parser.add_argument('--delta', help="Apply a data_processor.py delta file to the existing store "
+                                        "instead of re-embedding every listing")
+    args = parser.parse_args()
+    
     # Get Gemini API key
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
@@ -216,16 +281,28 @@ def main():
     embedder = GeminiPropertyEmbedder(api_key)
     
     # Process enhanced listings
-    enhanced_path = "enhanced_listings.json"
-    embeddings_path = "property_embeddings_gemini.json"
+    enhanced_path = default_listings_path() or "enhanced_listings.json"
+    embeddings_path = "property_embeddings_gemini.npy"
     
     if not os.path.exists(enhanced_path):
         print(f"Enhanced listings file not found: {enhanced_path}")
         print("Please run data_processor.py first to create enhanced listings.")
         return
     
+    if args.delta:
+        if not os.path.exists(embeddings_path):
+            print(f"Embedding store not found: {embeddings_path}; run without --delta first")
+            return
+        upserts, deletes = read_delta(args.delta)
+        apply_delta_to_store(embeddings_path, upserts, deletes, embedder.create_embeddings_batch)
+        return
+    
     # Generate embeddings
-    embeddings_data = embedder.process_enhanced_listings(enhanced_path, embeddings_path)
+    embeddings_data = embedder.process_enhanced_listings(
+        enhanced_path, embeddings_path, max_in_flight=args.concurrency, qps=args.qps,
+        cache_path=None if args.no_cache else args.cache_path, resume=args.resume
+    )
+    index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
     
     # Test some searches
     test_queries = [
@@ -244,7 +321,7 @@ def main():
         print(f"\nQuery: '{query}'")
         print("-" * 40)
         
-        results = embedder.search_similar_properties(query, embeddings_data, top_k=3)
+        results = embedder.search_similar_properties(query, embeddings_data, top_k=3, index=index)
         
         for i, result in enumerate(results, 1):
             print(f"{i}. {result['address']} - ${result['price']:,.0f}")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Index Reloader
+Rebuilds the search indexes in a background thread when their source files
+change, and publishes each new generation with one reference swap.
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+def file_signature(paths: Iterable[str]) -> Signature:
+    """(path, mtime in ns, size) of each path that exists; changes whenever a file is replaced or rewritten."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class IndexReloader:
+    """Polls source files and swaps in freshly built indexes off the request path.
+
+    ``build()`` constructs a complete index object (matrix, attribute columns,
+    inverted index, ...) from the files named by ``paths()``; ``publish(index)``
+    makes it current, normally by rebinding one module-level reference, which
+    is atomic. Requests that took the previous reference keep using it, and
+    it is freed once the last of them finishes; ``retired`` counts those.
+
+    A change is only built once the files have been unchanged for one poll
+    ``interval``, so a multi-file write is not caught half done. A failed
+    build leaves the current index serving and is retried when the files
+    change again.
+
+    ``refresh()``, if given, also runs on every poll, for cheap updates that
+    do not need a rebuild (e.g. replaying changes logged by another worker).
+    """
+
+    def __init__(self, paths: Callable[[], Iterable[str]], build: Callable[[], Any],
+                 publish: Callable[[Any], None], interval: float = 5.0,
+                 refresh: Optional[Callable[[], None]] = None):
+        self.paths = paths
+        self.build = build
+        self.publish = publish
+        self.interval = interval
+        self.refresh = refresh
+        # Serialises builds; stats() never waits on it, so /health stays fast during a reload
+        self._build_lock = threading.Lock()
+        self._retire_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loaded_signature: Optional[Signature] = None
+        self._pending_signature: Optional[Signature] = None
+        self.generation = 0
+        self.reloads = 0
+        self.failures = 0
+        self.retired = 0
+        self.last_error: Optional[str] = None
+        self.last_build_seconds = 0.0
+        self.last_loaded: Optional[float] = None
+
+    def load(self) -> bool:
+        """Build and publish now, whatever the files' state; False if the build failed."""
+        with self._build_lock:
+            return self._load(file_signature(self.paths()))
+
+    def _load(self, signature: Signature) -> bool:
+        """Build and publish for ``signature``. Caller holds the build lock."""
+        start_time = time.time()
+        try:
+            index = self.build()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            # Do not rebuild the same broken files on every poll
+            self._loaded_signature = signature
+            print(f"Index reload failed, still serving generation {self.generation}: {e}")
+            return False
+        self.generation += 1
+        try:
+            weakref.finalize(index, self._retire)
+        except TypeError:
+            pass  # Not weak-referenceable; retirement just goes uncounted
+        self.publish(index)
+        self._loaded_signature = signature
+        self.reloads += 1
+        self.last_error = None
+        self.last_build_seconds = time.time() - start_time
+        self.last_loaded = time.time()
+        print(f"Published index generation {self.generation} (built in {self.last_build_seconds:.2f}s)")
+        return True
+
+    def _retire(self):
+        # Runs wherever the last reference is dropped, possibly inside _load()
+        with self._retire_lock:
+            self.retired += 1
+
+    def check(self) -> bool:
+        """One poll: rebuild if the files changed and have since held still; True if a new index was published."""
+        with self._build_lock:
+            signature = file_signature(self.paths())
+            if signature == self._loaded_signature:
+                self._pending_signature = None
+                return False
+            if signature != self._pending_signature:
+                # Changed since the last poll; wait for the writer to finish
+                self._pending_signature = signature
+                return False
+            self._pending_signature = None
+            return self._load(signature)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+                if self.refresh is not None:
+                    self.refresh()
+            except Exception as e:
+                print(f"Index reloader error: {e}")
+
+    def start(self):
+        """Start polling in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='index-reloader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Reload counters, e.g. for a health endpoint."""
+        return {
+            'generation': self.generation,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'retired': self.retired,
+            'last_error': self.last_error,
+            'last_build_seconds': self.last_build_seconds,
+            'last_loaded': self.last_loaded,
+            'polling': self._thread is not None and self._thread.is_alive(),
+        }
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Keyword Matcher
+Finds every keyword from a fixed vocabulary in one scan of a text.
+"""
+
+import re
+from typing import Iterable, Dict, List, Optional, Set
+
+
+def _trie_pattern(keywords: List[str]) -> str:
+    """Regex for the keywords, factored through a character trie.
+
+    Shared prefixes are matched once, so the work at each text position is
+    bounded by the longest keyword rather than the number of keywords.
+    Optional suffixes are greedy, so the longest keyword at a position wins.
+    """
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Compiled matcher for a fixed set of lowercase keywords.
+
+    Gives the same answers as ``keyword in text`` and ``text.count(keyword)``
+    for every keyword. Large vocabularies are found with one scan of the text
+    through a trie-factored regex, so cost tracks text length rather than
+    text length x keywords. Below ``REGEX_MIN_KEYWORDS`` CPython's substring
+    search per keyword is faster, so small vocabularies use that instead.
+    Callers lowercase the text.
+    """
+
+    REGEX_MIN_KEYWORDS = 128
+
+    def __init__(self, keywords: Iterable[str], use_regex: Optional[bool] = None):
+        self.keywords = list(dict.fromkeys(keyword.lower() for keyword in keywords if keyword))
+        if use_regex is None:
+            use_regex = len(self.keywords) >= self.REGEX_MIN_KEYWORDS
+        self.pattern = re.compile(_trie_pattern(self.keywords)) if use_regex and self.keywords else None
+
+        # The regex reports the longest keyword starting at each position;
+        # shorter keywords starting there are its prefixes
+        self.implied = {
+            keyword: [other for other in self.keywords if keyword.startswith(other)]
+            for keyword in self.keywords
+        }
+
+    def _matches(self, text: str):
+        """Yield (start, longest keyword) for every position where a keyword starts."""
+        search = self.pattern.search
+        match = search(text)
+        while match is not None:
+            yield match.start(), match.group()
+            match = search(text, match.start() + 1)
+
+    def find(self, text: str) -> Set[str]:
+        """Return the set of keywords that occur in ``text``."""
+        if self.pattern is None:
+            return {keyword for keyword in self.keywords if keyword in text}
+        found = set()
+        for _, keyword in self._matches(text):
+            found.update(self.implied[keyword])
+        return found
+
+    def count(self, text: str) -> Dict[str, int]:
+        """Return non-overlapping occurrence counts, matching ``str.count``."""
+        if self.pattern is None:
+            return {keyword: text.count(keyword) for keyword in self.keywords}
+        counts = dict.fromkeys(self.keywords, 0)
+        next_free = dict.fromkeys(self.keywords, 0)
+        for start, longest in self._matches(text):
+            for keyword in self.implied[longest]:
+                if start >= next_free[keyword]:
+                    counts[keyword] += 1
+                    next_free[keyword] = start + len(keyword)
+        return counts
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Lexical Index
+BM25 inverted index over listing text, built once at load time.
+"""
+
+import copy
+import re
+from collections import Counter
+from typing import Iterable, List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of ``text``."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class LexicalIndex:
+    """BM25 inverted index over a fixed list of listings.
+
+    Postings are stored CSR-style: the rows containing vocabulary term ``t``
+    are ``posting_rows[offsets[t]:offsets[t + 1]]``, alongside their BM25
+    term-frequency weights, which already include the document length
+    normalisation. A query therefore only touches the postings of its own
+    terms, and its cost does not grow with the number of listings.
+
+    ``with_appended()`` adds rows without rebuilding: their postings go to
+    small per-term extras that are read after the shared base postings.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, listings: List[Dict[str, Any]], fields: Sequence[str]):
+        self.listings = listings
+        self.listing_ids = np.array([listing.get('listing_id') for listing in listings])
+        self.fields = list(fields)
+        self.vocabulary: Dict[str, int] = {}
+
+        term_ids = []
+        rows = []
+        frequencies = []
+        doc_lengths = np.zeros(len(listings), dtype=np.float32)
+        for row, listing in enumerate(listings):
+            tokens = self._document_tokens(listing)
+            doc_lengths[row] = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                rows.append(row)
+                frequencies.append(count)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')  # Rows stay ascending within a term
+        self.posting_rows = np.array(rows, dtype=np.int64)[order]
+        frequencies = np.array(frequencies, dtype=np.float32)[order]
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=self.offsets[1:])
+
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(listings) and doc_lengths.mean() > 0 else 1.0
+        norms = self.K1 * (1 - self.B + self.B * doc_lengths[self.posting_rows] / self.avg_length)
+        self.posting_weights = (frequencies * (self.K1 + 1) / (frequencies + norms)).astype(np.float32)
+
+        document_frequencies = np.diff(self.offsets).astype(np.float64)
+        self.idf = np.log1p((len(listings) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        # Term -> (rows, weights, idf) of rows added by with_appended()
+        self._appended: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        self._attributes: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def _document_tokens(self, listing: Dict[str, Any]) -> List[str]:
+        tokens = []
+        for field in self.fields:
+            value = listing.get(field)
+            if isinstance(value, str):
+                tokens.extend(tokenize(value))
+        return tokens
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """(sorted rows, BM25 weights, idf) of ``term``; empty arrays for an unknown term."""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            rows, weights, idf = self.posting_rows[:0], self.posting_weights[:0], 0.0
+        else:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows, weights, idf = self.posting_rows[start:end], self.posting_weights[start:end], self.idf[term_id]
+        if term in self._appended:
+            # Appended rows come after every base row, so the rows stay sorted
+            extra_rows, extra_weights, idf = self._appended[term]
+            rows = np.concatenate([rows, extra_rows])
+            weights = np.concatenate([weights, extra_weights])
+        return rows, weights, idf
+
+    def with_appended(self, listings: List[Dict[str, Any]]) -> 'LexicalIndex':
+        """A new index with ``listings`` added as rows after the existing ones.
+
+        The base postings are shared, not rebuilt. New rows are length
+        normalised against the base average length, and only the terms they
+        contain get a fresh idf; the rest refresh when the index is rebuilt.
+        This index is left untouched for searches still reading it.
+        """
+        index = copy.copy(self)
+        start = len(self.listings)
+        index.listings = self.listings + list(listings)
+        new_ids = np.array([listing.get('listing_id') for listing in listings])
+        index.listing_ids = np.concatenate([self.listing_ids, new_ids]) if start else new_ids
+
+        new_postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        lengths = []
+        for row, listing in enumerate(listings, start):
+            tokens = self._document_tokens(listing)
+            lengths.append(len(tokens))
+            norm = self.K1 * (1 - self.B + self.B * len(tokens) / self.avg_length)
+            for token, count in Counter(tokens).items():
+                rows, weights = new_postings.setdefault(token, ([], []))
+                rows.append(row)
+                weights.append(count * (self.K1 + 1) / (count + norm))
+        index.doc_lengths = np.concatenate([self.doc_lengths, np.array(lengths, dtype=np.float32)])
+
+        index._appended = dict(self._appended)
+        for term, (rows, weights) in new_postings.items():
+            old_rows, old_weights, _ = self._appended.get(term, (self.posting_rows[:0], self.posting_weights[:0], 0.0))
+            rows = np.concatenate([old_rows, np.array(rows, dtype=np.int64)])
+            weights = np.concatenate([old_weights, np.array(weights, dtype=np.float32)])
+            term_id = self.vocabulary.get(term)
+            frequency = len(rows) + (self.offsets[term_id + 1] - self.offsets[term_id] if term_id is not None else 0)
+            idf = float(np.log1p((len(index.listings) - frequency + 0.5) / (frequency + 0.5)))
+            index._appended[term] = (rows, weights, idf)
+
+        index._attributes = {name: np.concatenate([column, self._attribute_values(listings, name)])
+                             for name, column in self._attributes.items()}
+        return index
+
+    def rows_with_any(self, terms: Iterable[str]) -> np.ndarray:
+        """Sorted rows containing at least one of ``terms``."""
+        postings = [self._postings(term)[0] for term in set(terms)]
+        if not postings:
+            return self.posting_rows[:0]
+        return np.unique(np.concatenate(postings))
+
+    def rows_with_all(self, terms: Iterable[str]) -> np.ndarray:
+        """Sorted rows containing every one of ``terms``."""
+        postings = sorted((self._postings(term)[0] for term in set(terms)), key=len)
+        if not postings:
+            return self.posting_rows[:0]
+        rows = postings[0]
+        for other in postings[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def attribute(self, name: str) -> np.ndarray:
+        """Float64 column of listing attribute ``name``, NaN where missing or non-numeric.
+
+        Built on first use; callers index it with candidate rows to apply
+        attribute bonuses without touching every listing.
+        """
+        if name not in self._attributes:
+            self._attributes[name] = self._attribute_values(self.listings, name)
+        return self._attributes[name]
+
+    @staticmethod
+    def _attribute_values(listings: List[Dict[str, Any]], name: str) -> np.ndarray:
+        return np.array(
+            [value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+             for value in (listing.get(name) for listing in listings)],
+            dtype=np.float64
+        )
+
+    def score(self, query_terms: Iterable[str],
+              boosts: Sequence[Tuple[Sequence[int], float]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) for every candidate listing, in row order.
+
+        Candidates are the rows in the postings of ``query_terms`` or in any
+        ``(rows, weight)`` boost. A row's score is its BM25 score (repeated
+        query terms count repeatedly) plus the weight of each boost it is in.
+        """
+        rows = []
+        weights = []
+        for term, query_count in Counter(query_terms).items():
+            term_rows, term_weights, idf = self._postings(term)
+            if not len(term_rows):
+                continue
+            rows.append(term_rows)
+            weights.append(term_weights * (idf * query_count))
+        for boost_rows, weight in boosts:
+            rows.append(np.asarray(boost_rows, dtype=np.int64))
+            weights.append(np.full(len(boost_rows), weight, dtype=np.float64))
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # Sparse accumulation: only rows that appear in some posting or boost are scored
+        candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights), minlength=len(candidates))
+        return candidates, scores
+
+    @staticmethod
+    def best(rows: np.ndarray, scores: np.ndarray, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """The top_k (rows, scores) with a positive score, best first; ties keep row order."""
+        matched = scores > 0
+        rows, scores = rows[matched], scores[matched]
+        order = np.lexsort((rows, -scores))[:max(top_k, 0)]
+        return rows[order], scores[order]
+
+    def top_k(self, query_terms: Iterable[str], top_k: int = 5,
+              boosts: Sequence[Tuple[Sequence[int], float]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the best listings for ``query_terms``, best first."""
+        return self.best(*self.score(query_terms, boosts), top_k)
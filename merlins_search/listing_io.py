@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Listing I/O
+Reads enhanced listings from either the JSON array or the NDJSON format.
+"""
+
+import json
+import os
+from typing import Iterator, List, Dict, Any, Optional
+
+# Streaming ingestion writes NDJSON; prefer it when both exist
+DEFAULT_LISTINGS_PATHS = ["enhanced_listings.ndjson", "enhanced_listings.json"]
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+
+def is_ndjson(path: str) -> bool:
+    return path.endswith(NDJSON_EXTENSIONS)
+
+
+def default_listings_path() -> Optional[str]:
+    """Return the first enhanced listings file that exists, if any."""
+    for path in DEFAULT_LISTINGS_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_listings(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield listings one at a time.
+
+    NDJSON files are parsed line by line, so only one record is in memory at a
+    time and a file that is still being written can be read up to its last
+    complete line. JSON array files are parsed whole.
+    """
+    if is_ndjson(path):
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Partial record still being written
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, 'r') as f:
+            yield from json.load(f)
+
+
+def load_listings(path: str) -> List[Dict[str, Any]]:
+    """Read all listings from a JSON or NDJSON file."""
+    return list(iter_listings(path))
+
+
+def write_listings(path: str, listings: List[Dict[str, Any]]):
+    """Atomically write listings as NDJSON or a JSON array, chosen by extension."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        if is_ndjson(path):
+            for listing in listings:
+                f.write(json.dumps(listing) + '\n')
+        else:
+            json.dump(listings, f, indent=2)
+    os.replace(tmp_path, path)
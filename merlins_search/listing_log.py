@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Listing Change Log
+Durable NDJSON log of single-listing upserts and deletes made through the
+API, replayed over the base listings and embeddings on every load until the
+base data rewrites the listing.
+"""
+
+import contextlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends stay whole, but compaction is not guarded against other workers
+    fcntl = None
+
+# (inode, byte offset) just past the last record read; a new inode means the log was rewritten
+LogPosition = Tuple[int, int]
+
+
+def record_listing_id(record: Dict[str, Any]) -> Any:
+    """The listing a log record changes."""
+    return record['listing']['listing_id'] if record['op'] == 'upsert' else record['listing_id']
+
+
+def record_timestamp(record: Dict[str, Any]) -> float:
+    """When a log record was appended; 0 for an unstamped record."""
+    return record.get('logged_at', 0.0)
+
+
+def is_superseded(record: Dict[str, Any], base_updated_at: Optional[Mapping[str, float]]) -> bool:
+    """Whether the base data rewrote the record's listing after the record was logged.
+
+    ``base_updated_at`` maps listing ids (as strings) to when the base last
+    changed them, e.g. from the incremental run's manifest; listings it does
+    not know are never superseded.
+    """
+    if not base_updated_at:
+        return False
+    return base_updated_at.get(str(record_listing_id(record)), 0.0) > record_timestamp(record)
+
+
+def latest_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The last record for each listing, in the order of those last changes."""
+    latest: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        # Ids may arrive as ints or strings; either way it is the same listing
+        key = str(record_listing_id(record))
+        latest.pop(key, None)
+        latest[key] = record
+    return list(latest.values())
+
+
+class ListingChangeLog:
+    """Append-only file of {"op": "upsert", "listing": {...}} / {"op": "delete", "listing_id": ...} lines.
+
+    The record format is the one read_delta() reads; an upsert's listing
+    carries its document ``embedding`` (when embeddings are loaded) so a
+    replay never calls the embedding API. Each append is a single fsync'd
+    write, made before the change is applied, so an acknowledged change
+    survives a crash and workers appending at once never interleave. A
+    torn final line is left unread until it is complete.
+
+    Records are stamped with ``logged_at``. A record whose listing the base
+    data rewrote afterwards (see is_superseded()) is skipped by read() and
+    removed by compact(); every other record stays.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive lock against other processes appending or compacting."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def position(self) -> Optional[LogPosition]:
+        """Current end of the log; None if it does not exist."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Durably append records, stamping each with the time it was logged."""
+        logged_at = time.time()
+        data = ''.join(json.dumps({**record, 'logged_at': logged_at}, separators=(',', ':')) + '\n'
+                       for record in records).encode('utf-8')
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def read(self, since: Optional[LogPosition] = None,
+             base_updated_at: Optional[Mapping[str, float]] = None) -> Tuple[List[Dict[str, Any]], Optional[LogPosition]]:
+        """Return (records after ``since``, position after the last complete record).
+
+        Reading starts from the beginning when ``since`` is None or names a
+        different file, e.g. after compact() rewrote the log. Records
+        superseded by ``base_updated_at`` are skipped.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return [], None
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            offset = since[1] if since is not None and since[0] == inode else 0
+            f.seek(offset)
+            records = []
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Still being written
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Ignoring corrupt listing log record in {self.path}")
+                    continue
+                if not is_superseded(record, base_updated_at):
+                    records.append(record)
+        return records, (inode, offset)
+
+    def compact(self, since: Optional[LogPosition] = None,
+                base_updated_at: Optional[Mapping[str, float]] = None) -> Tuple[List[Dict[str, Any]], Optional[LogPosition]]:
+        """Drop records superseded by the base data, and by later records once those make up half the log.
+
+        Records of listings the base rewrote are always dropped, before the
+        base forgets when it did. The rewrite is atomic, like save_manifest().
+        Returns the records after ``since`` and the position of the end of the
+        (possibly rewritten) log, read under the same lock, so a caller that
+        applies them loses nothing another worker appended meanwhile.
+        """
+        with self._locked():
+            tail, position = self.read(since, base_updated_at)
+            records, _ = self.read()
+            current, _ = self.read(None, base_updated_at)
+            latest = latest_records(current)
+            if len(latest) == len(records) or (len(current) == len(records) and len(latest) * 2 > len(records)):
+                return tail, position
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                for record in latest:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            print(f"Compacted listing log {self.path}: {len(records)} records -> {len(latest)}")
+            return tail, self.position()
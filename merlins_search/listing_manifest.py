@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Listing Manifest and Deltas
+Tracks a hash of each listing's source columns between MLS drops, and the
+upsert/delete deltas that incremental runs hand to downstream stages.
+"""
+
+import json
+import os
+from typing import List, Dict, Any, Iterable, Tuple
+import pandas as pd
+
+MANIFEST_FORMAT_VERSION = 1
+
+# Listings with any other Status are dropped from the search corpus
+ACTIVE_STATUSES = {'Active'}
+
+
+def row_hashes(df: pd.DataFrame, columns: List[str]) -> List[str]:
+    """Stable per-row hash of ``columns``, computed column-wise."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return [f"{value:016x}" for value in hashes]
+
+
+def load_manifest(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read {listing number: {'hash': ..., 'active': ...}}; empty if there is no manifest yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != MANIFEST_FORMAT_VERSION:
+        print(f"Ignoring manifest {path} with unsupported format; re-enhancing everything")
+        return {}
+    return manifest['listings']
+
+
+def save_manifest(path: str, entries: Dict[str, Dict[str, Any]]):
+    """Atomically write the manifest."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'format_version': MANIFEST_FORMAT_VERSION, 'listings': entries}, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def write_delta(path: str, upserts: List[Dict[str, Any]], deletes: Iterable[Any]):
+    """Write an NDJSON delta: one {"op": "upsert", "listing": {...}} or {"op": "delete", "listing_id": ...} per line."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for listing_id in deletes:
+            f.write(json.dumps({'op': 'delete', 'listing_id': listing_id}) + '\n')
+        for listing in upserts:
+            f.write(json.dumps({'op': 'upsert', 'listing': listing}) + '\n')
+    os.replace(tmp_path, path)
+
+
+def read_delta(path: str) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """Return (upserted listings, deleted listing ids) from a delta file."""
+    upserts = []
+    deletes = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['op'] == 'upsert':
+                upserts.append(record['listing'])
+            elif record['op'] == 'delete':
+                deletes.append(record['listing_id'])
+    return upserts, deletes
+
+
+def apply_delta(listings: List[Dict[str, Any]], upserts: List[Dict[str, Any]],
+                deletes: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Apply a delta to a listing list: changed listings keep their position, new ones are appended."""
+    deleted = set(deletes)
+    upserted = {listing['listing_id']: listing for listing in upserts}
+
+    updated = []
+    for listing in listings:
+        listing_id = listing.get('listing_id')
+        if listing_id in deleted:
+            continue
+        updated.append(upserted.pop(listing_id, listing))
+    updated.extend(upserted.values())
+    return updated
@@ -4,17 +4,36 @@ Property Search API Server
 FastAPI server for semantic property search with security and performance optimizations
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Body, Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
+import copy
 import json
 import os
-import re
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Literal
 import uvicorn
 import logging
-from gemini_embedder import GeminiPropertyEmbedder
+import numpy as np
+from attribute_index import AttributeIndex, FILTER_NAMES, parse_price_range
+from cached_gemini_embedder import CachedGeminiPropertyEmbedder
+from circuit_breaker import CircuitBreaker
+from data_processor import PropertyVibeEnhancer
+from embedding_store import load_embedding_store, sidecar_path
+from embedding_text import build_embedding_text
+from index_reloader import IndexReloader
+from lexical_index import LexicalIndex, tokenize
+from listing_io import DEFAULT_LISTINGS_PATHS, default_listings_path, load_listings
+from listing_log import ListingChangeLog, LogPosition, latest_records
+from listing_manifest import ACTIVE_STATUSES, load_manifest
+from query_cache import PersistentQueryEmbeddingCache, normalize_query
+from query_parser import QueryParser
+from rank_fusion import reciprocal_rank_fusion
+from result_cache import SearchResultCache
+from vector_index import PropertyVectorIndex
 from security_config import (
     security_middleware, 
+    require_admin_key,
     configure_cors_middleware, 
     configure_trusted_hosts_middleware,
     setup_logging,
@@ -36,156 +55,473 @@ app.middleware("http")(security_middleware)
 configure_cors_middleware(app)
 configure_trusted_hosts_middleware(app)
 
-# Global variables for property data
-properties_data = []
-embeddings_data = None
+# Query embedder, created once embeddings are first loaded
 gemini_embedder = None
 
+# Embedding artifacts: the binary store is preferred over the JSON file
+EMBEDDING_STORE_PATH = "property_embeddings_gemini.npy"
+EMBEDDINGS_JSON_PATH = "property_embeddings_gemini.json"
+
+# Seconds between checks of the listings and embeddings files for changes; 0 disables hot reload
+INDEX_RELOAD_INTERVAL = float(os.getenv('INDEX_RELOAD_INTERVAL', '5'))
+
+# Listing fields searched by text search
+LEXICAL_FIELDS = ['enhanced_description', 'original_description', 'architectural_style', 'address']
+
+# Style words that earn the cottage/cabin bonus in text search
+COZY_STYLE_TERMS = ['cottage', 'cabin', 'rustic', 'cozy']
+
+# Candidates taken from each retriever before hybrid fusion
+HYBRID_CANDIDATES = 100
+
+# Most searches accepted by one /search/batch request
+BATCH_MAX_QUERIES = 50
+
+# Query embedding cache limits: entries, bytes of float32 vectors, and seconds an entry lives
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '10000'))
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '86400'))
+
+# On-disk query embedding cache shared by all workers and kept across restarts; empty path disables it
+QUERY_CACHE_PATH = os.getenv('QUERY_CACHE_PATH', 'query_embedding_cache.sqlite3')
+QUERY_CACHE_PERSISTENT_ENTRIES = int(os.getenv('QUERY_CACHE_PERSISTENT_ENTRIES', '100000'))
+PRECOMPUTED_QUERIES_PATH = "precomputed_queries.json"
+
+# Seconds a search may spend embedding its query before falling back to text search
+QUERY_EMBED_BUDGET = float(os.getenv('QUERY_EMBED_BUDGET', '2.0'))
+# Race a second request against calls slower than the recent p95
+QUERY_EMBED_HEDGE = os.getenv('QUERY_EMBED_HEDGE', 'false').lower() == 'true'
+# The breaker opens after this many consecutive failed or slow embedding calls,
+# and sends searches straight to text search until a probe succeeds
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '1.5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+
+# Finished /search responses kept for repeated searches; emptied on every data reload
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '10000'))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '300'))
+result_cache = SearchResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+# Durable log of changes made through PUT/DELETE /listings, replayed over the data files on every load
+# until an incremental data_processor.py run changes the same listing
+LISTING_LOG_PATH = os.getenv('LISTING_LOG_PATH', 'listing_updates.ndjson')
+listing_log = ListingChangeLog(LISTING_LOG_PATH)
+# That run's manifest records when it last changed each listing
+LISTING_MANIFEST_PATH = os.getenv('LISTING_MANIFEST_PATH', 'enhanced_listings.manifest.json')
+# Listing changes kept as tombstones and appended rows before the indexes are compacted
+LISTING_COMPACT_AFTER = int(os.getenv('LISTING_COMPACT_AFTER', '1000'))
+
+# Serialises listing changes, log replays and compaction swaps within this worker
+listing_update_lock = threading.Lock()
+compaction_thread: Optional[threading.Thread] = None
+
+# Turns one MLS record into an enhanced listing, as data_processor.py does for the whole CSV
+listing_enhancer = PropertyVibeEnhancer()
+
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=500, description="Search query")
     limit: int = Field(default=5, ge=1, le=50, description="Maximum number of results")
-    property_type: Optional[str] = Field(None, description="Filter by property type")
-    price_range: Optional[str] = Field(None, description="Filter by price range")
+    property_type: Optional[str] = Field(None, description="Filter by property type (matched against architectural style)")
+    price_range: Optional[str] = Field(None, description="Filter by price range, e.g. '300k-500k', '500k+' or 'under 400k'")
+    min_price: Optional[float] = Field(None, ge=0, description="Minimum price")
+    max_price: Optional[float] = Field(None, ge=0, description="Maximum price")
+    min_bedrooms: Optional[float] = Field(None, ge=0, description="Minimum bedrooms")
+    min_bathrooms: Optional[float] = Field(None, ge=0, description="Minimum bathrooms")
+    min_sqft: Optional[float] = Field(None, ge=0, description="Minimum square footage")
+    max_sqft: Optional[float] = Field(None, ge=0, description="Maximum square footage")
+    min_acres: Optional[float] = Field(None, ge=0, description="Minimum lot size in acres")
+    max_acres: Optional[float] = Field(None, ge=0, description="Maximum lot size in acres")
+    max_days_on_market: Optional[float] = Field(None, ge=0, description="Maximum days on market")
+    city: Optional[str] = Field(None, max_length=100, description="Filter by city")
+    zip_code: Optional[str] = Field(None, max_length=10, description="Filter by zip code")
+    architectural_style: Optional[str] = Field(None, max_length=100, description="Filter by architectural style")
+    status: Optional[str] = Field(None, max_length=50, description="Filter by listing status")
+    mode: Literal['auto', 'semantic', 'text', 'hybrid'] = Field(
+        default='auto', description="Retrieval mode; auto uses semantic search when embeddings are loaded"
+    )
+    parse_query: bool = Field(
+        default=True, description="Turn prices, beds, baths, acreage, places and styles in the query into filters"
+    )
 
 class SearchResponse(BaseModel):
     query: str
     results: List[Dict[str, Any]]
     total_found: int
+    filters: Dict[str, Any] = {}
 
-def load_property_data():
-    """Load property data from enhanced_listings.json"""
-    global properties_data
-    
-    json_path = "enhanced_listings.json"
-    if os.path.exists(json_path):
-        with open(json_path, 'r') as f:
-            properties_data = json.load(f)
-        print(f"Loaded {len(properties_data)} properties")
-    else:
-        print(f"Property data file not found: {json_path}")
+class BatchSearchRequest(BaseModel):
+    searches: List[SearchRequest] = Field(..., min_length=1, max_length=BATCH_MAX_QUERIES,
+                                          description="Searches to run, each with its own limit and filters")
+
+class BatchSearchResponse(BaseModel):
+    responses: List[SearchResponse]
+    total_searches: int
 
-def load_embeddings_data():
-    """Load embeddings data if available"""
-    global embeddings_data, gemini_embedder
+class ListingUpdateResponse(BaseModel):
+    listing_id: int
+    status: Literal['upserted', 'deleted']
+    index_version: int
+
+class SearchIndexes:
+    """One generation of everything a search reads, built together and never modified.
     
-    embeddings_path = "property_embeddings_gemini.json"
-    if os.path.exists(embeddings_path):
-        with open(embeddings_path, 'r') as f:
-            embeddings_data = json.load(f)
-        print(f"Loaded embeddings for {len(embeddings_data.get('listings', []))} properties")
+    Reloads build a new instance off the request path and publish it by
+    rebinding ``search_indexes``. A request reads that reference once and
+    passes it down, so it sees one consistent generation even if a reload
+    lands mid-search; the old generation is freed when its last request ends.
+    
+    Single-listing changes also publish new generations, via with_changes(),
+    which shares the big arrays instead of rebuilding them; compacted()
+    later folds the changes into a clean rebuild.
+    """
+    
+    def __init__(self, properties_data: Optional[List[Dict[str, Any]]] = None,
+                 embeddings_data: Optional[Dict[str, Any]] = None,
+                 embedding_index: Optional[PropertyVectorIndex] = None, version: int = 0):
+        self.version = version
+        self.properties_data = properties_data or []
+        # Tokenise once here; text search then only reads the query terms' postings
+        self.lexical_index = LexicalIndex(self.properties_data, LEXICAL_FIELDS)
+        self.attribute_index = AttributeIndex(self.properties_data)
+        # Cities, zips and styles the parser recognises come from the loaded listings
+        self.query_parser = QueryParser.from_attribute_index(self.attribute_index)
+        self.embeddings_data = embeddings_data
+        self.embedding_index = embedding_index
+        # Filters on semantic search select rows of the embedding matrix
+        self.embedding_attribute_index = (AttributeIndex(embedding_index.listings)
+                                          if embedding_index is not None else None)
+        # End of the listing log records applied to this generation, and changes since its last compaction
+        self.log_position: Optional[LogPosition] = None
+        self.pending_changes = 0
+        # Listing id -> when the data files last changed it; older listing log records for it are not applied
+        self.base_updated_at: Dict[str, float] = {}
+    
+    @staticmethod
+    def _live_rows(listing_ids: np.ndarray, attribute_index: AttributeIndex, listing_id: Any) -> np.ndarray:
+        rows = np.flatnonzero(listing_ids == listing_id)
+        return rows if attribute_index.alive is None else rows[attribute_index.alive[rows]]
+    
+    def live_rows(self, listing_id: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """(properties_data rows, embedding index rows) currently holding ``listing_id``"""
+        rows = self._live_rows(self.lexical_index.listing_ids, self.attribute_index, listing_id)
+        vector_rows = np.empty(0, dtype=np.intp)
+        if self.embedding_index is not None:
+            vector_rows = self._live_rows(self.embedding_index.listing_ids, self.embedding_attribute_index,
+                                          listing_id)
+        return rows, vector_rows
+    
+    def with_changes(self, records: List[Dict[str, Any]]) -> 'SearchIndexes':
+        """A new generation with listing log records applied; this one is left as it is.
         
-        # Initialize Gemini embedder for query embeddings
-        try:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY environment variable is required")
-            gemini_embedder = GeminiPropertyEmbedder(api_key)
-            print("Gemini embedder initialized for query processing")
-        except Exception as e:
-            print(f"Warning: Could not initialize Gemini embedder: {e}")
-            gemini_embedder = None
+        A deleted or replaced listing's rows become tombstones, and an upserted
+        listing is appended as a new row to the listings, postings, attribute
+        columns and embedding matrix, so nothing else is re-tokenised or
+        re-embedded. Upserts identical to the current listing are skipped,
+        which makes replaying a record twice harmless.
+        """
+        deleted_rows, deleted_vector_rows = [], []
+        listings, vector_listings, vectors = [], [], []
+        changes = 0
+        for record in latest_records(records):
+            if record['op'] == 'upsert':
+                listing = {key: value for key, value in record['listing'].items() if key != 'embedding'}
+                embedding = record['listing'].get('embedding')
+                rows, vector_rows = self.live_rows(listing['listing_id'])
+                if (len(rows) and self.properties_data[rows[0]] == listing
+                        and (self.embedding_index is None or not embedding or len(vector_rows))):
+                    continue
+                listings.append(listing)
+                if self.embedding_index is not None and embedding:
+                    vector_listings.append(listing)
+                    vectors.append(embedding)
+            else:
+                rows, vector_rows = self.live_rows(record['listing_id'])
+                if not len(rows) and not len(vector_rows):
+                    continue
+            deleted_rows.extend(rows)
+            deleted_vector_rows.extend(vector_rows)
+            changes += 1
+        if not changes:
+            return self
         
-        return True
-    return False
+        indexes = copy.copy(self)
+        indexes.lexical_index = self.lexical_index.with_appended(listings)
+        indexes.properties_data = indexes.lexical_index.listings
+        indexes.attribute_index = self.attribute_index.with_changes(listings, deleted_rows)
+        indexes.query_parser = QueryParser.from_attribute_index(indexes.attribute_index)
+        if self.embedding_index is not None:
+            indexes.embedding_index = self.embedding_index.with_appended(vectors, vector_listings)
+            indexes.embedding_attribute_index = self.embedding_attribute_index.with_changes(vector_listings,
+                                                                                            deleted_vector_rows)
+        indexes.pending_changes = self.pending_changes + changes
+        return indexes
+    
+    def compacted(self) -> 'SearchIndexes':
+        """A clean generation of the live rows: tombstones dropped, postings and BM25 statistics rebuilt"""
+        alive = self.attribute_index.alive
+        properties_data = (self.properties_data if alive is None
+                           else [listing for listing, keep in zip(self.properties_data, alive) if keep])
+        embedding_index = self.embedding_index
+        if embedding_index is not None and self.embedding_attribute_index.alive is not None:
+            embedding_index = embedding_index.subset(np.flatnonzero(self.embedding_attribute_index.alive))
+        indexes = SearchIndexes(properties_data, self.embeddings_data, embedding_index, self.version)
+        indexes.log_position = self.log_position
+        indexes.base_updated_at = self.base_updated_at
+        return indexes
 
-def text_search_properties(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """Fallback text-based search when embeddings aren't available"""
+# The generation requests read; replaced as a whole, never modified in place
+search_indexes = SearchIndexes()
+
+def index_source_paths() -> List[str]:
+    """Files whose changes trigger a reload"""
+    return DEFAULT_LISTINGS_PATHS + [EMBEDDING_STORE_PATH, sidecar_path(EMBEDDING_STORE_PATH), EMBEDDINGS_JSON_PATH,
+                                     LISTING_MANIFEST_PATH]
+
+def load_base_updated_at() -> Dict[str, float]:
+    """Listing id -> when an incremental run last changed it, from the manifest; empty without one"""
+    try:
+        manifest = load_manifest(LISTING_MANIFEST_PATH)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read {LISTING_MANIFEST_PATH} ({e}); replaying every listing change")
+        return {}
+    return {key: entry.get('updated_at', 0.0) for key, entry in manifest.items()}
+
+def build_search_indexes() -> SearchIndexes:
+    """Load enhanced_listings.ndjson / .json and the embeddings into a new SearchIndexes"""
+    properties_data = []
+    json_path = default_listings_path()
+    if json_path:
+        properties_data = load_listings(json_path)
+        print(f"Loaded {len(properties_data)} properties from {json_path}")
+    else:
+        print(f"Property data file not found: {' or '.join(DEFAULT_LISTINGS_PATHS)}")
+    
+    embeddings_data = None
+    embedding_index = None
+    if os.path.exists(EMBEDDING_STORE_PATH):
+        # Binary store: the matrix is memory-mapped, not parsed
+        embeddings_data = load_embedding_store(EMBEDDING_STORE_PATH)
+        embedding_index = PropertyVectorIndex.from_embedding_store(embeddings_data)
+    elif os.path.exists(EMBEDDINGS_JSON_PATH):
+        with open(EMBEDDINGS_JSON_PATH, 'r') as f:
+            embeddings_data = json.load(f)
+        # Build the normalised embedding matrix once, not per search
+        embedding_index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+    if embedding_index is not None:
+        print(f"Loaded embeddings for {len(embedding_index)} properties")
+    
+    # Changes made through the API since the data files were written
+    indexes = SearchIndexes(properties_data, embeddings_data, embedding_index)
+    indexes.base_updated_at = load_base_updated_at()
+    # Compacting here also drops the records of listings these files changed since
+    records, position = listing_log.compact(None, indexes.base_updated_at)
+    indexes = indexes.with_changes(records)
+    indexes.log_position = position
+    if indexes.pending_changes:
+        print(f"Replayed {indexes.pending_changes} listing changes from {listing_log.path}")
+        indexes = indexes.compacted()
+    return indexes
+
+def init_query_embedder():
+    """Initialize the Gemini embedder for query embeddings"""
+    global gemini_embedder
+    
+    try:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is required")
+        # Repeated queries are answered from memory instead of another API round trip
+        persistent_cache = None
+        if QUERY_CACHE_PATH:
+            persistent_cache = PersistentQueryEmbeddingCache(QUERY_CACHE_PATH,
+                                                             max_entries=QUERY_CACHE_PERSISTENT_ENTRIES)
+        gemini_embedder = CachedGeminiPropertyEmbedder(api_key, cache_size=QUERY_CACHE_SIZE,
+                                                       cache_max_bytes=QUERY_CACHE_MAX_BYTES,
+                                                       cache_ttl=QUERY_CACHE_TTL,
+                                                       persistent_cache=persistent_cache,
+                                                       latency_budget=QUERY_EMBED_BUDGET,
+                                                       breaker=CircuitBreaker(
+                                                           failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                                                           reset_timeout=BREAKER_RESET_SECONDS,
+                                                           slow_call_threshold=BREAKER_SLOW_CALL_SECONDS),
+                                                       hedge=QUERY_EMBED_HEDGE)
+        gemini_embedder.load_precomputed_queries(PRECOMPUTED_QUERIES_PATH)
+        print("Gemini embedder initialized for query processing")
+    except Exception as e:
+        print(f"Warning: Could not initialize Gemini embedder: {e}")
+        gemini_embedder = None
+
+def replay_listing_log(indexes: SearchIndexes) -> SearchIndexes:
+    """``indexes`` with the listing log records written after its log position (and its base data) applied"""
+    records, position = listing_log.read(indexes.log_position, indexes.base_updated_at)
+    indexes = indexes.with_changes(records)
+    indexes.log_position = position
+    return indexes
+
+def swap_search_indexes(indexes: SearchIndexes):
+    """Make ``indexes`` current with one reference swap. Caller holds listing_update_lock"""
+    global search_indexes
+    
+    if indexes.embedding_index is not None and gemini_embedder is None:
+        init_query_embedder()
+    indexes.version = search_indexes.version + 1
+    search_indexes = indexes
+    # Results cached before the swap were scored against the old generation
+    result_cache.invalidate()
+    if indexes.pending_changes >= LISTING_COMPACT_AFTER:
+        start_compaction()
+
+def publish_search_indexes(indexes: SearchIndexes):
+    """Make ``indexes`` current, with any listing changes logged since it was built; running requests keep the generation they took"""
+    with listing_update_lock:
+        swap_search_indexes(replay_listing_log(indexes))
+
+def refresh_search_indexes():
+    """Apply listing changes logged by other workers since the current generation"""
+    with listing_update_lock:
+        indexes = replay_listing_log(search_indexes)
+        if indexes is not search_indexes:
+            swap_search_indexes(indexes)
+
+def apply_listing_change(record: Dict[str, Any]) -> SearchIndexes:
+    """Log one listing change durably, then publish a generation that includes it"""
+    with listing_update_lock:
+        listing_log.append([record])
+        # Also picks up anything other workers logged before it
+        indexes = replay_listing_log(search_indexes)
+        if indexes is not search_indexes:
+            swap_search_indexes(indexes)
+        return indexes
+
+def compact_search_indexes():
+    """Replace the current generation with a compacted rebuild, and drop superseded log records
+    
+    The rebuild runs outside the lock, so searches and listing changes carry
+    on meanwhile; changes logged during it are replayed onto the result.
+    """
+    indexes = search_indexes.compacted()
+    with listing_update_lock:
+        records, position = listing_log.compact(indexes.log_position, indexes.base_updated_at)
+        indexes = indexes.with_changes(records)
+        indexes.log_position = position
+        swap_search_indexes(indexes)
+    print(f"Compacted search indexes: {len(indexes.properties_data)} properties, "
+          f"{indexes.pending_changes} changes since")
+
+def start_compaction():
+    """Compact in a background thread unless a compaction is already running"""
+    global compaction_thread
+    if compaction_thread is None or not compaction_thread.is_alive():
+        compaction_thread = threading.Thread(target=compact_search_indexes, name='index-compaction', daemon=True)
+        compaction_thread.start()
+
+# Rebuilds and publishes the indexes in the background when their files change,
+# and replays listing changes made through other workers on every poll
+index_reloader = IndexReloader(index_source_paths, build_search_indexes, publish_search_indexes,
+                               INDEX_RELOAD_INTERVAL, refresh=refresh_search_indexes)
+
+def request_filters(request: SearchRequest) -> Dict[str, Any]:
+    """The attribute filters set on a search request"""
+    return {name: getattr(request, name) for name in FILTER_NAMES if getattr(request, name) is not None}
+
+def result_cache_key(request: SearchRequest) -> Tuple[Any, ...]:
+    """Result cache key: normalised query, limit, mode, query parsing and every filter field"""
+    return (normalize_query(request.query), request.limit, request.mode, request.parse_query,
+            tuple(getattr(request, name) for name in FILTER_NAMES))
+
+def format_property(prop: Dict[str, Any], score: float, search_type: str) -> Dict[str, Any]:
+    """Shape a listing for the search response"""
+    return {
+        'id': prop.get('listing_id'),
+        'title': f"{prop.get('bedrooms', '?')} bed, {prop.get('bathrooms', '?')} bath home",
+        'address': prop.get('address', 'Address not available'),
+        'price': f"${prop.get('price', 0):,.0f}" if prop.get('price') else "Price not available",
+        'image': "https://images.unsplash.com/photo-1564013799919-ab600027ffc6?w=400",  # Placeholder
+        'bedrooms': prop.get('bedrooms', '?'),
+        'bathrooms': prop.get('bathrooms', '?'),
+        'sqft': prop.get('sqft', 0),
+        'description': prop.get('enhanced_description', prop.get('original_description', ''))[:200] + "...",
+        'similarity_score': score,
+        'search_type': search_type
+    }
+
+def text_rank_properties(query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None,
+                         indexes: Optional[SearchIndexes] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of properties_data and scores of the best text matches passing ``filters``, best first"""
+    
+    indexes = indexes or search_indexes
+    index = indexes.lexical_index
     
     query_lower = query.lower()
-    query_words = re.findall(r'\w+', query_lower)
+    query_words = tokenize(query_lower)
     
-    scored_properties = []
+    # Listings with a cozy style word are candidates even without a query word
+    boosts = []
+    if any(type_word in query_lower for type_word in ['cottage', 'cabin', 'shack']):
+        boosts.append((index.rows_with_any(COZY_STYLE_TERMS), 10))
     
-    for prop in properties_data:
-        score = 0
-        searchable_text = ""
-        
-        # Build searchable text
-        if prop.get('enhanced_description'):
-            searchable_text += prop['enhanced_description'].lower() + " "
-        if prop.get('original_description'):
-            searchable_text += prop['original_description'].lower() + " "
-        if prop.get('architectural_style'):
-            searchable_text += prop['architectural_style'].lower() + " "
-        if prop.get('address'):
-            searchable_text += prop['address'].lower() + " "
-        
-        # Score based on word matches
-        for word in query_words:
-            # Exact word matches
-            word_count = searchable_text.count(word)
-            score += word_count * 2
-            
-            # Partial matches
-            if word in searchable_text:
-                score += 1
-        
-        # Bonus for price range matches
-        if any(price_word in query_lower for price_word in ['luxury', 'expensive', 'high-end']):
-            if prop.get('price', 0) > 800000:
-                score += 5
-        
-        if any(price_word in query_lower for price_word in ['affordable', 'cheap', 'budget']):
-            if prop.get('price', 0) < 400000:
-                score += 5
-        
-        # Bonus for property type matches
-        if any(type_word in query_lower for type_word in ['cottage', 'cabin', 'shack']):
-            if any(style_word in searchable_text for style_word in ['cottage', 'cabin', 'rustic', 'cozy']):
-                score += 10
-        
-        if any(type_word in query_lower for type_word in ['estate', 'mansion', 'luxury']):
-            if prop.get('sqft', 0) > 3000 or prop.get('lot_acres', 0) > 2:
-                score += 10
-        
-        if score > 0:
-            # Format property for response
-            result = {
-                'id': prop.get('listing_id'),
-                'title': f"{prop.get('bedrooms', '?')} bed, {prop.get('bathrooms', '?')} bath home",
-                'address': prop.get('address', 'Address not available'),
-                'price': f"${prop.get('price', 0):,.0f}" if prop.get('price') else "Price not available",
-                'image': "https://images.unsplash.com/photo-1564013799919-ab600027ffc6?w=400",  # Placeholder
-                'bedrooms': prop.get('bedrooms', '?'),
-                'bathrooms': prop.get('bathrooms', '?'),
-                'sqft': prop.get('sqft', 0),
-                'description': prop.get('enhanced_description', prop.get('original_description', ''))[:200] + "...",
-                'similarity_score': score / 100.0,  # Normalize score
-                'search_type': 'text_match'
-            }
-            scored_properties.append(result)
-    
-    # Sort by score and return top results
-    scored_properties.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return scored_properties[:limit]
-
-def embedding_search_properties(query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    # BM25 over the query terms' postings, plus the style bonus
+    rows, scores = index.score(query_words, boosts)
+    
+    # Attribute filters, applied to the candidates before the bonuses
+    mask = indexes.attribute_index.mask(filters or {})
+    if mask is not None:
+        keep = mask[rows]
+        rows, scores = rows[keep], scores[keep]
+    
+    # Bonus for price range matches, vectorised over the candidates' attributes
+    price = index.attribute('price')[rows]
+    if any(price_word in query_lower for price_word in ['luxury', 'expensive', 'high-end']):
+        scores += np.where(price > 800000, 5, 0)
+    
+    if any(price_word in query_lower for price_word in ['affordable', 'cheap', 'budget']):
+        scores += np.where(price < 400000, 5, 0)
+    
+    # Bonus for property type matches
+    if any(type_word in query_lower for type_word in ['estate', 'mansion', 'luxury']):
+        large = (index.attribute('sqft')[rows] > 3000) | (index.attribute('lot_acres')[rows] > 2)
+        scores += np.where(large, 10, 0)
+    
+    return index.best(rows, scores, limit)
+
+def text_search_properties(query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None,
+                           indexes: Optional[SearchIndexes] = None) -> List[Dict[str, Any]]:
+    """Fallback text-based search when embeddings aren't available"""
+    indexes = indexes or search_indexes
+    rows, scores = text_rank_properties(query, limit, filters, indexes)
+    return [format_property(indexes.properties_data[row], float(score) / 100.0, 'text_match')  # Normalize score
+            for row, score in zip(rows, scores)]
+
+def embedding_search_properties(query: str, limit: int = 5,
+                                filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """Semantic search using embeddings (when available)"""
-    if not embeddings_data or not gemini_embedder:
+    indexes = search_indexes
+    if not indexes.embeddings_data or not gemini_embedder:
         print("Embeddings not available, falling back to text search")
-        return text_search_properties(query, limit)
+        return text_search_properties(query, limit, filters, indexes)
+    
+    return semantic_search_with_embedding(query, gemini_embedder.create_embedding(query), limit, filters, indexes)
+
+def semantic_search_with_embedding(query: str, query_embedding: Optional[List[float]], limit: int = 5,
+                                   filters: Optional[Dict[str, Any]] = None,
+                                   indexes: Optional[SearchIndexes] = None) -> List[Dict[str, Any]]:
+    """Semantic search for an already computed query embedding; text search when it is missing"""
+    indexes = indexes or search_indexes
+    if query_embedding is None:
+        print("Failed to create query embedding, falling back to text search")
+        return text_search_properties(query, limit, filters, indexes)
     
     try:
-        # Use the Gemini embedder's search function
-        results = gemini_embedder.search_similar_properties(query, embeddings_data, top_k=limit)
+        # Only rows passing the filters are scored
+        rows = indexes.embedding_attribute_index.rows(filters or {})
+        if rows is not None and len(rows) == 0:
+            return []
+        
+        results = indexes.embedding_index.search(query_embedding, limit, rows=rows)
         
         # Format results for API response
-        formatted_results = []
-        for result in results:
-            formatted_result = {
-                'id': result.get('listing_id'),
-                'title': f"{result.get('bedrooms', '?')} bed, {result.get('bathrooms', '?')} bath home",
-                'address': result.get('address', 'Address not available'),
-                'price': f"${result.get('price', 0):,.0f}" if result.get('price') else "Price not available",
-                'image': "https://images.unsplash.com/photo-1564013799919-ab600027ffc6?w=400",  # Placeholder
-                'bedrooms': result.get('bedrooms', '?'),
-                'bathrooms': result.get('bathrooms', '?'),
-                'sqft': result.get('sqft', 0),
-                'description': result.get('enhanced_description', result.get('original_description', ''))[:200] + "...",
-                'similarity_score': result.get('similarity_score', 0),
-                'search_type': 'semantic_embedding'
-            }
-            formatted_results.append(formatted_result)
+        formatted_results = [format_property(result, result.get('similarity_score', 0), 'semantic_embedding')
+                             for result in results]
         
         print(f"Semantic search returned {len(formatted_results)} results for query: '{query}'")
         return formatted_results
@@ -193,43 +529,207 @@ def embedding_search_properties(query: str, limit: int = 5) -> List[Dict[str, An
     except Exception as e:
         print(f"Error in embedding search: {e}")
         print("Falling back to text search")
-        return text_search_properties(query, limit)
+        return text_search_properties(query, limit, filters, indexes)
+
+def hybrid_search_properties(query: str, limit: int = 5,
+                             filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Text and semantic candidates fused by reciprocal rank fusion.
+    
+    Each retriever contributes its top HYBRID_CANDIDATES; exact terms such as
+    street names reach the results through the text ranking even when the
+    embedding misses them. Without embeddings or a query embedding the text
+    ranking is used alone.
+    """
+    indexes = search_indexes
+    query_embedding = None
+    if indexes.embedding_index is not None and gemini_embedder:
+        query_embedding = gemini_embedder.create_embedding(query)
+    return hybrid_search_with_embedding(query, query_embedding, limit, filters, indexes)
+
+def hybrid_search_with_embedding(query: str, query_embedding: Optional[List[float]], limit: int = 5,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 indexes: Optional[SearchIndexes] = None) -> List[Dict[str, Any]]:
+    """Hybrid search for an already computed query embedding (None: text ranking only)"""
+    indexes = indexes or search_indexes
+    vector_rows = None
+    if indexes.embedding_index is not None:
+        if query_embedding:
+            vector_rows, _ = indexes.embedding_index.top_k(query_embedding, HYBRID_CANDIDATES,
+                                                           indexes.embedding_attribute_index.rows(filters or {}))
+        else:
+            print("Query embedding unavailable, hybrid search using text ranking only")
+    return fuse_hybrid_results(query, vector_rows, limit, filters, indexes)
+
+def fuse_hybrid_results(query: str, vector_rows: Optional[np.ndarray], limit: int = 5,
+                        filters: Optional[Dict[str, Any]] = None,
+                        indexes: Optional[SearchIndexes] = None) -> List[Dict[str, Any]]:
+    """Fuse the text ranking with a semantic ranking (embedding index rows, best first; None: text only)"""
+    indexes = indexes or search_indexes
+    index = indexes.lexical_index
+    text_rows, _ = text_rank_properties(query, HYBRID_CANDIDATES, filters, indexes)
+    text_ids = index.listing_ids[text_rows]
+    rankings = [text_ids]
+    
+    if vector_rows is None:
+        vector_rows = np.empty(0, dtype=np.intp)
+        vector_ids = vector_rows
+    else:
+        vector_ids = indexes.embedding_index.listing_ids[vector_rows]
+        rankings.append(vector_ids)
+    
+    fused_ids, scores = reciprocal_rank_fusion(rankings, limit)
+    
+    results = []
+    for listing_id, score in zip(fused_ids, scores):
+        # Prefer the full listing; semantic-only hits come from the embedding index
+        text_match = np.flatnonzero(text_ids == listing_id)
+        if len(text_match):
+            prop = indexes.properties_data[text_rows[text_match[0]]]
+        else:
+            prop = indexes.embedding_index.listings[vector_rows[np.flatnonzero(vector_ids == listing_id)[0]]]
+        results.append(format_property(prop, float(score), 'hybrid'))
+    
+    print(f"Hybrid search fused {len(rankings)} rankings into {len(results)} results for query: '{query}'")
+    return results
+
+def batch_search_properties(searches: List[Tuple[str, str, int, Dict[str, Any]]],
+                            query_embeddings: List[Optional[List[float]]],
+                            indexes: Optional[SearchIndexes] = None) -> List[List[Dict[str, Any]]]:
+    """Results for many (search text, mode, limit, filters) searches.
+    
+    The semantic rankings of every semantic and hybrid search with a query
+    embedding come from one PropertyVectorIndex.top_k_batch call, so the
+    unfiltered ones share a single matrix product. Searches without an
+    embedding fall back to text search (hybrid: text ranking only).
+    """
+    indexes = indexes or search_indexes
+    embedding_index = indexes.embedding_index
+    vector_positions = [i for i, (_, mode, _, _) in enumerate(searches)
+                        if mode in ('semantic', 'hybrid') and query_embeddings[i] and embedding_index is not None]
+    rankings = {}
+    if vector_positions:
+        batch = embedding_index.top_k_batch(
+            [query_embeddings[i] for i in vector_positions],
+            [searches[i][2] if searches[i][1] == 'semantic' else HYBRID_CANDIDATES for i in vector_positions],
+            [indexes.embedding_attribute_index.rows(searches[i][3]) for i in vector_positions]
+        )
+        rankings = dict(zip(vector_positions, batch))
+    
+    results = []
+    for i, (search_text, mode, limit, filters) in enumerate(searches):
+        if mode == 'hybrid':
+            vector_rows = rankings[i][0] if i in rankings else None
+            results.append(fuse_hybrid_results(search_text, vector_rows, limit, filters, indexes))
+        elif i in rankings:
+            rows, scores = rankings[i]
+            results.append([format_property(embedding_index.listings[row], float(score), 'semantic_embedding')
+                            for row, score in zip(rows, scores)])
+        else:
+            results.append(text_search_properties(search_text, limit, filters, indexes))
+    
+    print(f"Batch search ran {len(searches)} searches ({len(rankings)} scored against the embedding matrix)")
+    return results
 
 @app.get("/")
 async def root():
-    return {"message": "Property Search API", "status": "running", "properties_loaded": len(properties_data)}
+    return {"message": "Property Search API", "status": "running",
+            "properties_loaded": len(search_indexes.properties_data)}
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "properties_loaded": len(properties_data),
-        "embeddings_available": embeddings_data is not None
+        "properties_loaded": len(search_indexes.properties_data),
+        "embeddings_available": search_indexes.embeddings_data is not None,
+        "index": index_reloader.stats(),
+        "query_cache": gemini_embedder.query_cache.stats() if gemini_embedder else None,
+        "persistent_query_cache": (gemini_embedder.persistent_cache.stats()
+                                   if gemini_embedder and gemini_embedder.persistent_cache else None),
+        "query_embeddings_coalesced": gemini_embedder.in_flight.coalesced if gemini_embedder else 0,
+        "embedding_breaker": (gemini_embedder.breaker.stats()
+                              if gemini_embedder and gemini_embedder.breaker else None),
+        "result_cache": result_cache.stats(),
+        "listing_updates": {
+            "changes_since_compaction": search_indexes.pending_changes,
+            "tombstones": search_indexes.attribute_index.deleted,
+            "compacting": compaction_thread is not None and compaction_thread.is_alive()
+        }
     }
 
+def prepare_search(request: SearchRequest,
+                   indexes: Optional[SearchIndexes] = None) -> Tuple[str, str, str, Dict[str, Any]]:
+    """Validate a search request into (query, search text, mode, filters)"""
+    indexes = indexes or search_indexes
+    # Validate and sanitize input
+    query = request.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    # Auto uses embedding search if available, otherwise falls back to text search
+    mode = request.mode
+    if mode == 'auto':
+        mode = 'semantic' if indexes.embeddings_data and gemini_embedder else 'text'
+    
+    filters = request_filters(request)
+    if request.price_range:
+        parse_price_range(request.price_range)  # Reject a malformed range with a 400 up front
+    
+    # Constraints in the query become prefilters; only the residual vibe text is searched
+    search_text = query
+    if request.parse_query:
+        parsed_filters, residual = indexes.query_parser.parse(query)
+        filters = {**parsed_filters, **filters}  # Explicit request fields win
+        search_text = residual or query
+    
+    return query, search_text, mode, filters
+
 @app.post("/search", response_model=SearchResponse)
 async def search_properties(request: SearchRequest):
     """Search properties by query with enhanced error handling"""
     
     try:
-        if not properties_data:
+        # The version is read before the indexes, so a result from an old generation is never cached as new
+        index_version = result_cache.version
+        # One generation serves the whole request, even if a reload is published meanwhile
+        indexes = search_indexes
+        if not indexes.properties_data:
             raise HTTPException(status_code=503, detail="Property data not loaded")
         
-        # Validate and sanitize input
-        query = request.query.strip()
-        if not query:
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        # Repeated searches skip parsing, embedding and scoring entirely
+        cache_key = result_cache_key(request)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            filters, results = cached
+            return SearchResponse(query=request.query.strip(), results=results, total_found=len(results),
+                                  filters=filters)
+        
+        query, search_text, mode, filters = prepare_search(request, indexes)
         
-        # Use embedding search if available, otherwise fall back to text search
-        if embeddings_data and gemini_embedder:
-            results = embedding_search_properties(query, request.limit)
+        # The query embedding is awaited, so the loop serves other requests while
+        # Gemini answers; scoring is CPU-bound and runs in the threadpool
+        degraded = False
+        if mode in ('semantic', 'hybrid') and indexes.embeddings_data and gemini_embedder:
+            query_embedding = await gemini_embedder.create_embedding_async(search_text)
+            degraded = query_embedding is None
+            search = semantic_search_with_embedding if mode == 'semantic' else hybrid_search_with_embedding
+            results = await run_in_threadpool(search, search_text, query_embedding, request.limit, filters, indexes)
+        elif mode == 'hybrid':
+            results = await run_in_threadpool(hybrid_search_with_embedding, search_text, None, request.limit,
+                                              filters, indexes)
         else:
-            results = text_search_properties(query, request.limit)
+            if mode == 'semantic':
+                print("Embeddings not available, falling back to text search")
+            results = await run_in_threadpool(text_search_properties, search_text, request.limit, filters, indexes)
+        
+        # A text fallback during an embedding outage is not cached, so semantic results return with the API
+        if not degraded:
+            result_cache.put(cache_key, (filters, results), index_version)
         
         return SearchResponse(
             query=query,
             results=results,
-            total_found=len(results)
+            total_found=len(results),
+            filters=filters
         )
         
     except HTTPException:
@@ -240,10 +740,96 @@ async def search_properties(request: SearchRequest):
         logging.error(f"Search error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_properties_batch(request: BatchSearchRequest):
+    """Run up to BATCH_MAX_QUERIES searches in one request
+    
+    Query embeddings missing from the cache are fetched together through
+    batchEmbedContents, and the searches are scored in one threadpool call
+    that multiplies all their query vectors against the matrix at once.
+    """
+    
+    try:
+        indexes = search_indexes
+        if not indexes.properties_data:
+            raise HTTPException(status_code=503, detail="Property data not loaded")
+        
+        prepared = [prepare_search(search, indexes) for search in request.searches]
+        
+        query_embeddings: List[Optional[List[float]]] = [None] * len(prepared)
+        embed_positions = [i for i, (_, _, mode, _) in enumerate(prepared) if mode in ('semantic', 'hybrid')]
+        if embed_positions and indexes.embeddings_data and gemini_embedder:
+            fetched = await gemini_embedder.create_embeddings_batch_async([prepared[i][1] for i in embed_positions])
+            for i, embedding in zip(embed_positions, fetched):
+                query_embeddings[i] = embedding
+        
+        searches = [(search_text, mode, search.limit, filters)
+                    for (_, search_text, mode, filters), search in zip(prepared, request.searches)]
+        results = await run_in_threadpool(batch_search_properties, searches, query_embeddings, indexes)
+        
+        responses = [SearchResponse(query=query, results=search_results, total_found=len(search_results),
+                                    filters=filters)
+                     for (query, _, _, filters), search_results in zip(prepared, results)]
+        return BatchSearchResponse(responses=responses, total_searches=len(responses))
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Batch search error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.put("/listings/{listing_id}", response_model=ListingUpdateResponse,
+         dependencies=[Depends(require_admin_key)])
+async def upsert_listing(listing_id: int, record: Dict[str, Any] = Body(...)):
+    """Add or replace one listing from its MLS record (CSV column -> value); searchable once this returns
+    
+    The record gets the same enhancement and embedding text as a batch run,
+    and its embedding is fetched before anything changes. A Status outside
+    ACTIVE_STATUSES (e.g. Pending) removes the listing, as an incremental
+    run would.
+    """
+    record = {'Listing Number': listing_id, **record}
+    if str(record['Listing Number']) != str(listing_id):
+        raise HTTPException(status_code=400, detail="Listing Number does not match the listing id in the path")
+    try:
+        listing = await run_in_threadpool(listing_enhancer.enhance_record, record)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid listing record: {e}")
+    
+    if listing.get('status') not in ACTIVE_STATUSES:
+        return await remove_listing(listing_id)
+    
+    embedding_index = search_indexes.embedding_index
+    if embedding_index is not None:
+        if not gemini_embedder:
+            raise HTTPException(status_code=503, detail="Embedding service not configured; listing not changed")
+        embedding = await gemini_embedder.create_embedding_async(build_embedding_text(listing), use_cache=False)
+        if embedding is None or len(embedding) != embedding_index.dimension:
+            raise HTTPException(status_code=503, detail="Could not embed the listing; listing not changed")
+        listing['embedding'] = embedding
+    
+    indexes = await run_in_threadpool(apply_listing_change, {'op': 'upsert', 'listing': listing})
+    return ListingUpdateResponse(listing_id=listing_id, status='upserted', index_version=indexes.version)
+
+@app.delete("/listings/{listing_id}", response_model=ListingUpdateResponse,
+            dependencies=[Depends(require_admin_key)])
+async def delete_listing(listing_id: int):
+    """Remove one listing from search; gone once this returns"""
+    if not any(len(rows) for rows in search_indexes.live_rows(listing_id)):
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return await remove_listing(listing_id)
+
+async def remove_listing(listing_id: int) -> ListingUpdateResponse:
+    indexes = await run_in_threadpool(apply_listing_change, {'op': 'delete', 'listing_id': listing_id})
+    return ListingUpdateResponse(listing_id=listing_id, status='deleted', index_version=indexes.version)
+
 @app.get("/search")
-async def search_properties_get(query: str, limit: int = 5):
+async def search_properties_get(query: str, limit: int = 5,
+                                mode: Literal['auto', 'semantic', 'text', 'hybrid'] = 'auto'):
     """GET endpoint for search (for easy testing)"""
-    request = SearchRequest(query=query, limit=limit)
+    request = SearchRequest(query=query, limit=limit, mode=mode)
     return await search_properties(request)
 
 @app.get("/security")
@@ -262,12 +848,21 @@ async def startup_event():
     # Validate environment
     validate_environment()
     
-    # Load data
-    logging.info("Loading property data...")
-    load_property_data()
-    load_embeddings_data()
+    # Load data, unless __main__ already has; later changes are picked up in the background
+    if index_reloader.generation == 0:
+        logging.info("Loading property data...")
+        index_reloader.load()
+    if INDEX_RELOAD_INTERVAL > 0:
+        index_reloader.start()
     
-    logging.info(f"API server ready with {len(properties_data)} properties")
+    logging.info(f"API server ready with {len(search_indexes.properties_data)} properties")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the index reloader and close pooled connections to the embedding API"""
+    index_reloader.stop()
+    if gemini_embedder:
+        await gemini_embedder.aclose()
 
 if __name__ == "__main__":
     # Environment validation
@@ -280,10 +875,9 @@ if __name__ == "__main__":
     
     print("Starting Merlin's Property Search API Server...")
     print("Loading property data...")
-    load_property_data()
-    load_embeddings_data()
+    index_reloader.load()
     
-    print(f"Server ready with {len(properties_data)} properties")
+    print(f"Server ready with {len(search_indexes.properties_data)} properties")
     
     # Get configuration
     host = os.getenv('API_HOST', '0.0.0.0')
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Query Embedding Cache
+In-memory LRU cache of query embeddings with a byte budget and optional TTL,
+backed by an optional SQLite cache shared by every worker process.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+import numpy as np
+from gemini_api import GEMINI_EMBEDDING_MODEL
+
+# 64 MB holds ~21,000 768-dimension float32 query vectors
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# ~300 MB of 768-dimension vectors on disk
+DEFAULT_MAX_PERSISTENT_ENTRIES = 100_000
+
+
+def normalize_query(text: str) -> str:
+    """Cache identity of a query: lowercased with whitespace collapsed."""
+    return ' '.join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU cache of float32 query vectors.
+
+    Entries are evicted least recently used first whenever the stored vector
+    bytes exceed ``max_bytes`` or the entry count exceeds ``max_entries``.
+    With a ``ttl`` (seconds), entries older than that are treated as misses
+    and dropped. Stored vectors are read-only, so a hit can be handed out
+    without copying. One lock guards the table; every operation is O(1).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: 'OrderedDict[str, Tuple[np.ndarray, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._live_entry(key) is not None
+
+    def _live_entry(self, key: str) -> Optional[Tuple[np.ndarray, float]]:
+        """Entry for ``key`` unless missing or expired (expired entries are dropped). Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and self.clock() >= entry[1]:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        vector, _ = self._entries.pop(key)
+        self.bytes -= vector.nbytes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Cached vector for ``key``, marking it most recently used; None on a miss."""
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, embedding: Sequence[float]) -> np.ndarray:
+        """Store ``embedding`` as a read-only float32 vector and return it.
+
+        A vector larger than the whole byte budget is returned but not stored.
+        """
+        vector = np.array(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        expires_at = self.clock() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if vector.nbytes > self.max_bytes:
+                return vector
+            self._entries[key] = (vector, expires_at)
+            self.bytes += vector.nbytes
+            while self.bytes > self.max_bytes or (self.max_entries is not None
+                                                  and len(self._entries) > self.max_entries):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Counters and current size, e.g. for a health endpoint."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class PersistentQueryEmbeddingCache:
+    """SQLite cache of query embeddings keyed by hash(model, normalised query).
+
+    The database runs in WAL mode, so every uvicorn worker can read it while
+    another writes, and it stays warm across restarts and deploys. Each
+    vector is written once (the first worker to miss wins). Past
+    ``max_entries`` the least recently used rows are deleted; to keep hits
+    read-only, a row's last-use time is refreshed at most once per
+    TOUCH_INTERVAL seconds. Connections are opened per thread.
+    """
+
+    TOUCH_INTERVAL = 3600
+    # Writes between checks of the entry cap, so a put rarely counts the table
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, model: str = GEMINI_EMBEDDING_MODEL,
+                 max_entries: int = DEFAULT_MAX_PERSISTENT_ENTRIES, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; wait out another worker's write lock instead of failing
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, text: str) -> str:
+        """Cache key for a query under this model."""
+        material = f"{self.model}\x1f{normalize_query(text)}".encode('utf-8')
+        return hashlib.sha256(material).hexdigest()
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Stored read-only float32 vector for a query; None on a miss."""
+        key = self.key(text)
+        row = self._conn().execute(
+            "SELECT vector, last_used FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        now = self.clock()
+        if now - row[1] > self.TOUCH_INTERVAL:
+            self._conn().execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (now, key))
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, text: str, embedding: Sequence[float]):
+        """Store a query's embedding unless some worker already has."""
+        now = self.clock()
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO query_embeddings VALUES (?, ?, ?, ?, ?)",
+            (self.key(text), self.model, np.asarray(embedding, dtype=np.float32).tobytes(), now, now)
+        )
+        if cursor.rowcount:
+            self._count('writes')
+            if self.writes % self.EVICT_EVERY == 0:
+                self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used rows beyond max_entries; returns how many."""
+        conn = self._conn()
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return 0
+        deleted = conn.execute(
+            "DELETE FROM query_embeddings WHERE key IN "
+            "(SELECT key FROM query_embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        ).rowcount
+        self._count('evictions', deleted)
+        return deleted
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for this process plus the shared entry count."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            counters = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+            }
+        return {'path': self.path, 'entries': len(self), 'max_entries': self.max_entries, **counters}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Query Parser
+Turns the numeric and place constraints in a free-text query into attribute
+filters, leaving only the "vibe" text to embed.
+"""
+
+import re
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from attribute_index import AttributeIndex
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+}
+
+NUMBER = r'(\d+(?:\.\d+)?|' + '|'.join(NUMBER_WORDS) + r')'
+AMOUNT = r'\$?\s?(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s?(k|m|mil|million|thousand)?\b'
+AMOUNT_MULTIPLIERS = {None: 1, 'k': 1_000, 'thousand': 1_000, 'm': 1_000_000, 'mil': 1_000_000,
+                      'million': 1_000_000}
+
+AT_MOST = r'(?:under|below|less than|no more than|at most|up to|max(?:imum)?|<=?)'
+AT_LEAST = r'(?:over|above|more than|at least|min(?:imum)?|from|>=?)'
+
+# An amount followed by one of these is not a price
+NOT_PRICE = r'(?!\s*(?:\+\s*)?(?:acres?|beds?|bedrooms?|br|bd|baths?|bathrooms?|ba|sq))'
+
+# Category values too generic to act as a style filter
+STYLE_STOPWORDS = {'other', 'none', 'unknown', 'see remarks', 'custom'}
+
+# Styles that double as vibe words ("cozy cabin") describe a feel rather than
+# a hard constraint, so they stay in the residual text instead of filtering
+VIBE_STYLES = {'cabin', 'cottage', 'rustic', 'log', 'chalet', 'vintage'}
+
+# Words left dangling once the constraint they introduced is removed
+CONNECTOR_WORDS = {'in', 'near', 'with', 'and', 'at', 'for', 'a', 'of', 'or', 'under', 'over', 'zip',
+                   'priced', 'price', 'style', 'homes', 'home', 'house', 'houses', 'property', 'properties'}
+
+
+def _number(text: str) -> float:
+    return float(NUMBER_WORDS.get(text, text))
+
+
+def _amount(digits: str, suffix: Optional[str]) -> Optional[float]:
+    """Dollar amount, or None when the number does not look like a price."""
+    value = float(digits.replace(',', '')) * AMOUNT_MULTIPLIERS[suffix]
+    return value if suffix or ',' in digits or value >= 10_000 else None
+
+
+class QueryParser:
+    """Deterministic, regex-based extraction of search filters from a query.
+
+    Recognises price bounds ("under $500k", "between 400k and 600k"),
+    bedroom/bathroom minimums ("3 bed", "2+ baths"), acreage ("5+ acres",
+    "under 2 acres"), and the cities, zip codes and architectural styles
+    present in the loaded listings. Each recognised phrase is removed from
+    the query; what remains is the residual text that gets embedded.
+    """
+
+    def __init__(self, cities: Iterable[str] = (), zip_codes: Iterable[str] = (), styles: Iterable[str] = ()):
+        self.cities = sorted({city.lower() for city in cities if city}, key=len, reverse=True)
+        self.zip_codes = {str(zip_code) for zip_code in zip_codes if zip_code}
+        self.styles = sorted({style.lower() for style in styles
+                              if style and style.lower() not in STYLE_STOPWORDS | VIBE_STYLES},
+                             key=len, reverse=True)
+
+        self.city_pattern = self._alternation(self.cities)
+        self.style_pattern = self._alternation(self.styles)
+
+    @staticmethod
+    def _alternation(values: List[str]) -> Optional['re.Pattern']:
+        if not values:
+            return None
+        return re.compile(r'\b(' + '|'.join(re.escape(value) for value in values) + r')\b')
+
+    @classmethod
+    def from_attribute_index(cls, index: AttributeIndex) -> 'QueryParser':
+        """Parser for the cities, zip codes and style members found in an attribute index."""
+        styles = {member.strip() for style in index.categories['architectural_style'] for member in style.split(',')}
+        return cls(index.categories['city'], index.categories['zip_code'], styles)
+
+    def parse(self, query: str) -> Tuple[Dict[str, Any], str]:
+        """Return (filters, residual text) for a query.
+
+        Filter names are those accepted by AttributeIndex.mask(). The residual
+        keeps the original casing of the words that were not consumed.
+        """
+        filters: Dict[str, Any] = {}
+        lowered = query.lower()
+        consumed = [False] * len(query)
+
+        def consume(pattern: str, handle):
+            """Call ``handle`` on each match over unconsumed text; mark it consumed if it returns True."""
+            for match in re.finditer(pattern, lowered):
+                if not any(consumed[match.start():match.end()]) and handle(match):
+                    consumed[match.start():match.end()] = [True] * (match.end() - match.start())
+
+        def set_filter(name: str, value: Any) -> bool:
+            if value is None:
+                return False
+            filters[name] = value
+            return True
+
+        def price_range(match) -> bool:
+            low = _amount(match.group(1), match.group(2) or match.group(4))
+            high = _amount(match.group(3), match.group(4))
+            if low is None or high is None:
+                return False
+            filters['min_price'], filters['max_price'] = min(low, high), max(low, high)
+            return True
+
+        # Prices
+        consume(rf'\b(?:between\s+)?{AMOUNT}\s*(?:-|to|and)\s*{AMOUNT}{NOT_PRICE}', price_range)
+        consume(rf'{AT_MOST}\s*{AMOUNT}{NOT_PRICE}',
+                lambda match: set_filter('max_price', _amount(match.group(1), match.group(2))))
+        consume(rf'{AT_LEAST}\s*{AMOUNT}{NOT_PRICE}',
+                lambda match: set_filter('min_price', _amount(match.group(1), match.group(2))))
+        consume(rf'{AMOUNT}\s*\+{NOT_PRICE}',
+                lambda match: set_filter('min_price', _amount(match.group(1), match.group(2))))
+
+        # Bedrooms, bathrooms and acreage
+        consume(rf'\b(?:{AT_LEAST}\s*)?{NUMBER}\s*\+?\s*-?\s*(?:bed(?:room)?s?|br|bd)\b',
+                lambda match: set_filter('min_bedrooms', _number(match.group(1))))
+        consume(rf'\b(?:{AT_LEAST}\s*)?{NUMBER}\s*\+?\s*-?\s*(?:bath(?:room)?s?|ba)\b',
+                lambda match: set_filter('min_bathrooms', _number(match.group(1))))
+        consume(rf'\b{AT_MOST}\s*{NUMBER}\s*-?\s*acres?\b',
+                lambda match: set_filter('max_acres', _number(match.group(1))))
+        consume(rf'\b(?:{AT_LEAST}\s*)?{NUMBER}\s*\+?\s*-?\s*acres?\b',
+                lambda match: set_filter('min_acres', _number(match.group(1))))
+
+        # Zip codes, cities and styles present in the data
+        consume(r'\b\d{5}\b',
+                lambda match: set_filter('zip_code', match.group() if match.group() in self.zip_codes else None))
+        if self.city_pattern is not None:
+            consume(self.city_pattern.pattern, lambda match: set_filter('city', match.group(1)))
+        if self.style_pattern is not None:
+            consume(self.style_pattern.pattern, lambda match: set_filter('architectural_style', match.group(1)))
+
+        residual = ''.join(' ' if used else char for char, used in zip(query, consumed))
+        words = residual.split()
+        # Drop connectors stranded at either end once their constraint is removed
+        while words and words[-1].lower().strip('.,!?') in CONNECTOR_WORDS:
+            words.pop()
+        while words and words[0].lower() in CONNECTOR_WORDS:
+            words.pop(0)
+        return filters, ' '.join(words).strip(' ,.-')
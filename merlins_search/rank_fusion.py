@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Rank Fusion
+Merges ranked candidate lists from different retrievers into one ranking.
+"""
+
+from typing import Sequence, Tuple
+import numpy as np
+
+# Standard RRF damping constant; larger values flatten the rank curve
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], top_k: int = 5,
+                           k: int = RRF_K) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse rankings of listing ids (each best first) into (ids, scores), best first.
+
+    Each list contributes 1 / (k + rank) for every id it contains. Scores are
+    divided by the best achievable total, so 1.0 means ranked first by every
+    retriever. Ties go to the id that appears earliest in ``rankings``.
+    """
+    rankings = [np.asarray(ranking) for ranking in rankings if len(ranking)]
+    if not rankings or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    ids = np.concatenate(rankings)
+    weights = np.concatenate([1.0 / (k + np.arange(1, len(ranking) + 1)) for ranking in rankings])
+
+    fused, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=weights, minlength=len(fused))
+    first_seen = np.full(len(fused), len(ids))
+    np.minimum.at(first_seen, inverse, np.arange(len(ids)))
+
+    order = np.lexsort((first_seen, -scores))[:top_k]
+    return fused[order], scores[order] * (k + 1) / len(rankings)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Search Result Cache
+LRU cache of finished search responses with a TTL, invalidated whenever the
+listings or embeddings index is reloaded.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 10_000
+
+# Listings change slowly; five minutes bounds how long a result can outlive its data
+DEFAULT_TTL = 300.0
+
+
+class SearchResultCache:
+    """Thread-safe LRU + TTL cache of search results, keyed per index version.
+
+    Callers build the key from the normalised query, limit, mode and
+    filters; the cache adds the current index version to it. ``invalidate()``
+    bumps the version and drops every entry, so results computed against an
+    old index can never be served again. A search that started before a
+    reload and finishes after it passes the version it started with to
+    ``put()``, which then discards the stale result.
+
+    Cached values are shared between hits and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: Optional[float] = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: 'OrderedDict[Tuple[int, Hashable], Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached result for ``key`` under the current index version; None on a miss."""
+        with self._lock:
+            versioned_key = (self.version, key)
+            entry = self._entries.get(versioned_key)
+            if entry is not None and self.ttl is not None and self.clock() >= entry[1]:
+                del self._entries[versioned_key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(versioned_key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, version: int) -> bool:
+        """Store a result computed against index ``version``; False if the index has since changed."""
+        expires_at = self.clock() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            if version != self.version or self.max_entries <= 0:
+                return False
+            versioned_key = (version, key)
+            self._entries[versioned_key] = (value, expires_at)
+            self._entries.move_to_end(versioned_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self):
+        """Forget every result; call whenever the data being searched changes."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Counters and current size, e.g. for a health endpoint."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'index_version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
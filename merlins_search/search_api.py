@@ -6,54 +6,117 @@ Flask API for semantic property search with vibe-based queries.
 
 import os
 import json
+import threading
 import time
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Optional
 from flask import Flask, request, jsonify, render_template_string
 from flask_cors import CORS
+from attribute_index import AttributeIndex
 from embedding_generator import PropertyEmbeddingGenerator
+from embedding_store import load_embedding_store, sidecar_path
+from index_reloader import IndexReloader
+from lexical_index import LexicalIndex, tokenize
+from listing_io import DEFAULT_LISTINGS_PATHS, default_listings_path, load_listings
+from query_cache import normalize_query
+from query_parser import QueryParser
+from result_cache import SearchResultCache
+from vector_index import PropertyVectorIndex
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for WordPress integration
 
 # Global variables for caching
-embeddings_data = None
 generator = None
-last_loaded = 0
 
-def load_embeddings_data():
-    """Load embeddings data with caching."""
-    global embeddings_data, generator, last_loaded
+# Embedding artifacts: the binary store is preferred over the JSON file
+EMBEDDING_STORE_PATH = "property_embeddings.npy"
+EMBEDDINGS_JSON_PATH = "property_embeddings.json"
+
+# Seconds between checks of the data files for changes; 0 disables hot reload
+INDEX_RELOAD_INTERVAL = float(os.getenv('INDEX_RELOAD_INTERVAL', '5'))
+
+# Listing fields searched by the keyword fallback
+KEYWORD_FIELDS = ['enhanced_description']
+
+# Finished searches kept for repeats; emptied whenever the data is reloaded
+result_cache = SearchResultCache(int(os.getenv('RESULT_CACHE_SIZE', '10000')),
+                                 float(os.getenv('RESULT_CACHE_TTL', '300')))
+
+class SearchData:
+    """One generation of loaded listings and their indexes, replaced as a whole on reload."""
     
-    embeddings_path = "property_embeddings.json"
+    def __init__(self, embeddings_data: Dict[str, Any], embedding_index: Optional[PropertyVectorIndex]):
+        self.embeddings_data = embeddings_data
+        self.embedding_index = embedding_index
+        # Keyword fallback index over the same listings
+        self.lexical_index = LexicalIndex(embeddings_data['listings'], KEYWORD_FIELDS)
+        # Attribute filters for each index's rows, and a parser for the loaded cities, zips and styles
+        self.attribute_index = AttributeIndex(embeddings_data['listings'])
+        self.embedding_attribute_index = AttributeIndex(embedding_index.listings) if embedding_index else None
+        self.query_parser = QueryParser.from_attribute_index(self.attribute_index)
     
-    # Check if we need to reload
-    if embeddings_data is None or (time.time() - last_loaded > 300):  # Reload every 5 minutes
-        try:
-            if os.path.exists(embeddings_path):
-                print("Loading embeddings from file...")
-                with open(embeddings_path, 'r') as f:
-                    embeddings_data = json.load(f)
-                last_loaded = time.time()
-                print(f"Loaded {len(embeddings_data.get('listings', []))} properties with embeddings")
-            else:
-                print("No embeddings file found, using enhanced listings only...")
-                # Fallback to enhanced listings without embeddings
-                with open("enhanced_listings.json", 'r') as f:
-                    listings = json.load(f)
-                embeddings_data = {
-                    'listings': listings,
-                    'metadata': {
-                        'total_properties': len(listings),
-                        'embedding_model': 'fallback_keyword_search',
-                        'created_timestamp': time.time()
-                    }
-                }
-                last_loaded = time.time()
-        except Exception as e:
-            print(f"Error loading embeddings: {e}")
-            return None
+    def embeddings_available(self) -> bool:
+        """Whether the loaded data has an embedding index to search."""
+        return self.embedding_index is not None and len(self.embedding_index) > 0
+
+# The generation requests read; None until the first load
+search_data: Optional[SearchData] = None
+first_load_lock = threading.Lock()
+
+def index_source_paths() -> List[str]:
+    """Files whose changes trigger a reload."""
+    return [EMBEDDING_STORE_PATH, sidecar_path(EMBEDDING_STORE_PATH), EMBEDDINGS_JSON_PATH] + DEFAULT_LISTINGS_PATHS
+
+def build_search_data() -> SearchData:
+    """Load embeddings (or plain listings) and build their indexes, off the request path."""
+    if os.path.exists(EMBEDDING_STORE_PATH):
+        print("Loading binary embedding store...")
+        # Memory-mapped matrix; listings come from the sidecar
+        embeddings_data = load_embedding_store(EMBEDDING_STORE_PATH)
+        embedding_index = PropertyVectorIndex.from_embedding_store(embeddings_data)
+        print(f"Loaded {len(embedding_index)} properties with embeddings")
+    elif os.path.exists(EMBEDDINGS_JSON_PATH):
+        print("Loading embeddings from file...")
+        with open(EMBEDDINGS_JSON_PATH, 'r') as f:
+            embeddings_data = json.load(f)
+        # Build the normalised embedding matrix once per load, not per search
+        embedding_index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+        print(f"Loaded {len(embeddings_data.get('listings', []))} properties with embeddings")
+    else:
+        print("No embeddings file found, using enhanced listings only...")
+        # Fallback to enhanced listings without embeddings
+        listings = load_listings(default_listings_path() or "enhanced_listings.json")
+        embeddings_data = {
+            'listings': listings,
+            'metadata': {
+                'total_properties': len(listings),
+                'embedding_model': 'fallback_keyword_search',
+                'created_timestamp': time.time()
+            }
+        }
+        embedding_index = None
+    return SearchData(embeddings_data, embedding_index)
+
+def publish_search_data(data: SearchData):
+    """Make ``data`` current with one reference swap; running requests keep the generation they took."""
+    global search_data
     
-    return embeddings_data
+    search_data = data
+    result_cache.invalidate()
+
+# Rebuilds and publishes the search data in the background when its files change
+index_reloader = IndexReloader(index_source_paths, build_search_data, publish_search_data, INDEX_RELOAD_INTERVAL)
+
+def get_search_data() -> Optional[SearchData]:
+    """Current search data, loaded on first use; later changes are picked up in the background."""
+    if search_data is None:
+        with first_load_lock:
+            if search_data is None:
+                index_reloader.load()
+                if INDEX_RELOAD_INTERVAL > 0:
+                    index_reloader.start()
+    return search_data
 
 def get_generator():
     """Get or create embedding generator."""
@@ -68,8 +131,17 @@ def get_generator():
     
     return generator
 
-def fallback_keyword_search(query: str, listings: List[Dict], top_k: int = 5) -> List[Dict]:
-    """Fallback keyword-based search when embeddings aren't available."""
+def fallback_keyword_search(query: str, listings: List[Dict], top_k: int = 5,
+                            index: Optional[LexicalIndex] = None,
+                            mask: Optional[np.ndarray] = None) -> List[Dict]:
+    """Fallback keyword-based search when embeddings aren't available.
+
+    ``index`` is the prebuilt LexicalIndex over ``listings``; one is built
+    on the spot when it is not given. ``mask`` is an optional boolean
+    attribute filter over ``listings``.
+    """
+    if index is None:
+        index = LexicalIndex(listings, KEYWORD_FIELDS)
     
     query_lower = query.lower()
     
@@ -88,49 +160,43 @@ def fallback_keyword_search(query: str, listings: List[Dict], top_k: int = 5) ->
     }
     
     # Expand query with related keywords
-    expanded_keywords = set(query_lower.split())
-    for word in query_lower.split():
+    query_words = tokenize(query_lower)
+    expanded_keywords = set(query_words)
+    for word in query_words:
         if word in keyword_mappings:
-            expanded_keywords.update(keyword_mappings[word])
+            expanded_keywords.update(token for keyword in keyword_mappings[word] for token in tokenize(keyword))
     
-    # Score listings
-    scored_listings = []
-    for listing in listings:
-        desc = listing['enhanced_description'].lower()
-        score = 0
-        
-        # Base keyword matching
-        for keyword in expanded_keywords:
-            if keyword in desc:
-                score += 1
-        
-        # Bonus for exact query match
-        if query_lower in desc:
-            score += 5
-        
-        # Price range bonuses based on query type
-        price = listing.get('price', 0)
-        if 'luxury' in query_lower or 'castle' in query_lower or 'mansion' in query_lower:
-            if price > 1000000:
-                score += 3
-        elif 'cottage' in query_lower or 'shack' in query_lower or 'cozy' in query_lower:
-            if 300000 <= price <= 800000:
-                score += 2
-        
-        # Acreage bonuses
-        acres = listing.get('lot_acres', 0)
-        if 'estate' in query_lower or 'retreat' in query_lower:
-            if acres >= 5:
-                score += 2
-        
-        if score > 0:
-            result = listing.copy()
-            result['similarity_score'] = score / 10.0  # Normalize to 0-1 range
-            scored_listings.append(result)
+    # Score listings: BM25 over the expanded keywords' postings
+    rows, scores = index.score(expanded_keywords)
+    if mask is not None:
+        keep = mask[rows]
+        rows, scores = rows[keep], scores[keep]
+    
+    # Bonus for exact query match, checked only on listings containing every query word
+    phrase_rows = [row for row in index.rows_with_all(query_words)
+                   if query_lower in index.listings[row]['enhanced_description'].lower()]
+    scores += np.where(np.isin(rows, phrase_rows), 5, 0)
+    
+    # Price range bonuses based on query type, vectorised over the candidates
+    price = index.attribute('price')[rows]
+    if 'luxury' in query_lower or 'castle' in query_lower or 'mansion' in query_lower:
+        scores += np.where(price > 1000000, 3, 0)
+    elif 'cottage' in query_lower or 'shack' in query_lower or 'cozy' in query_lower:
+        scores += np.where((300000 <= price) & (price <= 800000), 2, 0)
+    
+    # Acreage bonuses
+    if 'estate' in query_lower or 'retreat' in query_lower:
+        scores += np.where(index.attribute('lot_acres')[rows] >= 5, 2, 0)
     
-    # Sort by score and return top k
-    scored_listings.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return scored_listings[:top_k]
+    rows, scores = index.best(rows, scores, top_k)
+    
+    results = []
+    for row, score in zip(rows, scores):
+        result = index.listings[row].copy()
+        result['similarity_score'] = float(score) / 10.0  # Normalize to 0-1 range
+        results.append(result)
+    
+    return results
 
 @app.route('/')
 def home():
@@ -224,28 +290,53 @@ def search_properties():
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
-        # Load data
-        embeddings_data = load_embeddings_data()
-        if not embeddings_data:
+        # Read the version before the data, so an old generation's result is never cached as new
+        index_version = result_cache.version
+        # One generation serves the whole request, even if a reload is published meanwhile
+        data_set = get_search_data()
+        if not data_set:
             return jsonify({'error': 'Property data not available'}), 500
         
+        # Repeated searches are served from the result cache of the loaded index
+        cache_key = (normalize_query(query), top_k, bool(data.get('parse_query', True)))
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({'query': query, **cached})
+        
         print(f"Search query: '{query}'")
         
+        # Constraints in the query become prefilters; only the residual vibe text is searched
+        filters, search_text = {}, query
+        if data.get('parse_query', True):
+            filters, residual = data_set.query_parser.parse(query)
+            search_text = residual or query
+            if filters:
+                print(f"Parsed filters {filters}, searching for '{search_text}'")
+        
         # Try semantic search first, fallback to keyword search
         generator = get_generator()
-        if generator and 'embedding' in embeddings_data.get('listings', [{}])[0]:
+        if generator and data_set.embeddings_available():
             print("Using semantic search with embeddings")
-            results = generator.search_similar_properties(query, embeddings_data, top_k)
+            results = generator.search_similar_properties(search_text, data_set.embeddings_data, top_k,
+                                                          index=data_set.embedding_index,
+                                                          rows=data_set.embedding_attribute_index.rows(filters))
         else:
             print("Using fallback keyword search")
-            results = fallback_keyword_search(query, embeddings_data['listings'], top_k)
+            results = fallback_keyword_search(search_text, data_set.embeddings_data['listings'], top_k,
+                                              index=data_set.lexical_index,
+                                              mask=data_set.attribute_index.mask(filters))
         
-        return jsonify({
-            'query': query,
+        response = {
             'results': results,
             'total_found': len(results),
-            'search_type': 'semantic' if generator else 'keyword'
-        })
+            'search_type': 'semantic' if generator else 'keyword',
+            'filters': filters
+        }
+        # An empty semantic result may be a failed query embedding, so it is not cached
+        if results or not (generator and data_set.embeddings_available()):
+            result_cache.put(cache_key, response, index_version)
+        
+        return jsonify({'query': query, **response})
         
     except Exception as e:
         print(f"Search error: {e}")
@@ -255,9 +346,10 @@ def search_properties():
 def get_all_properties():
     """Get all properties (for WordPress integration)."""
     try:
-        embeddings_data = load_embeddings_data()
-        if not embeddings_data:
+        data_set = get_search_data()
+        if not data_set:
             return jsonify({'error': 'Property data not available'}), 500
+        embeddings_data = data_set.embeddings_data
         
         # Return properties without embeddings to save bandwidth
         properties = []
@@ -279,22 +371,24 @@ def get_all_properties():
 @app.route('/health')
 def health_check():
     """Health check endpoint."""
-    embeddings_data = load_embeddings_data()
+    data_set = get_search_data()
     generator = get_generator()
     
     return jsonify({
         'status': 'healthy',
-        'properties_loaded': len(embeddings_data['listings']) if embeddings_data else 0,
+        'properties_loaded': len(data_set.embeddings_data['listings']) if data_set else 0,
         'semantic_search_available': generator is not None,
-        'embeddings_available': embeddings_data and 'embedding' in embeddings_data.get('listings', [{}])[0] if embeddings_data else False
+        'embeddings_available': data_set.embeddings_available() if data_set else False,
+        'index': index_reloader.stats(),
+        'result_cache': result_cache.stats()
     })
 
 if __name__ == '__main__':
     print("🧙‍♂️ Starting Merlin's Shack Property Search API...")
     print("Loading property data...")
     
-    # Preload data
-    load_embeddings_data()
+    # Preload data; the reloader then watches the files in the background
+    get_search_data()
     
     print("API ready!")
     print("Open http://localhost:5001 to test the search interface")
@@ -3,6 +3,7 @@
 Security configuration and middleware for Merlin's Search API
 """
 
+import hmac
 import os
 import time
 from typing import Dict, List
@@ -69,10 +70,13 @@ class SecurityConfig:
         # API key validation
         self.require_api_key = os.getenv('REQUIRE_API_KEY', 'false').lower() == 'true'
         self.valid_api_keys = self._load_api_keys()
+        
+        # Keys allowed to change listings; listing updates are disabled without any
+        self.admin_api_keys = self._load_api_keys('ADMIN_API_KEYS')
     
-    def _load_api_keys(self) -> List[str]:
+    def _load_api_keys(self, variable: str = 'VALID_API_KEYS') -> List[str]:
         """Load valid API keys from environment."""
-        api_keys_str = os.getenv('VALID_API_KEYS', '')
+        api_keys_str = os.getenv(variable, '')
         if api_keys_str:
             return [key.strip() for key in api_keys_str.split(',') if key.strip()]
         return []
@@ -104,6 +108,11 @@ class SecurityConfig:
         
         return api_key in self.valid_api_keys
     
+    def validate_admin_key(self, request: Request) -> bool:
+        """Check the X-Admin-Key header against the admin keys in constant time."""
+        admin_key = request.headers.get('X-Admin-Key', '')
+        return any(hmac.compare_digest(admin_key.encode(), key.encode()) for key in self.admin_api_keys)
+    
     def check_rate_limit(self, request: Request) -> bool:
         """Check if request passes rate limiting."""
         client_ip = self.get_client_ip(request)
@@ -148,6 +157,13 @@ async def security_middleware(request: Request, call_next):
     
     return response
 
+async def require_admin_key(request: Request):
+    """Endpoint dependency for endpoints that change data: a valid X-Admin-Key is required."""
+    if not security_config.admin_api_keys:
+        raise HTTPException(status_code=403, detail="Listing updates are disabled; set ADMIN_API_KEYS to enable them")
+    if not security_config.validate_admin_key(request):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin key")
+
 def configure_cors_middleware(app):
     """Configure CORS middleware for the application."""
     app.add_middleware(
@@ -217,6 +233,7 @@ def get_security_info() -> Dict:
             "allowed_origins": security_config.allowed_origins
         },
         "api_key_required": security_config.require_api_key,
+        "listing_updates_enabled": bool(security_config.admin_api_keys),
         "debug_mode": security_config.api_debug,
         "log_level": security_config.log_level
     }
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Single Flight
+Coalesces concurrent identical calls so only the first one does the work.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key, for threads and coroutines alike.
+
+    The first caller for a key runs the work; callers arriving while it is
+    in flight wait for and share its result (or exception). Flights are
+    tracked as concurrent.futures.Future objects, so a coroutine can wait on
+    a flight led by a threadpool worker and vice versa. Nothing is cached:
+    once a flight lands, the next call for its key starts a new one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Return (flight future, True if the caller leads it)."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._flights[key] = Future()
+            self.calls += 1
+            return future, True
+
+    def _land(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run ``fn()`` unless a call for ``key`` is already in flight; blocks until the result."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``fn()`` unless a call for ``key`` is already in flight; awaits the shared result."""
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded: a cancelled waiter must not cancel the flight for everyone else
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Tests for listing enhancement in data_processor.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from benchmark_ingest import make_synthetic_listings
+from data_processor import PropertyVibeEnhancer, rank_vibes
+from listing_io import iter_listings, load_listings
+from listing_manifest import load_manifest, read_delta
+
+
+class TestColumnWiseEnhancement(unittest.TestCase):
+    """The column-wise path must match the per-row path byte for byte."""
+
+    def setUp(self):
+        self.enhancer = PropertyVibeEnhancer()
+
+    def assert_same_output(self, df: pd.DataFrame):
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = self.enhancer.enhance_dataframe_rows(df).to_json(orient='records', indent=2)
+            actual = self.enhancer.enhance_dataframe(df).to_json(orient='records', indent=2)
+        self.assertEqual(actual, expected)
+
+    def test_matches_per_row_output(self):
+        """Synthetic listings with gaps in every optional column enhance identically."""
+        self.assert_same_output(make_synthetic_listings(500, seed=7))
+
+    def test_matches_per_row_output_on_edge_cases(self):
+        """All-missing rows, single fireplaces, short remarks and odd whitespace."""
+        df = make_synthetic_listings(4, seed=1)
+        optional = [column for column in df.columns
+                    if column not in ('Listing Number', 'Address - Street Complete', 'Address - City',
+                                      'Address - Zip Code', 'Status')]
+        df.loc[0, optional] = np.nan
+        df.loc[1, ['# of Fireplaces', 'Lot Size - Acres', 'Public Remarks']] = [1.0, 0.0, "Too short"]
+        df.loc[2, 'Public Remarks'] = "  Rustic\tlog cabin on\n\n five acres  with a creek, barn and fireplace.  "
+        df.loc[3, 'Architectural Style'] = " Victorian , Colonial,Unknown"
+        self.assert_same_output(df)
+
+    def test_falls_back_to_rows_on_bad_values(self):
+        """Values the per-row path rejects are skipped the same way in column mode."""
+        df = make_synthetic_listings(20, seed=3)
+        df['Full Bathrooms'] = df['Full Bathrooms'].astype(object)
+        df.loc[5, 'Full Bathrooms'] = "two and a half"
+        self.assert_same_output(df)
+
+
+class TestDeterministicVibes(unittest.TestCase):
+    """Descriptions must not depend on string hash randomisation."""
+
+    def test_rank_vibes_by_frequency_then_first_appearance(self):
+        self.assertEqual(rank_vibes(['cozy', 'warm', 'rustic', 'warm', 'cozy', 'private', 'warm']),
+                         ['warm', 'cozy', 'rustic', 'private'])
+
+    def test_descriptions_identical_across_hash_seeds(self):
+        """Separate interpreters with different PYTHONHASHSEED values produce the same text."""
+        script = (
+            "import hashlib\n"
+            "from benchmark_ingest import make_synthetic_listings\n"
+            "from data_processor import PropertyVibeEnhancer\n"
+            "df = make_synthetic_listings(300, seed=9)\n"
+            "enhancer = PropertyVibeEnhancer()\n"
+            "rows = [enhancer.enhance_property_description(row) for _, row in df.iterrows()]\n"
+            "columns = enhancer.enhance_dataframe_columns(df)['enhanced_description'].tolist()\n"
+            "assert rows == columns\n"
+            "print(hashlib.sha256('\\n'.join(rows).encode()).hexdigest())\n"
+        )
+        digests = set()
+        for seed in ('0', '1', '12345'):
+            result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env={**os.environ, 'PYTHONHASHSEED': seed})
+            digests.add(result.stdout.strip())
+        self.assertEqual(len(digests), 1)
+
+
+class TestParallelEnhancement(unittest.TestCase):
+    """Sharding across processes must not change output, order or error reporting."""
+
+    def run_logged(self, function, *args, **kwargs):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = function(*args, **kwargs)
+        return result.to_json(orient='records', indent=2), output.getvalue()
+
+    def test_pool_matches_single_process(self):
+        """Records, row order and per-row error messages match the one-process path."""
+        enhancer = PropertyVibeEnhancer()
+        df = make_synthetic_listings(300, seed=5)
+        df['Full Bathrooms'] = df['Full Bathrooms'].astype(object)
+        df.loc[[17, 250], 'Full Bathrooms'] = "two and a half"
+
+        expected, expected_log = self.run_logged(enhancer.enhance_dataframe, df, vectorized=False)
+        with enhancer.create_worker_pool(3) as pool:
+            actual, actual_log = self.run_logged(enhancer.enhance_dataframe_parallel, df, pool, 3,
+                                                 vectorized=False)
+            columns, _ = self.run_logged(enhancer.enhance_dataframe_parallel, df.drop(index=[17, 250]),
+                                         pool, 3)
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual_log, expected_log)
+        self.assertIn("Error processing row 250:", actual_log)
+        self.assertEqual(columns, expected)
+
+
+class TestStreamingIngestion(unittest.TestCase):
+    """Chunked CSV ingestion must produce the same listings as a full read."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.temp_dir.name, 'Listing.csv')
+        df = make_synthetic_listings(1200, seed=11)
+        df['Agent Notes'] = 'not used by the enhancer'
+        df.to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_streamed_ndjson_matches_full_read(self):
+        """Records streamed in chunks equal those of the whole-file JSON output."""
+        enhancer = PropertyVibeEnhancer()
+        json_path = os.path.join(self.temp_dir.name, 'enhanced_listings.json')
+        ndjson_path = os.path.join(self.temp_dir.name, 'enhanced_listings.ndjson')
+        with contextlib.redirect_stdout(io.StringIO()):
+            enhancer.process_listings_csv(self.csv_path, json_path)
+            written = enhancer.process_listings_csv_streaming(self.csv_path, ndjson_path, chunksize=500)
+
+        self.assertEqual(written, 1200)
+        self.assertEqual(load_listings(ndjson_path), load_listings(json_path))
+
+    def test_reader_stops_at_partial_record(self):
+        """A record still being written is not parsed."""
+        ndjson_path = os.path.join(self.temp_dir.name, 'enhanced_listings.ndjson')
+        with open(ndjson_path, 'w') as f:
+            f.write('{"listing_id": 1}\n{"listing_id": 2}\n{"listing_')
+        self.assertEqual([listing['listing_id'] for listing in iter_listings(ndjson_path)], [1, 2])
+
+
+class TestIncrementalIngestion(unittest.TestCase):
+    """Manifest-driven runs only re-enhance churned listings."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.enhancer = PropertyVibeEnhancer()
+        self.csv_path = self.path('Listing.csv')
+        self.output_path = self.path('enhanced_listings.ndjson')
+        self.manifest_path = self.path('manifest.json')
+        self.delta_path = self.path('delta.ndjson')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.temp_dir.name, name)
+
+    def run_incremental(self, df: pd.DataFrame):
+        df.to_csv(self.csv_path, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = self.enhancer.process_listings_incremental(
+                self.csv_path, self.output_path, self.manifest_path, self.delta_path, chunksize=40
+            )
+        upserts, deletes = read_delta(self.delta_path)
+        return summary, sorted(listing['listing_id'] for listing in upserts), sorted(deletes)
+
+    def test_only_churn_is_reprocessed(self):
+        """Changed and new listings are upserted; sold and vanished ones are deleted."""
+        df = make_synthetic_listings(100, seed=4)
+        df['Status'] = 'Active'
+        summary, upserts, deletes = self.run_incremental(df)
+        self.assertEqual((summary['upserts'], deletes), (100, []))
+
+        ids = df['Listing Number'].tolist()
+        df.loc[3, 'Public Remarks'] = "Freshly painted with a new pool and a long remark to include."
+        df.loc[5, 'Status'] = 'Sold'
+        new_listing = df.iloc[[0]].assign(**{'Listing Number': 999})
+        df = pd.concat([df.drop(index=7), new_listing], ignore_index=True)
+
+        summary, upserts, deletes = self.run_incremental(df)
+        self.assertEqual(upserts, [999, ids[3]])
+        self.assertEqual(deletes, [ids[5], ids[7]])
+        self.assertEqual(summary['unchanged'], 97)
+        # Only churned listings get a new updated_at; a vanished one stays as inactive
+        manifest = load_manifest(self.manifest_path)
+        self.assertGreater(manifest[str(ids[3])]['updated_at'], manifest[str(ids[0])]['updated_at'])
+        self.assertEqual(manifest[str(ids[7])]['updated_at'], manifest[str(ids[3])]['updated_at'])
+        self.assertFalse(manifest[str(ids[7])]['active'])
+
+        # The maintained output matches a from-scratch run over the active listings
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = self.enhancer.process_listings_csv(self.csv_path)
+        expected = json.loads(full[full['status'] == 'Active'].to_json(orient='records'))
+        by_id = lambda listings: sorted(listings, key=lambda listing: listing['listing_id'])
+        self.assertEqual(by_id(load_listings(self.output_path)), by_id(expected))
+
+        summary, upserts, deletes = self.run_incremental(df)
+        self.assertEqual((upserts, deletes), ([], []))
+
+    def test_malformed_numeric_cells_do_not_fail_the_chunk(self):
+        """A ZIP+4 zip code and a fractional bath count are coerced instead of failing the chunk."""
+        df = make_synthetic_listings(60, seed=9)
+        df['Status'] = 'Active'
+        df = df.astype({'Address - Zip Code': str, 'Full Bathrooms': str, 'DOM': str})
+        df.loc[10, 'Address - Zip Code'] = '95945-1234'
+        df.loc[11, 'Full Bathrooms'] = '2.5'
+        df.loc[12, 'DOM'] = 'n/a'
+
+        summary, upserts, deletes = self.run_incremental(df)
+        self.assertEqual(summary['upserts'], 60)
+        listings = {listing['listing_id']: listing for listing in load_listings(self.output_path)}
+        ids = df['Listing Number'].tolist()
+        self.assertEqual(listings[ids[10]]['zip_code'], 95945)
+        self.assertEqual(listings[ids[11]]['bathrooms'], 2.5)
+        self.assertEqual(listings[ids[12]]['days_on_market'], 0)
+
+        record = df.iloc[10].to_dict()
+        record['Full Bathrooms'] = 2.5
+        enhanced = self.enhancer.enhance_record(record)
+        self.assertEqual((enhanced['zip_code'], enhanced['bathrooms']), (95945, 2.5))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,644 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedding pipeline against a local fake Gemini endpoint
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import httpx
+import numpy as np
+import requests
+from async_embedder import AsyncGeminiBulkEmbedder, TokenBucket
+from cached_gemini_embedder import CachedGeminiPropertyEmbedder
+from circuit_breaker import CircuitBreaker
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embedding_journal import EmbeddingJournal, embed_with_journal, journal_path_for
+from embedding_store import load_embedding_store
+from fake_gemini_server import FakeGeminiServer, fake_embedding
+from gemini_api import GEMINI_EMBEDDING_MODEL, embed_content_url, embed_request, pack_batches
+from gemini_embedder import GeminiPropertyEmbedder
+from query_cache import PersistentQueryEmbeddingCache, QueryEmbeddingCache
+from single_flight import SingleFlight
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the async token-bucket limiter."""
+
+    def test_rate_is_enforced(self):
+        """After the burst is spent, tokens arrive at the configured rate."""
+        async def take(count):
+            bucket = TokenBucket(rate=50, capacity=1)
+            for _ in range(count):
+                await bucket.acquire()
+
+        start = time.monotonic()
+        asyncio.run(take(11))
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+class TestAsyncBulkEmbedder(unittest.TestCase):
+    """Test cases for concurrent bulk embedding."""
+
+    def test_results_in_input_order_with_bounded_concurrency(self):
+        """Bulk mode keeps input order and never exceeds max_in_flight."""
+        texts = [f"listing text {i}" for i in range(30)]
+        with FakeGeminiServer(latency=0.02) as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=4, qps=1000, api_base=server.api_base)
+            embeddings = embedder.embed_texts(texts)
+
+        self.assertEqual(embeddings, [fake_embedding(text) for text in texts])
+        self.assertLessEqual(server.max_in_flight, 4)
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertEqual(embedder.last_run_stats['succeeded'], 30)
+        self.assertGreater(embedder.last_run_stats['embeddings_per_second'], 0)
+
+    def test_retries_rate_limited_and_server_errors(self):
+        """429 and 5xx responses are retried with backoff until they succeed."""
+        texts = ["cozy cottage", "luxury estate", "horse property"]
+        with FakeGeminiServer(fail_first={"cozy cottage": 2}) as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=2, qps=1000, base_delay=0.01,
+                                               api_base=server.api_base)
+            embeddings = embedder.embed_texts(texts)
+
+        self.assertEqual(embeddings[0], fake_embedding("cozy cottage"))
+        self.assertEqual(embedder.last_run_stats['retries'], 2)
+
+        with FakeGeminiServer(fail_first={"luxury estate": 5}, fail_status=503) as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=2, qps=1000, max_retries=2,
+                                               base_delay=0.01, api_base=server.api_base)
+            embeddings = embedder.embed_texts(texts)
+
+        self.assertIsNone(embeddings[1])
+        self.assertEqual(embeddings[2], fake_embedding("horse property"))
+        self.assertEqual(embedder.last_run_stats['failed'], 1)
+
+
+class TestBatchEmbedContents(unittest.TestCase):
+    """Test cases for batchEmbedContents packing and per-item retries."""
+
+    def setUp(self):
+        self.texts = [f"listing text {i}" for i in range(250)]
+
+    def test_pack_batches_respects_count_and_byte_caps(self):
+        """Batches never exceed the count cap or (except lone oversize texts) the byte cap."""
+        self.assertEqual([len(b) for b in pack_batches(self.texts, max_count=100)], [100, 100, 50])
+
+        texts = ["x" * 300, "y" * 300, "z" * 5000, "w" * 10]
+        self.assertEqual(pack_batches(texts, max_count=100, max_bytes=1000), [[0, 1], [2], [3]])
+
+    def test_sync_batches_and_isolates_failing_item(self):
+        """Only the rejected item is retried on its own; everything else is embedded in batches."""
+        output = io.StringIO()
+        with FakeGeminiServer(reject_texts={"listing text 150"}) as server, mock.patch('gemini_api.time.sleep'), \
+                contextlib.redirect_stdout(output):
+            embedder = GeminiPropertyEmbedder('secret-test-key', api_base=server.api_base)
+            embeddings = embedder.create_embeddings_batch(self.texts)
+
+        self.assertIsNone(embeddings[150])
+        self.assertEqual(embeddings[149], fake_embedding("listing text 149"))
+        self.assertEqual(embeddings[151], fake_embedding("listing text 151"))
+        self.assertEqual(sum(1 for e in embeddings if e is None), 1)
+        # 3 packed batches + bisection of the failing one, far below one call per text
+        self.assertLess(server.request_count, 25)
+        self.assertEqual(server.request_count - server.batch_request_count, 3)
+        # The key travels in a header, so the logged errors never carry it
+        self.assertIn("400", output.getvalue())
+        self.assertNotIn("secret-test-key", output.getvalue())
+
+    def test_rate_limited_batch_is_resent_whole(self):
+        """A 429 on a batch is waited out (honouring Retry-After) and the batch resent unsplit."""
+        with FakeGeminiServer(fail_first={"listing text 0": 2}, retry_after='2') as server, \
+                mock.patch('gemini_api.time.sleep') as sleep:
+            embedder = GeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            embeddings = embedder.create_embeddings_batch(self.texts)
+
+        self.assertEqual(embeddings, [fake_embedding(text) for text in self.texts])
+        # 3 packed batches, the first sent 3 times; nothing split or sent singly
+        self.assertEqual(server.request_count, 5)
+        self.assertEqual(server.batch_request_count, 5)
+        self.assertEqual(sleep.call_args_list, [mock.call(2.0), mock.call(2.0)])
+
+    def test_persistently_rate_limited_batch_is_not_split(self):
+        """A batch still throttled after every retry is given up on whole, not bisected into more load."""
+        with FakeGeminiServer(fail_first={"listing text 0": 100}, fail_status=503) as server, \
+                mock.patch('gemini_api.time.sleep'):
+            embedder = GeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            embeddings = embedder.create_embeddings_batch(self.texts)
+
+        self.assertTrue(all(embedding is None for embedding in embeddings[:100]))
+        self.assertEqual(embeddings[100:], [fake_embedding(text) for text in self.texts[100:]])
+        # The first batch's 4 attempts plus the other 2 batches
+        self.assertEqual(server.request_count, 6)
+        self.assertEqual(server.batch_request_count, 6)
+
+    def test_cached_embedder_batches_only_misses(self):
+        """Cached texts are not resent; misses share one batch request."""
+        with FakeGeminiServer() as server:
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            embedder.create_embeddings_batch(["cozy cottage", "luxury estate"])
+            embeddings = embedder.create_embeddings_batch(["cozy cottage", "horse property", "modern home"])
+
+        self.assertEqual(embeddings[1], fake_embedding("horse property"))
+        self.assertEqual(server.batch_request_count, 2)
+        self.assertEqual(server.texts_seen.count("cozy cottage"), 1)
+
+    def test_async_bulk_uses_batches(self):
+        """Bulk mode sends batchEmbedContents requests and bisects a rejected batch."""
+        with FakeGeminiServer(reject_texts={"listing text 7"}) as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=4, qps=1000, batch_size=100,
+                                               max_retries=0, api_base=server.api_base)
+            embeddings = embedder.embed_texts(self.texts)
+
+        self.assertIsNone(embeddings[7])
+        self.assertEqual(embeddings[200], fake_embedding("listing text 200"))
+        self.assertEqual(embedder.last_run_stats['failed'], 1)
+        self.assertLess(server.request_count, 25)
+
+
+    def test_async_bulk_resends_throttled_batches_whole(self):
+        """A 429 on a batch is waited out per Retry-After and resent unsplit; exhausted retries split nothing."""
+        with FakeGeminiServer(fail_first={"listing text 0": 2}, retry_after='0.05') as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=4, qps=1000, batch_size=100,
+                                               max_retries=3, base_delay=10.0, api_base=server.api_base)
+            start = time.monotonic()
+            embeddings = embedder.embed_texts(self.texts)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(embeddings, [fake_embedding(text) for text in self.texts])
+        # 3 packed batches, the first sent 3 times; the Retry-After wait was used, not the 10s backoff
+        self.assertEqual((server.request_count, server.batch_request_count), (5, 5))
+        self.assertEqual(embedder.last_run_stats['retries'], 2)
+        self.assertLess(elapsed, 5.0)
+
+        with FakeGeminiServer(fail_first={"listing text 0": 100}, fail_status=503, retry_after='0') as server:
+            embedder = AsyncGeminiBulkEmbedder('test-key', max_in_flight=4, qps=1000, batch_size=100,
+                                               max_retries=2, api_base=server.api_base)
+            embeddings = embedder.embed_texts(self.texts)
+
+        self.assertTrue(all(embedding is None for embedding in embeddings[:100]))
+        self.assertEqual(embeddings[100:], [fake_embedding(text) for text in self.texts[100:]])
+        # The first batch's 3 attempts plus the other 2 batches, none split or sent singly
+        self.assertEqual((server.request_count, server.batch_request_count), (5, 5))
+        self.assertEqual(embedder.last_run_stats['retries'], 2)
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    """Test cases for the in-memory query embedding cache."""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """A hit refreshes an entry, so the untouched one is evicted first."""
+        cache = QueryEmbeddingCache(max_entries=2)
+        cache.put('a', [1.0, 0.0])
+        cache.put('b', [0.0, 1.0])
+        cache.get('a')
+        cache.put('c', [1.0, 1.0])
+
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a').dtype, np.float32)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_budget_and_ttl(self):
+        """Entries are evicted to stay under max_bytes and expire after ttl seconds."""
+        now = [0.0]
+        cache = QueryEmbeddingCache(max_bytes=3 * 768 * 4, ttl=60, clock=lambda: now[0])
+        for i in range(5):
+            cache.put(f"query {i}", fake_embedding(f"query {i}", dimension=768))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.bytes, 3 * 768 * 4)
+        self.assertIsNotNone(cache.get("query 4"))
+
+        now[0] = 61
+        self.assertIsNone(cache.get("query 4"))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 1, 1))
+        self.assertEqual(stats['bytes'], 2 * 768 * 4)
+
+    def test_concurrent_access_keeps_accounting_consistent(self):
+        """Many threads reading and writing leave size and counters consistent."""
+        cache = QueryEmbeddingCache(max_bytes=50 * 8 * 4)
+
+        def worker(seed):
+            for i in range(500):
+                key = f"query {(seed * 7 + i) % 120}"
+                if cache.get(key) is None:
+                    cache.put(key, fake_embedding(key))
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 500)
+        self.assertLessEqual(stats['entries'], 50)
+        self.assertEqual(stats['bytes'], stats['entries'] * 8 * 4)
+
+    def test_embedder_answers_repeats_from_cache(self):
+        """A repeated query is served from the cache without another API call."""
+        with FakeGeminiServer() as server:
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            first = embedder.create_embedding("Cozy Cottage")
+            second = embedder.create_embedding("cozy cottage ")
+
+        self.assertEqual(server.request_count, 1)
+        np.testing.assert_allclose(second, first, rtol=1e-6)
+        self.assertEqual(embedder.stats['cache_hits'], 1)
+
+
+class TestPersistentQueryEmbeddingCache(unittest.TestCase):
+    """Test cases for the on-disk query embedding cache shared by workers."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, 'queries.sqlite3')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_cache_is_warm_after_restart(self):
+        """A new embedder on the same file answers a seen query without an API call."""
+        with FakeGeminiServer() as server:
+            cache = PersistentQueryEmbeddingCache(self.cache_path)
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base, persistent_cache=cache)
+            first = embedder.create_embedding("Cozy Cottage")
+            cache.close()
+
+            restarted = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base,
+                                                     persistent_cache=PersistentQueryEmbeddingCache(self.cache_path))
+            second = restarted.create_embedding("  cozy   cottage")
+            restarted.create_embedding("cozy cottage")
+
+        self.assertEqual(server.request_count, 1)
+        np.testing.assert_allclose(second, first, rtol=1e-6)
+        self.assertEqual((restarted.stats['disk_hits'], restarted.stats['cache_hits']), (1, 1))
+        self.assertEqual(PersistentQueryEmbeddingCache(self.cache_path, model='models/other').get("cozy cottage"), None)
+
+    def test_least_recently_used_rows_are_evicted(self):
+        """Past max_entries the rows with the oldest last use are deleted."""
+        now = [0.0]
+        cache = PersistentQueryEmbeddingCache(self.cache_path, max_entries=3, clock=lambda: now[0])
+        cache.EVICT_EVERY = 1
+        cache.TOUCH_INTERVAL = 0
+        for i in range(3):
+            now[0] += 1
+            cache.put(f"query {i}", fake_embedding(f"query {i}"))
+        now[0] += 1
+        cache.get("query 0")
+        now[0] += 1
+        cache.put("query 3", fake_embedding("query 3"))
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get("query 1"))
+        self.assertIsNotNone(cache.get("query 0"))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_concurrent_workers_share_one_file(self):
+        """Separate connections writing and reading at once each store a query once."""
+        errors = []
+
+        def worker(seed):
+            cache = PersistentQueryEmbeddingCache(self.cache_path)
+            try:
+                for i in range(100):
+                    text = f"query {(seed * 13 + i) % 40}"
+                    if cache.get(text) is None:
+                        cache.put(text, fake_embedding(text))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                cache.close()
+
+        PersistentQueryEmbeddingCache(self.cache_path).close()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cache = PersistentQueryEmbeddingCache(self.cache_path)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache), 40)
+        np.testing.assert_allclose(cache.get("query 7"), fake_embedding("query 7"), rtol=1e-6)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for coalescing concurrent identical query embeddings."""
+
+    def test_concurrent_threads_share_one_api_call(self):
+        """Threadpool callers missing on the same query make one upstream call."""
+        with FakeGeminiServer(latency=0.2) as server:
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            results = [None] * 16
+
+            def search(i):
+                results[i] = embedder.create_embedding("Merlin's shack")
+
+            threads = [threading.Thread(target=search, args=(i,)) for i in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.request_count, 1)
+        self.assertEqual(results, [fake_embedding("Merlin's shack")] * 16)
+        self.assertEqual(embedder.in_flight.coalesced, 15)
+        self.assertEqual(embedder.in_flight.in_flight(), 0)
+
+    def test_asyncio_and_thread_callers_share_one_flight(self):
+        """Coroutines and threads waiting on one key are answered by a single request."""
+        flight = SingleFlight()
+
+        async def run(server):
+            url = f"{embed_content_url(server.api_base)}?key=test-key"
+            async with httpx.AsyncClient() as client:
+                async def fetch():
+                    response = await client.post(url, json=embed_request("Merlin's shack"))
+                    return response.json()['embedding']['values']
+
+                def fetch_sync():
+                    return httpx.post(url, json=embed_request("Merlin's shack")).json()['embedding']['values']
+
+                return await asyncio.gather(
+                    *(flight.do_async("merlin's shack", fetch) for _ in range(12)),
+                    *(asyncio.to_thread(flight.do, "merlin's shack", fetch_sync) for _ in range(4))
+                )
+
+        with FakeGeminiServer(latency=0.2) as server:
+            results = asyncio.run(run(server))
+
+        self.assertEqual(server.request_count, 1)
+        self.assertEqual(results, [fake_embedding("Merlin's shack")] * 16)
+        self.assertEqual((flight.calls, flight.coalesced), (1, 15))
+
+    def test_failure_reaches_every_waiter(self):
+        """An exception in the leading call is raised to the callers that joined it."""
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ConnectionError("upstream down")
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async('q', fail) for _ in range(3)), return_exceptions=True)
+
+        errors = asyncio.run(run())
+        self.assertTrue(all(isinstance(error, ConnectionError) for error in errors))
+        self.assertEqual(flight.calls, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the embedding provider circuit breaker."""
+
+    def test_open_half_open_closed_cycle(self):
+        """Consecutive failures open it; after the reset timeout one probe decides."""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, slow_call_threshold=1.0,
+                                 clock=lambda: now[0])
+        breaker.record(False)
+        breaker.record(True, duration=2.0)  # Slow, so still a failure
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one probe at a time
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+        breaker.record(True, duration=0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()['rejected'], 2)
+        self.assertEqual(breaker.stats()['slow_calls'], 1)
+
+
+class TestQueryEmbeddingLatency(unittest.TestCase):
+    """Test cases for latency budgets, the breaker and hedging around query embedding."""
+
+    def test_brownout_latency_stays_bounded(self):
+        """A slow provider costs at most the budget per call, then nothing while the breaker is open."""
+        async def embed_all(embedder, queries):
+            timings = []
+            for query in queries:
+                start = time.monotonic()
+                embedding = await embedder.create_embedding_async(query)
+                timings.append((embedding, time.monotonic() - start))
+            return timings
+
+        with FakeGeminiServer(latency=2.0) as server:
+            breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base,
+                                                    latency_budget=0.2, breaker=breaker)
+            timings = asyncio.run(embed_all(embedder, [f"brownout query {i}" for i in range(10)]))
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertEqual(server.request_count, 3)
+
+            server.latency = 0.0
+            time.sleep(0.5)
+            recovered = embedder.create_embedding("after the brownout")
+
+        self.assertTrue(all(embedding is None for embedding, _ in timings))
+        self.assertLess(max(elapsed for _, elapsed in timings), 0.5)
+        self.assertLess(sum(elapsed for _, elapsed in timings[3:]), 0.05)
+        self.assertEqual(embedder.stats['breaker_rejections'], 7)
+        self.assertEqual(recovered, fake_embedding("after the brownout"))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_sync_call_is_bounded_by_the_budget(self):
+        """create_embedding gives up at the budget, not after the connect and read timeouts."""
+        def trickling_post(*args, **kwargs):
+            # Each socket read finishes inside the read timeout, but the whole response takes a second
+            time.sleep(1.0)
+            raise requests.ConnectionError("response never completed")
+
+        embedder = CachedGeminiPropertyEmbedder('test-key', latency_budget=0.2)
+        with mock.patch('cached_gemini_embedder.requests.post', trickling_post):
+            start = time.monotonic()
+            embedding = embedder.create_embedding("stalled sync query")
+            elapsed = time.monotonic() - start
+
+        self.assertIsNone(embedding)
+        self.assertLess(elapsed, 0.5)
+
+    def test_bad_requests_do_not_open_the_breaker(self):
+        """A 400 for one query says nothing about the provider's health."""
+        with FakeGeminiServer(reject_texts={"bad query"}) as server:
+            breaker = CircuitBreaker(failure_threshold=2)
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base, breaker=breaker)
+            for _ in range(3):
+                self.assertIsNone(embedder.create_embedding("bad query"))
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_calls_do_not_log_the_api_key(self):
+        """Provider errors are printed, but the key travels in a header and never appears in them."""
+        async def run(embedder):
+            single = await embedder.create_embedding_async("rejected query")
+            batch = await embedder.create_embeddings_batch_async(["rejected query", "other query"])
+            await embedder.aclose()
+            return single, batch
+
+        output = io.StringIO()
+        with FakeGeminiServer(reject_texts={"rejected query"}) as server, contextlib.redirect_stdout(output):
+            embedder = CachedGeminiPropertyEmbedder('secret-test-key', api_base=server.api_base)
+            self.assertIsNone(embedder.create_embedding("rejected query"))
+            single, batch = asyncio.run(run(embedder))
+
+        self.assertIsNone(single)
+        self.assertEqual(batch, [None, None])
+        self.assertIn("Error creating", output.getvalue())
+        self.assertNotIn("secret-test-key", output.getvalue())
+
+    def test_slow_call_is_hedged(self):
+        """A call outliving the recent p95 is raced by a second request, which wins."""
+        async def run(embedder):
+            for i in range(20):
+                await embedder.create_embedding_async(f"warm query {i}")
+            start = time.monotonic()
+            embedding = await embedder.create_embedding_async("stalled query")
+            return embedding, time.monotonic() - start
+
+        with FakeGeminiServer(slow_first={"stalled query": 1}, slow_latency=2.0) as server:
+            embedder = CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base, hedge=True)
+            embedding, elapsed = asyncio.run(run(embedder))
+
+        self.assertEqual(embedding, fake_embedding("stalled query"))
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(embedder.stats['hedged_calls'], 1)
+        self.assertEqual(server.texts_seen.count("stalled query"), 2)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Test cases for the persistent content-addressed embedding cache."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_rerun_only_embeds_changed_texts(self):
+        """Unchanged texts come from the cache on a re-run; edited ones are re-embedded."""
+        texts = [f"listing text {i}" for i in range(20)]
+        with FakeGeminiServer() as server:
+            embedder = GeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            cache = EmbeddingCache(self.cache_path, GEMINI_EMBEDDING_MODEL, 8)
+            embed_with_cache(texts, embedder.create_embeddings_batch, cache)
+            cache.close()
+            self.assertEqual(len(server.texts_seen), 20)
+
+            texts[3] = "listing text 3, now with a pool"
+            cache = EmbeddingCache(self.cache_path, GEMINI_EMBEDDING_MODEL, 8)
+            embeddings = embed_with_cache(texts, embedder.create_embeddings_batch, cache)
+            cache.close()
+
+        self.assertEqual(server.texts_seen[20:], ["listing text 3, now with a pool"])
+        for text, embedding in zip(texts, embeddings):
+            np.testing.assert_allclose(embedding, fake_embedding(text), rtol=1e-6)
+
+    def test_key_depends_on_model_and_dimension(self):
+        """The same text under another model or dimension is a cache miss."""
+        cache = EmbeddingCache(self.cache_path, GEMINI_EMBEDDING_MODEL, 8)
+        cache.put_many(["cozy cottage"], [fake_embedding("cozy cottage")])
+        cache.close()
+
+        other_model = EmbeddingCache(self.cache_path, "text-embedding-ada-002", 8)
+        self.assertEqual(other_model.get_many(["cozy cottage"]), [None])
+        other_model.close()
+        other_dimension = EmbeddingCache(self.cache_path, GEMINI_EMBEDDING_MODEL, 16)
+        self.assertEqual(other_dimension.get_many(["cozy cottage"]), [None])
+        other_dimension.close()
+
+
+class TestEmbeddingJournal(unittest.TestCase):
+    """Test cases for checkpointed, resumable embedding jobs."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal = EmbeddingJournal(os.path.join(self.temp_dir.name, 'run.journal.ndjson'))
+        self.listing_ids = [f"MLS{i}" for i in range(50)]
+        self.texts = [f"listing text {i}" for i in range(50)]
+        self.sent = []
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def embed(self, texts):
+        self.sent.extend(texts)
+        return [fake_embedding(text) for text in texts]
+
+    def test_resume_skips_journaled_listings(self):
+        """A run that dies mid-way resumes without re-embedding finished chunks."""
+        def crash_on_third_chunk(texts):
+            if len(self.sent) >= 20:
+                raise ConnectionError("network went away")
+            return self.embed(texts)
+
+        with self.assertRaises(ConnectionError):
+            embed_with_journal(self.listing_ids, self.texts, crash_on_third_chunk, self.journal, chunk_size=10)
+        # Simulate a torn write from the crash
+        with open(self.journal.path, 'a') as f:
+            f.write('{"listing_id": "MLS2')
+
+        self.sent = []
+        self.texts[5] = "listing text 5, price reduced"
+        embeddings = embed_with_journal(self.listing_ids, self.texts, self.embed, self.journal,
+                                        resume=True, chunk_size=10)
+
+        self.assertEqual(self.sent, [self.texts[5]] + self.texts[20:])
+        self.assertEqual(embeddings, [fake_embedding(text) for text in self.texts])
+
+    def test_records_after_a_torn_line_survive(self):
+        """The first record appended after a torn line is not glued onto it and lost."""
+        embed_with_journal(self.listing_ids[:10], self.texts[:10], self.embed, self.journal)
+        with open(self.journal.path, 'a') as f:
+            f.write('{"listing_id": "MLS1')
+
+        embed_with_journal(self.listing_ids, self.texts, self.embed, self.journal, resume=True, chunk_size=10)
+        self.sent = []
+        embed_with_journal(self.listing_ids, self.texts, self.embed, self.journal, resume=True)
+
+        self.assertEqual(self.sent, [])
+        self.assertEqual(len(self.journal.load()), 50)
+
+    def test_failed_items_are_retried_on_resume(self):
+        """Embeddings that came back as None are not journaled."""
+        embed_with_journal(self.listing_ids, self.texts,
+                           lambda texts: [None if t == "listing text 7" else fake_embedding(t) for t in texts],
+                           self.journal)
+        self.sent = []
+        embed_with_journal(self.listing_ids, self.texts, self.embed, self.journal, resume=True)
+        self.assertEqual(self.sent, ["listing text 7"])
+
+    def test_journal_removed_after_store_is_written(self):
+        """A complete run compacts into the .npy store and drops the journal."""
+        listings = [{'listing_id': listing_id, 'enhanced_description': text, 'price': 0}
+                    for listing_id, text in zip(self.listing_ids, self.texts)]
+        json_path = os.path.join(self.temp_dir.name, 'enhanced_listings.json')
+        store_path = os.path.join(self.temp_dir.name, 'embeddings.npy')
+        with open(json_path, 'w') as f:
+            json.dump(listings, f)
+
+        with FakeGeminiServer() as server:
+            embedder = GeminiPropertyEmbedder('test-key', api_base=server.api_base)
+            embedder.process_enhanced_listings(json_path, store_path)
+
+        self.assertFalse(os.path.exists(journal_path_for(store_path)))
+        self.assertEqual(load_embedding_store(store_path)['listing_ids'], self.listing_ids)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
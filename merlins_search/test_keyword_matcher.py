@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass keyword matcher
+"""
+
+import random
+import unittest
+from keyword_matcher import KeywordMatcher
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """The matcher must agree with `in` and str.count for every keyword."""
+
+    def test_overlapping_and_prefix_keywords(self):
+        """Keywords inside, overlapping or prefixing others are all found."""
+        matcher = KeywordMatcher(['pool', 'pools', 'pool house', 'horse', 'ho', 'use', 'Garden'], use_regex=True)
+        text = "two pools and a pool house near the horse barn; no garden"
+        self.assertEqual(matcher.find(text), {'pool', 'pools', 'pool house', 'horse', 'ho', 'use', 'garden'})
+        self.assertEqual(matcher.count("aaaa pool pools")['pool'], 2)
+        self.assertEqual(KeywordMatcher(['aa'], use_regex=True).count("aaaaa"), {'aa': 2})
+
+    def test_agrees_with_substring_search(self):
+        """Randomised vocabularies and texts give the same answers in both modes."""
+        rng = random.Random(42)
+        for _ in range(500):
+            keywords = [''.join(rng.choice('ab c') for _ in range(rng.randint(1, 4)))
+                        for _ in range(rng.randint(0, 8))]
+            text = ''.join(rng.choice('abc .') for _ in range(rng.randint(0, 40)))
+            for use_regex in (True, False):
+                matcher = KeywordMatcher(keywords, use_regex=use_regex)
+                self.assertEqual(matcher.find(text), {k for k in matcher.keywords if k in text})
+                self.assertEqual(matcher.count(text), {k: text.count(k) for k in matcher.keywords})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
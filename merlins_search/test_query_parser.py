@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for rule-based query understanding
+"""
+
+import unittest
+from query_parser import QueryParser
+
+
+class TestQueryParser(unittest.TestCase):
+    """Constraints become filters; the vibe words are left to embed."""
+
+    def setUp(self):
+        self.parser = QueryParser(cities=['Grass Valley', 'Nevada City', 'Penn Valley'],
+                                  zip_codes=['95945', '95959'],
+                                  styles=['Victorian', 'Ranch', 'Cabin', 'Other'])
+
+    def test_numeric_and_place_constraints(self):
+        """Prices, rooms, acreage, known cities, zips and styles are extracted and removed."""
+        self.assertEqual(self.parser.parse("3 bed under 800k in Grass Valley"),
+                         ({'max_price': 800000.0, 'min_bedrooms': 3.0, 'city': 'grass valley'}, ''))
+        self.assertEqual(self.parser.parse("Quiet Victorian with 2+ baths between $400,000 and $650,000"),
+                         ({'min_price': 400000.0, 'max_price': 650000.0, 'min_bathrooms': 2.0,
+                           'architectural_style': 'victorian'}, 'Quiet'))
+        self.assertEqual(self.parser.parse("horse property, 5+ acres near 95959"),
+                         ({'min_acres': 5.0, 'zip_code': '95959'}, 'horse'))
+        self.assertEqual(self.parser.parse("two bedroom ranch under 2 acres over $1.2m"),
+                         ({'min_price': 1200000.0, 'min_bedrooms': 2.0, 'max_acres': 2.0,
+                           'architectural_style': 'ranch'}, ''))
+
+    def test_vibe_text_is_left_alone(self):
+        """Vibe styles, unknown places and small bare numbers are not filters."""
+        self.assertEqual(self.parser.parse("Merlin's shack"), ({}, "Merlin's shack"))
+        self.assertEqual(self.parser.parse("cozy cabin under $500k"), ({'max_price': 500000.0}, 'cozy cabin'))
+        self.assertEqual(self.parser.parse("2 car garage in Auburn 95602"), ({}, '2 car garage in Auburn 95602'))
+        self.assertEqual(self.parser.parse("other"), ({}, 'other'))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -6,6 +6,7 @@ Test the Merlin's Shack semantic search with a demo API key setup.
 import os
 import json
 from embedding_generator import PropertyEmbeddingGenerator
+from keyword_matcher import KeywordMatcher
 
 def demo_search_system():
     """Demo the search system with sample data if no API key available."""
@@ -26,19 +27,19 @@ def demo_search_system():
     # Look for cottage-like, rustic, or character properties
     merlin_candidates = []
     
+    # Look for Merlin-esque keywords
+    merlin_matcher = KeywordMatcher([
+        'cottage', 'cabin', 'rustic', 'character', 'woodsy', 'secluded', 
+        'magical', 'charming', 'cozy', 'retreat', 'log', 'fairytale',
+        'artisan', 'unique', 'whimsical'
+    ])
+    
     for listing in listings:
         desc = listing['enhanced_description'].lower()
         address = listing['address']
         price = listing['price']
         
-        # Look for Merlin-esque keywords
-        merlin_keywords = [
-            'cottage', 'cabin', 'rustic', 'character', 'woodsy', 'secluded', 
-            'magical', 'charming', 'cozy', 'retreat', 'log', 'fairytale',
-            'artisan', 'unique', 'whimsical'
-        ]
-        
-        score = sum(1 for keyword in merlin_keywords if keyword in desc)
+        score = len(merlin_matcher.find(desc))
         
         if score >= 2:  # Properties with at least 2 magical keywords
             merlin_candidates.append({
@@ -0,0 +1,875 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the in-memory search indexes (no server or API key required)
+"""
+
+import asyncio
+import json
+import math
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import httpx
+import numpy as np
+import property_search_api
+from attribute_index import AttributeIndex, parse_price_range
+from cached_gemini_embedder import CachedGeminiPropertyEmbedder
+from circuit_breaker import CircuitBreaker
+from data_processor import PropertyVibeEnhancer
+from embedding_store import (
+    apply_delta_to_store,
+    convert_json_embeddings,
+    load_embedding_store,
+    sidecar_path,
+    verify_embedding_store
+)
+from embedding_text import build_embedding_text
+from fake_gemini_server import FakeGeminiServer, fake_embedding
+from gemini_embedder import GeminiPropertyEmbedder
+from index_reloader import IndexReloader
+from lexical_index import LexicalIndex, tokenize
+from listing_io import write_listings
+from listing_log import ListingChangeLog, record_listing_id
+from listing_manifest import save_manifest
+from rank_fusion import reciprocal_rank_fusion
+from result_cache import SearchResultCache
+from security_config import security_config
+from vector_index import PropertyVectorIndex
+
+
+def make_embeddings_data(count: int = 50, dimension: int = 16, seed: int = 7):
+    """Build a small synthetic embeddings payload in the on-disk JSON format."""
+    rng = np.random.default_rng(seed)
+    listings = []
+    for i in range(count):
+        listings.append({
+            'listing_id': 1000 + i,
+            'address': f"{i} Test Lane, Grass Valley",
+            'price': 300000 + i * 10000,
+            'enhanced_description': f"Test property number {i}",
+            'embedding': rng.normal(size=dimension).tolist()
+        })
+    return {
+        'listings': listings,
+        'metadata': {'total_properties': count, 'embedding_dimension': dimension}
+    }
+
+
+def brute_force_ranking(query, listings):
+    """Reference cosine ranking matching the original per-listing loop."""
+    query_vec = np.array(query)
+    scored = []
+    for listing in listings:
+        vec = np.array(listing['embedding'])
+        score = np.dot(query_vec, vec) / (np.linalg.norm(query_vec) * np.linalg.norm(vec))
+        scored.append((score, listing['listing_id']))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored
+
+
+def brute_force_bm25(query_terms, texts, k1=1.2, b=0.75):
+    """Reference BM25 scores computed text by text."""
+    docs = [tokenize(text) for text in texts]
+    avg_length = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in query_terms:
+            df = sum(1 for other in docs if term in other)
+            tf = doc.count(term)
+            if tf:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+class TestPropertyVectorIndex(unittest.TestCase):
+    """Test cases for the preloaded embedding matrix."""
+
+    def setUp(self):
+        self.data = make_embeddings_data()
+        self.index = PropertyVectorIndex.from_embeddings_data(self.data)
+
+    def test_matrix_layout(self):
+        """Matrix is contiguous float32 with unit-length rows."""
+        self.assertEqual(self.index.matrix.dtype, np.float32)
+        self.assertTrue(self.index.matrix.flags['C_CONTIGUOUS'])
+        norms = np.linalg.norm(self.index.matrix, axis=1)
+        np.testing.assert_allclose(norms, 1.0, rtol=1e-5)
+        self.assertEqual(list(self.index.listing_ids[:3]), [1000, 1001, 1002])
+
+    def test_search_matches_brute_force(self):
+        """Top-k order and scores match the per-listing cosine loop."""
+        query = np.random.default_rng(1).normal(size=16).tolist()
+        expected = brute_force_ranking(query, self.data['listings'])[:5]
+
+        results = self.index.search(query, top_k=5)
+
+        self.assertEqual([r['listing_id'] for r in results], [listing_id for _, listing_id in expected])
+        for result, (score, _) in zip(results, expected):
+            self.assertAlmostEqual(result['similarity_score'], score, places=5)
+            self.assertNotIn('embedding', result)
+
+    def test_top_k_larger_than_index(self):
+        """Asking for more results than rows returns every row."""
+        query = self.data['listings'][3]['embedding']
+        results = self.index.search(query, top_k=500)
+        self.assertEqual(len(results), len(self.data['listings']))
+        self.assertEqual(results[0]['listing_id'], 1003)
+
+    def test_search_restricted_to_rows(self):
+        """Candidate rows give the brute-force ranking of just those listings."""
+        query = np.random.default_rng(2).normal(size=16).tolist()
+        rows = np.arange(0, 50, 3)
+        expected = brute_force_ranking(query, [self.data['listings'][row] for row in rows])[:4]
+
+        results = self.index.search(query, top_k=4, rows=rows)
+
+        self.assertEqual([r['listing_id'] for r in results], [listing_id for _, listing_id in expected])
+        self.assertEqual(self.index.search(query, top_k=4, rows=np.array([], dtype=int)), [])
+
+    def test_unusable_query(self):
+        """Zero or wrongly sized query vectors return no results."""
+        self.assertEqual(self.index.search([0.0] * 16), [])
+        self.assertEqual(self.index.search([1.0] * 8), [])
+
+
+class TestLexicalIndex(unittest.TestCase):
+    """Test cases for the BM25 inverted index."""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        vocabulary = ['cozy', 'cabin', 'rustic', 'pool', 'views', 'barn', 'creek', 'garden', 'Oak']
+        self.listings = [
+            {'listing_id': i,
+             'enhanced_description': ' '.join(rng.choice(vocabulary, size=rng.integers(1, 12))),
+             'address': f"{i} Oak St",
+             'price': None if i == 4 else 100000.0 * i}
+            for i in range(40)
+        ]
+        self.index = LexicalIndex(self.listings, ['enhanced_description', 'address'])
+        self.texts = [f"{listing['enhanced_description']} {listing['address']}" for listing in self.listings]
+
+    def test_scores_match_brute_force(self):
+        """Posting-only scoring equals BM25 computed over every listing."""
+        query = ['cozy', 'creek', 'oak', 'cozy', 'missing']
+        expected = brute_force_bm25(query, self.texts)
+
+        rows, scores = self.index.score(query)
+        self.assertEqual(rows.tolist(), [row for row, score in enumerate(expected) if score > 0])
+        np.testing.assert_allclose(scores, [expected[row] for row in rows], rtol=1e-5)
+
+        top_rows, _ = self.index.top_k(query, top_k=5)
+        expected_order = sorted(range(len(expected)), key=lambda row: (-round(expected[row], 4), row))
+        self.assertEqual(top_rows.tolist(), expected_order[:5])
+
+    def test_boosts_and_attributes(self):
+        """Boost rows become candidates; attributes are NaN where missing."""
+        rows, scores = self.index.score(['nothing'], boosts=[([2, 7], 10)])
+        self.assertEqual((rows.tolist(), scores.tolist()), ([2, 7], [10.0, 10.0]))
+
+        price = self.index.attribute('price')
+        self.assertTrue(np.isnan(price[4]))
+        self.assertEqual(price[3], 300000.0)
+        self.assertEqual(self.index.rows_with_all(['cabin', 'oak']).tolist(),
+                         [row for row, text in enumerate(self.texts) if 'cabin' in tokenize(text)])
+
+
+class TestAttributeIndex(unittest.TestCase):
+    """Test cases for columnar attribute filtering."""
+
+    def setUp(self):
+        self.listings = [
+            {'listing_id': 1, 'price': 350000.0, 'bedrooms': '3 (4)', 'lot_acres': 0.5, 'city': 'Grass Valley',
+             'zip_code': 95945, 'architectural_style': 'Ranch,Contemporary', 'status': 'Active'},
+            {'listing_id': 2, 'price': 900000.0, 'bedrooms': '5', 'lot_acres': 10.0, 'city': 'Nevada City',
+             'zip_code': 95959, 'architectural_style': 'Victorian', 'status': 'Active'},
+            {'listing_id': 3, 'price': None, 'bedrooms': '2', 'lot_acres': None, 'city': 'grass valley ',
+             'zip_code': 95945, 'architectural_style': None, 'status': 'Pending'},
+            {'listing_id': 4, 'price': 450000.0, 'bedrooms': '3', 'lot_acres': 2.0, 'city': 'Penn Valley',
+             'zip_code': 95946, 'architectural_style': 'Contemporary', 'status': 'Active'},
+        ]
+        self.index = AttributeIndex(self.listings)
+
+    def ids(self, **filters):
+        rows = self.index.rows(filters)
+        return None if rows is None else [self.listings[row]['listing_id'] for row in rows]
+
+    def test_filters(self):
+        """Ranges are inclusive, categories are case-insensitive and missing values never match."""
+        self.assertIsNone(self.ids(city=None))
+        self.assertEqual(self.ids(city='GRASS VALLEY'), [1, 3])
+        self.assertEqual(self.ids(min_bedrooms=3, max_price=450000), [1, 4])
+        self.assertEqual(self.ids(architectural_style='contemporary'), [1, 4])
+        self.assertEqual(self.ids(property_type='Ranch', zip_code='95945'), [1])
+        self.assertEqual(self.ids(price_range='400k-1m', min_acres=2), [2, 4])
+        self.assertEqual(self.ids(status='Sold'), [])
+
+    def test_invalid_filters(self):
+        """Malformed price ranges and unknown filter names are rejected."""
+        self.assertEqual(parse_price_range('$300,000 - $500,000'), (300000.0, 500000.0))
+        self.assertEqual(parse_price_range('under 1.5m'), (None, 1500000.0))
+        with self.assertRaises(ValueError):
+            parse_price_range('cheap')
+        with self.assertRaises(ValueError):
+            self.index.mask({'garage': 2})
+
+
+class TestHybridSearch(unittest.TestCase):
+    """Test cases for rank fusion of text and semantic candidates."""
+
+    def test_reciprocal_rank_fusion(self):
+        """Ids ranked well by both lists win; ties go to the earliest appearance."""
+        ids, scores = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([3, 4, 1])], top_k=4, k=0)
+        self.assertEqual(ids.tolist(), [1, 3, 2, 4])
+        np.testing.assert_allclose(scores, [(1 + 1 / 3) / 2, (1 / 3 + 1) / 2, 1 / 4, 1 / 4])
+        self.assertEqual(len(reciprocal_rank_fusion([np.array([])], top_k=3)[0]), 0)
+
+    def test_hybrid_keeps_exact_terms_and_degrades_to_text(self):
+        """A street-name hit reaches the results next to semantic hits, and survives a failed query embedding."""
+        listings = [{'listing_id': 2000 + i, 'address': f"{i} Pine Rd", 'price': 500000,
+                     'enhanced_description': f"Listing {i} with a garden"} for i in range(30)]
+        listings[17]['address'] = "17 Horseshoe Bar Rd"
+        embeddings_data = {'listings': [dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+                                        for listing in listings]}
+        embedding_index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+        query = "horseshoe bar"
+
+        with FakeGeminiServer(reject_texts={"broken query horseshoe"}) as server, \
+                mock.patch.multiple(property_search_api,
+                                    search_indexes=property_search_api.SearchIndexes(listings, None, embedding_index),
+                                    gemini_embedder=GeminiPropertyEmbedder('test-key', api_base=server.api_base)):
+            semantic_ids = embedding_index.listing_ids[embedding_index.top_k(fake_embedding(query), 5)[0]].tolist()
+            results = property_search_api.hybrid_search_properties(query, limit=5)
+            degraded = property_search_api.hybrid_search_properties("broken query horseshoe", limit=5)
+
+        ids = [result['id'] for result in results]
+        self.assertEqual(ids[0], 2017)
+        self.assertEqual(ids[1:], [listing_id for listing_id in semantic_ids if listing_id != 2017][:4])
+        self.assertEqual(results[0]['search_type'], 'hybrid')
+        self.assertEqual([result['id'] for result in degraded], [2017])
+
+
+class TestNonBlockingSearch(unittest.TestCase):
+    """Test cases for serving concurrent searches from one event loop."""
+
+    def test_throughput_scales_with_concurrent_clients(self):
+        """Searches waiting on a slow embedding API overlap instead of queueing."""
+        listings = [{'listing_id': 3000 + i, 'address': f"{i} Oak St", 'price': 400000 + i,
+                     'enhanced_description': f"Listing {i} near the river"} for i in range(40)]
+        embeddings_data = {'listings': [dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+                                        for listing in listings]}
+
+        async def search(client, query):
+            response = await client.post('/search', json={'query': query, 'mode': 'semantic'})
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        async def run():
+            transport = httpx.ASGITransport(app=property_search_api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                start = time.monotonic()
+                await search(client, "warm up the connection pool")
+                single = time.monotonic() - start
+
+                start = time.monotonic()
+                searches = asyncio.gather(*(search(client, f"riverside retreat {i}") for i in range(8)))
+                await asyncio.sleep(0.05)
+                health_start = time.monotonic()
+                health = await client.get('/health')
+                health_time = time.monotonic() - health_start
+                results = await searches
+                return single, time.monotonic() - start, health, health_time, results
+
+        with FakeGeminiServer(latency=0.3) as server, \
+                mock.patch.multiple(property_search_api, result_cache=SearchResultCache(),
+                                    search_indexes=property_search_api.SearchIndexes(
+                                        listings, embeddings_data,
+                                        PropertyVectorIndex.from_embeddings_data(embeddings_data)),
+                                    gemini_embedder=CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base,
+                                                                                 breaker=CircuitBreaker())):
+            single, concurrent, health, health_time, results = asyncio.run(run())
+
+        self.assertEqual(server.request_count, 9)
+        self.assertGreater(server.max_in_flight, 1)
+        # Eight searches finish in far less than eight sequential embedding round trips
+        self.assertLess(concurrent, 3 * single)
+        self.assertLess(health_time, 0.2)
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(health.json()['embedding_breaker']['state'], 'closed')
+        self.assertEqual(results[0]['results'][0]['search_type'], 'semantic_embedding')
+
+
+class TestBatchSearch(unittest.TestCase):
+    """Test cases for scoring many searches in one request."""
+
+    def test_top_k_batch_matches_top_k(self):
+        """Blocked Q @ M.T scoring returns what per-query top_k returns, filtered or not."""
+        index = PropertyVectorIndex.from_embeddings_data(make_embeddings_data(count=300))
+        index.BATCH_BLOCK_ROWS = 64
+        rng = np.random.default_rng(3)
+        queries = list(rng.normal(size=(6, 16)))
+        limits = [1, 5, 20, 5, 0, 400]
+        rows = [None, None, np.arange(0, 300, 7), None, None, None]
+
+        batch = index.top_k_batch(queries, limits, rows)
+        for query, limit, query_rows, (batch_rows, batch_scores) in zip(queries, limits, rows, batch):
+            expected_rows, expected_scores = index.top_k(query, limit, query_rows)
+            np.testing.assert_array_equal(batch_rows, expected_rows)
+            np.testing.assert_allclose(batch_scores, expected_scores, atol=1e-5)
+
+    def test_batch_endpoint_embeds_misses_in_one_request(self):
+        """Every search is answered as /search would, after one batchEmbedContents call."""
+        listings = [{'listing_id': 4000 + i, 'address': f"{i} Elm St", 'price': 300000 + 20000 * i,
+                     'enhanced_description': f"Listing {i} with a garden and a barn"} for i in range(40)]
+        embeddings_data = {'listings': [dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+                                        for listing in listings]}
+        searches = [
+            {'query': "quiet garden retreat", 'mode': 'semantic', 'limit': 3},
+            {'query': "barn for horses", 'mode': 'semantic', 'limit': 5, 'max_price': 700000},
+            {'query': "Quiet  garden retreat", 'mode': 'semantic', 'limit': 2},
+            {'query': "17 Elm St", 'mode': 'hybrid', 'limit': 10},
+            {'query': "garden", 'mode': 'text', 'limit': 3},
+        ]
+
+        async def run():
+            transport = httpx.ASGITransport(app=property_search_api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                batch = await client.post('/search/batch', json={'searches': searches})
+                single = [await client.post('/search', json=search) for search in searches]
+                too_many = await client.post('/search/batch', json={'searches': [searches[0]] * 51})
+                return batch, single, too_many
+
+        with FakeGeminiServer() as server, \
+                mock.patch.multiple(property_search_api, result_cache=SearchResultCache(),
+                                    search_indexes=property_search_api.SearchIndexes(
+                                        listings, embeddings_data,
+                                        PropertyVectorIndex.from_embeddings_data(embeddings_data)),
+                                    gemini_embedder=CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)):
+            batch, single, too_many = asyncio.run(run())
+
+        self.assertEqual(batch.status_code, 200)
+        # Three distinct query texts, one request; the single searches then hit the cache
+        self.assertEqual((server.request_count, server.batch_request_count), (1, 1))
+        self.assertEqual(len(server.texts_seen), 3)
+        responses = batch.json()['responses']
+        self.assertEqual(batch.json()['total_searches'], 5)
+        for response, expected in zip(responses, single):
+            expected = expected.json()
+            self.assertEqual(response['filters'], expected['filters'])
+            self.assertEqual([result['id'] for result in response['results']],
+                             [result['id'] for result in expected['results']])
+            np.testing.assert_allclose([result['similarity_score'] for result in response['results']],
+                                       [result['similarity_score'] for result in expected['results']], atol=1e-5)
+        self.assertEqual([result['search_type'] for result in responses[0]['results']], ['semantic_embedding'] * 3)
+        self.assertIn(4017, [result['id'] for result in responses[3]['results']])
+        self.assertEqual(too_many.status_code, 422)
+
+
+class TestSearchResultCache(unittest.TestCase):
+    """Test cases for caching finished search results."""
+
+    def test_lru_ttl_and_index_versions(self):
+        """Least recently used and expired entries go; a reload drops everything, including late writes."""
+        now = [0.0]
+        cache = SearchResultCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', 1, cache.version)
+        cache.put('b', 2, cache.version)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, cache.version)
+        self.assertIsNone(cache.get('b'))
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+
+        started_version = cache.version
+        self.assertTrue(cache.put('d', 4, started_version))
+        cache.invalidate()
+        self.assertIsNone(cache.get('d'))
+        # A search that started before the reload must not cache its result
+        self.assertFalse(cache.put('e', 5, started_version))
+        self.assertIsNone(cache.get('e'))
+        self.assertEqual(cache.stats(), {'entries': 0, 'max_entries': 2, 'index_version': 1, 'hits': 1,
+                                         'misses': 4, 'hit_rate': 0.2, 'evictions': 1, 'expirations': 1,
+                                         'invalidations': 1})
+
+    def test_repeated_searches_skip_embedding_and_scoring_until_reload(self):
+        """Normalised repeats hit the cache; reloading the listings invalidates it."""
+        listings = [{'listing_id': 5000 + i, 'address': f"{i} Pine St", 'price': 350000 + 10000 * i,
+                     'enhanced_description': f"Listing {i} with a sunny garden"} for i in range(20)]
+        embeddings_data = {'listings': [dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+                                        for listing in listings]}
+        reloaded = [dict(listing, price=listing['price'] + 1) for listing in listings]
+        embedding_index = PropertyVectorIndex.from_embeddings_data(embeddings_data)
+
+        async def run():
+            transport = httpx.ASGITransport(app=property_search_api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                search = {'query': "sunny garden", 'mode': 'semantic', 'limit': 3}
+                first = await client.post('/search', json=search)
+                with mock.patch.object(property_search_api, 'semantic_search_with_embedding',
+                                       side_effect=AssertionError("scored a cached search")):
+                    repeat = await client.post('/search', json=dict(search, query="  Sunny   GARDEN "))
+                other_limit = await client.post('/search', json=dict(search, limit=4))
+                text = {'query': "garden", 'mode': 'text', 'limit': 1}
+                before = await client.post('/search', json=text)
+                property_search_api.publish_search_indexes(
+                    property_search_api.SearchIndexes(reloaded, embeddings_data, embedding_index))
+                after = await client.post('/search', json=text)
+                health = await client.get('/health')
+                return first, repeat, other_limit, before, after, health
+
+        with FakeGeminiServer() as server, tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.multiple(property_search_api, result_cache=SearchResultCache(),
+                                    search_indexes=property_search_api.SearchIndexes(listings, embeddings_data,
+                                                                                     embedding_index),
+                                    listing_log=ListingChangeLog(os.path.join(tmp, 'changes.ndjson')),
+                                    gemini_embedder=CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)):
+            first, repeat, other_limit, before, after, health = asyncio.run(run())
+
+        self.assertEqual(repeat.status_code, 200)
+        self.assertEqual(repeat.json()['results'], first.json()['results'])
+        self.assertEqual(repeat.json()['query'], "Sunny   GARDEN")
+        self.assertEqual(len(other_limit.json()['results']), 4)
+        self.assertEqual(server.request_count, 1)
+        # The reload's new prices are served, not the cached results
+        self.assertEqual(int(after.json()['results'][0]['price'].strip('$').replace(',', '')),
+                         int(before.json()['results'][0]['price'].strip('$').replace(',', '')) + 1)
+        stats = health.json()['result_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (1, 4, 1))
+
+
+class TestIndexReload(unittest.TestCase):
+    """Test cases for rebuilding indexes in the background and swapping them in."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'listings.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, text: str, mtime_ns: int):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_reloader_waits_for_writes_and_survives_bad_files(self):
+        """A change is built once it holds still for a poll; a broken file leaves the last index serving."""
+        class Generation:
+            def __init__(self, path):
+                with open(path) as f:
+                    self.data = json.load(f)
+
+        current = {}
+        reloader = IndexReloader(lambda: [self.path], lambda: Generation(self.path),
+                                 lambda index: current.update(index=index))
+        self.write('[1]', 1_000_000_000)
+        self.assertTrue(reloader.load())
+        self.assertFalse(reloader.check())
+
+        self.write('[1, 2]', 2_000_000_000)
+        self.assertFalse(reloader.check())
+        self.assertEqual(current['index'].data, [1])
+        self.assertTrue(reloader.check())
+        self.assertEqual(current['index'].data, [1, 2])
+
+        self.write('[1, 2', 3_000_000_000)
+        self.assertFalse(reloader.check())
+        self.assertFalse(reloader.check())
+        self.assertFalse(reloader.check())
+        self.assertEqual(current['index'].data, [1, 2])
+        self.assertEqual((reloader.failures, reloader.generation), (1, 2))
+        self.assertIsNotNone(reloader.stats()['last_error'])
+
+        self.write('[1, 2, 3]', 4_000_000_000)
+        reloader.check()
+        self.assertTrue(reloader.check())
+        stats = reloader.stats()
+        self.assertEqual((stats['generation'], stats['reloads'], stats['retired']), (3, 3, 2))
+        self.assertIsNone(stats['last_error'])
+
+    def test_background_reload_swaps_api_indexes(self):
+        """The API picks up changed files without a restart; a request holding the old generation keeps it."""
+        listings = [{'listing_id': 6000 + i, 'address': f"{i} Cedar Ln", 'price': 450000,
+                     'enhanced_description': f"Listing {i} with a quiet porch"} for i in range(10)]
+        added = {'listing_id': 6100, 'address': "1 Willow Way", 'price': 520000,
+                 'enhanced_description': "Listing with a willow pond"}
+
+        def write_files(listings):
+            write_listings(os.path.join(self.tmp.name, 'enhanced_listings.json'), listings)
+            with open(os.path.join(self.tmp.name, 'embeddings.json'), 'w') as f:
+                json.dump({'listings': [dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+                                        for listing in listings]}, f)
+
+        async def search(query, mode):
+            transport = httpx.ASGITransport(app=property_search_api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                response = await client.post('/search', json={'query': query, 'mode': mode, 'limit': 1,
+                                                              'parse_query': False})
+                return response.json(), (await client.get('/health')).json()
+
+        listings_path = os.path.join(self.tmp.name, 'enhanced_listings.json')
+        write_files(listings)
+        with FakeGeminiServer() as server, \
+                mock.patch.multiple(property_search_api, result_cache=SearchResultCache(),
+                                    search_indexes=property_search_api.SearchIndexes(),
+                                    listing_log=ListingChangeLog(os.path.join(self.tmp.name, 'changes.ndjson')),
+                                    LISTING_MANIFEST_PATH=os.path.join(self.tmp.name, 'manifest.json'),
+                                    DEFAULT_LISTINGS_PATHS=[listings_path],
+                                    default_listings_path=lambda: listings_path,
+                                    EMBEDDING_STORE_PATH=os.path.join(self.tmp.name, 'missing.npy'),
+                                    EMBEDDINGS_JSON_PATH=os.path.join(self.tmp.name, 'embeddings.json'),
+                                    gemini_embedder=CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)):
+            reloader = IndexReloader(property_search_api.index_source_paths, property_search_api.build_search_indexes,
+                                     property_search_api.publish_search_indexes, interval=0.05)
+            with mock.patch.object(property_search_api, 'index_reloader', reloader):
+                reloader.load()
+                before, _ = asyncio.run(search(added['enhanced_description'], 'semantic'))
+                in_flight = property_search_api.search_indexes
+
+                reloader.start()
+                write_files(listings + [added])
+                deadline = time.monotonic() + 5
+                while reloader.generation < 2 and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                after, health = asyncio.run(search(added['enhanced_description'], 'semantic'))
+                hybrid, _ = asyncio.run(search("willow", 'hybrid'))
+                old_results = property_search_api.text_search_properties("willow", 1, indexes=in_flight)
+                reloader.stop()
+
+                del in_flight
+                retired = reloader.stats()['retired']
+
+        self.assertNotEqual(before['results'][0]['id'], 6100)
+        self.assertEqual(after['results'][0]['id'], 6100)
+        self.assertEqual(hybrid['results'][0]['id'], 6100)
+        self.assertEqual(old_results, [])
+        self.assertEqual(health['index']['generation'], 2)
+        self.assertEqual(health['result_cache']['invalidations'], 2)
+        self.assertEqual(retired, 1)
+
+
+class TestListingUpdates(unittest.TestCase):
+    """Test cases for single-listing upserts and deletes without a rebuild."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.listings = [{'listing_id': 7000 + i, 'address': f"{i} Oak Ct", 'price': 400000 + 1000 * i,
+                          'city': 'Grass Valley', 'status': 'Active',
+                          'enhanced_description': f"Listing {i} with a shady porch"} for i in range(12)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def embedded(self, listing):
+        return dict(listing, embedding=fake_embedding(listing['enhanced_description']))
+
+    def test_changes_are_appended_and_tombstoned_then_compacted(self):
+        """Searches see upserts and deletes at once; compaction gives the same results as a rebuild."""
+        embeddings_data = {'listings': [self.embedded(listing) for listing in self.listings]}
+        base = property_search_api.SearchIndexes(self.listings, embeddings_data,
+                                                 PropertyVectorIndex.from_embeddings_data(embeddings_data))
+        moved = dict(self.listings[3], city='Nevada City', enhanced_description="Listing 3 with a red barn")
+        added = {'listing_id': 7100, 'address': "1 Elm St", 'price': 700000, 'city': 'Penn Valley',
+                 'status': 'Active', 'enhanced_description': "New listing with a red barn"}
+        records = [{'op': 'upsert', 'listing': self.embedded(moved)},
+                   {'op': 'upsert', 'listing': self.embedded(added)},
+                   {'op': 'delete', 'listing_id': 7005}]
+        updated = base.with_changes(records)
+        again = updated.with_changes([{'op': 'upsert', 'listing': self.embedded(dict(added, price=710000))}])
+
+        def ids(indexes, query, mode='text', **filters):
+            if mode == 'text':
+                results = property_search_api.text_search_properties(query, 20, filters, indexes)
+            else:
+                results = property_search_api.semantic_search_with_embedding(query, fake_embedding(query), 20,
+                                                                             filters, indexes)
+            return [result['id'] for result in results]
+
+        self.assertEqual(ids(base, "barn"), [])
+        self.assertEqual(sorted(ids(updated, "barn")), [7003, 7100])
+        self.assertNotIn(7005, ids(updated, "porch"))
+        self.assertIn(7005, ids(base, "porch"))
+        self.assertEqual(ids(updated, "New listing with a red barn", 'semantic')[0], 7100)
+        self.assertEqual(ids(updated, "porch", city='Nevada City'), [])
+        self.assertEqual(ids(updated, "barn", city='nevada city'), [7003])
+        self.assertEqual((updated.pending_changes, updated.attribute_index.deleted), (3, 2))
+        # The second change filled a spare row of the same matrix buffer instead of copying it
+        self.assertTrue(np.shares_memory(updated.embedding_index.matrix, again.embedding_index.matrix))
+        self.assertEqual(len(updated.embedding_index), 14)
+        self.assertEqual(ids(again, "barn"), ids(updated, "barn"))
+        self.assertEqual(again.properties_data[again.live_rows(7100)[0][0]]['price'], 710000)
+        # Replaying records already applied changes nothing
+        self.assertIs(updated.with_changes(records), updated)
+
+        compacted = again.compacted()
+        final = [listing for listing in self.listings if listing['listing_id'] not in (7003, 7005)]
+        final += [moved, dict(added, price=710000)]
+        final_embeddings = {'listings': [self.embedded(listing) for listing in final]}
+        rebuilt = property_search_api.SearchIndexes(final, final_embeddings,
+                                                    PropertyVectorIndex.from_embeddings_data(final_embeddings))
+        self.assertEqual(compacted.attribute_index.deleted, 0)
+        for query in ("barn", "shady porch", "listing"):
+            self.assertEqual(property_search_api.text_search_properties(query, 20, indexes=compacted),
+                             property_search_api.text_search_properties(query, 20, indexes=rebuilt))
+            self.assertEqual(ids(compacted, query, 'semantic'), ids(rebuilt, query, 'semantic'))
+
+    def test_change_log_replays_and_compacts(self):
+        """Only complete records are read; compaction keeps the last record per listing."""
+        log = ListingChangeLog(os.path.join(self.tmp.name, 'changes.ndjson'))
+        self.assertEqual(log.read(), ([], None))
+        log.append([{'op': 'upsert', 'listing': dict(self.listings[0], price=price)} for price in (1, 2, 3)])
+        first, position = log.read()
+        log.append([{'op': 'delete', 'listing_id': 7000}, {'op': 'delete', 'listing_id': 7001}])
+        with open(log.path, 'a') as f:
+            f.write('{"op": "delete", "listi')  # A write still in progress
+        tail, end = log.read(position)
+        self.assertEqual(len(first), 3)
+        self.assertEqual([record['listing_id'] for record in tail], [7000, 7001])
+        self.assertEqual(log.read(end)[0], [])
+
+        with open(log.path, 'a') as f:
+            f.write('ng_id": 7002}\n')
+        tail, end = log.compact(end)
+        # Six records for three listings: half are superseded, so the log is rewritten
+        self.assertEqual(tail, [{'op': 'delete', 'listing_id': 7002}])
+        records, position = log.read()
+        self.assertEqual([record['listing_id'] for record in records], [7000, 7001, 7002])
+        self.assertEqual(position, end)
+
+    def test_listing_endpoints_update_search_and_survive_restart(self):
+        """PUT and DELETE are searchable as soon as they return, and replayed from the log on reload."""
+        listings_path = os.path.join(self.tmp.name, 'enhanced_listings.json')
+        embeddings_path = os.path.join(self.tmp.name, 'embeddings.json')
+        write_listings(listings_path, self.listings)
+        with open(embeddings_path, 'w') as f:
+            json.dump({'listings': [self.embedded(listing) for listing in self.listings]}, f)
+        record = {'Address - Street Complete': "12 Orchard Rd", 'Address - City': "Grass Valley",
+                  'Address - Zip Code': 95945, 'List Price': 610000, 'Bedrooms And Possible Bedrooms': "3",
+                  'Full Bathrooms': 2, 'Square Footage': 1800, 'Lot Size - Acres': 2.5,
+                  'Architectural Style': "Craftsman", 'Public Remarks': "Moonlit orchard with a stone well",
+                  'Status': "Active", 'DOM': 3}
+        expected_text = build_embedding_text(PropertyVibeEnhancer().enhance_record(dict(record, **{
+            'Listing Number': 7100})))
+        admin = {'X-Admin-Key': 'secret'}
+
+        async def run():
+            transport = httpx.ASGITransport(app=property_search_api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                async def search(query, mode='text'):
+                    response = await client.post('/search', json={'query': query, 'mode': mode, 'limit': 20,
+                                                                  'parse_query': False})
+                    return [result['id'] for result in response.json()['results']]
+
+                responses = {
+                    'unauthorized': await client.put('/listings/7100', json=record),
+                    'mismatch': await client.put('/listings/7100', json=dict(record, **{'Listing Number': 7101}),
+                                                 headers=admin),
+                    'invalid': await client.put('/listings/7100', json=dict(record, **{'List Price': "cheap"}),
+                                                headers=admin),
+                    'before': await search("orchard"),
+                    'put': await client.put('/listings/7100', json=record, headers=admin),
+                    'text': await search("orchard"),
+                    'semantic': await search(expected_text, 'semantic'),
+                    'pending': await client.put('/listings/7001', json=dict(record, Status="Pending"),
+                                                headers=admin),
+                    'delete': await client.delete('/listings/7002', headers=admin),
+                    'missing': await client.delete('/listings/9999', headers=admin),
+                    'porch': await search("porch"),
+                }
+                with mock.patch.object(security_config, 'admin_api_keys', []):
+                    responses['disabled'] = await client.delete('/listings/7003', headers=admin)
+                responses['health'] = (await client.get('/health')).json()
+                return responses
+
+        with FakeGeminiServer() as server, \
+                mock.patch.object(security_config, 'admin_api_keys', ['secret']), \
+                mock.patch.multiple(property_search_api, result_cache=SearchResultCache(),
+                                    listing_log=ListingChangeLog(os.path.join(self.tmp.name, 'changes.ndjson')),
+                                    LISTING_MANIFEST_PATH=os.path.join(self.tmp.name, 'manifest.json'),
+                                    DEFAULT_LISTINGS_PATHS=[listings_path],
+                                    default_listings_path=lambda: listings_path,
+                                    EMBEDDING_STORE_PATH=os.path.join(self.tmp.name, 'missing.npy'),
+                                    EMBEDDINGS_JSON_PATH=embeddings_path,
+                                    gemini_embedder=CachedGeminiPropertyEmbedder('test-key', api_base=server.api_base)):
+            property_search_api.publish_search_indexes(property_search_api.build_search_indexes())
+            responses = asyncio.run(run())
+            restarted = property_search_api.build_search_indexes()
+
+        self.assertEqual(responses['unauthorized'].status_code, 401)
+        self.assertEqual(responses['mismatch'].status_code, 400)
+        self.assertEqual(responses['invalid'].status_code, 400)
+        self.assertEqual(responses['disabled'].status_code, 403)
+        self.assertEqual(responses['missing'].status_code, 404)
+        self.assertEqual(responses['put'].json()['status'], 'upserted')
+        self.assertEqual(responses['pending'].json()['status'], 'deleted')
+        self.assertEqual(responses['delete'].json()['status'], 'deleted')
+        self.assertEqual(responses['before'], [])
+        self.assertEqual(responses['text'], [7100])
+        self.assertEqual(responses['semantic'][0], 7100)
+        self.assertEqual(set(responses['porch']), {7000 + i for i in range(12)} - {7001, 7002})
+        # The listing's document embedding was fetched once; nothing else called the API
+        self.assertIn(expected_text, server.texts_seen)
+        self.assertEqual(responses['health']['listing_updates']['changes_since_compaction'], 3)
+
+        # A restart rebuilds from the unchanged files plus the log
+        self.assertEqual(restarted.pending_changes, 0)
+        self.assertEqual(sorted(listing['listing_id'] for listing in restarted.properties_data),
+                         sorted({7000 + i for i in range(12)} - {7001, 7002} | {7100}))
+        self.assertEqual(sorted(restarted.embedding_index.listing_ids.tolist()),
+                         sorted(listing['listing_id'] for listing in restarted.properties_data))
+
+
+    def test_rebuilt_base_supersedes_only_the_listings_it_changed(self):
+        """A logged change is dropped once an incremental run changes that listing, and not before."""
+        listings_path = os.path.join(self.tmp.name, 'enhanced_listings.json')
+        embeddings_path = os.path.join(self.tmp.name, 'embeddings.json')
+        manifest_path = os.path.join(self.tmp.name, 'manifest.json')
+        updated_at = {str(listing['listing_id']): 1.0 for listing in self.listings}
+
+        def write_base(listings):
+            write_listings(listings_path, listings)
+            with open(embeddings_path, 'w') as f:
+                json.dump({'listings': [self.embedded(listing) for listing in listings],
+                           'metadata': {'created_timestamp': time.time()}}, f)
+            save_manifest(manifest_path, {key: {'hash': key, 'active': True, 'updated_at': timestamp}
+                                          for key, timestamp in updated_at.items()})
+
+        def live(indexes, listing_id):
+            rows = indexes.live_rows(listing_id)[0]
+            return indexes.properties_data[rows[0]] if len(rows) else None
+
+        write_base(self.listings)
+        log = ListingChangeLog(os.path.join(self.tmp.name, 'changes.ndjson'))
+        added = {'listing_id': 7100, 'address': "1 Elm St", 'price': 700000, 'city': 'Penn Valley',
+                 'status': 'Active', 'enhanced_description': "New listing with a red barn"}
+        with mock.patch.multiple(property_search_api, result_cache=SearchResultCache(), listing_log=log,
+                                 LISTING_MANIFEST_PATH=manifest_path,
+                                 DEFAULT_LISTINGS_PATHS=[listings_path],
+                                 default_listings_path=lambda: listings_path,
+                                 EMBEDDING_STORE_PATH=os.path.join(self.tmp.name, 'missing.npy'),
+                                 EMBEDDINGS_JSON_PATH=embeddings_path, gemini_embedder=mock.Mock()):
+            property_search_api.publish_search_indexes(property_search_api.build_search_indexes())
+            for record in [{'op': 'upsert', 'listing': self.embedded(added)},
+                           {'op': 'upsert', 'listing': self.embedded(dict(self.listings[4], price=1))},
+                           {'op': 'upsert', 'listing': self.embedded(dict(self.listings[5], price=2))},
+                           {'op': 'delete', 'listing_id': 7002}]:
+                property_search_api.apply_listing_change(record)
+
+            # Rewriting the files without changing a listing (a touch, a full rebuild) keeps every change
+            time.sleep(0.01)
+            write_base(self.listings)
+            rewritten = property_search_api.build_search_indexes()
+
+            # An incremental run repriced 7004 and relisted 7002
+            time.sleep(0.01)
+            updated_at.update({'7004': time.time(), '7002': time.time()})
+            write_base([dict(listing, price=999) if listing['listing_id'] == 7004 else listing
+                        for listing in self.listings])
+            rebuilt = property_search_api.build_search_indexes()
+            log_after_rebuild = log.read()[0]
+            property_search_api.publish_search_indexes(rebuilt)
+            property_search_api.apply_listing_change({'op': 'delete', 'listing_id': 7003})
+            current = property_search_api.search_indexes
+
+        self.assertEqual((live(rewritten, 7100)['price'], live(rewritten, 7004)['price'],
+                          live(rewritten, 7005)['price'], live(rewritten, 7002)), (700000, 1, 2, None))
+        self.assertEqual((live(rebuilt, 7100)['price'], live(rebuilt, 7004)['price'],
+                          live(rebuilt, 7005)['price'], live(rebuilt, 7002)['price']), (700000, 999, 2, 402000))
+        self.assertEqual(sorted(rebuilt.embedding_index.listing_ids.tolist()),
+                         sorted(listing['listing_id'] for listing in rebuilt.properties_data))
+        self.assertEqual(sorted(record_listing_id(record) for record in log_after_rebuild), [7005, 7100])
+        # Changes logged after the rebuild still apply
+        self.assertIsNone(live(current, 7003))
+
+class TestEmbeddingStore(unittest.TestCase):
+    """Test cases for the binary, memory-mapped embedding store."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = make_embeddings_data(count=20)
+        self.json_path = os.path.join(self.tmpdir.name, 'embeddings.json')
+        self.store_path = os.path.join(self.tmpdir.name, 'embeddings.npy')
+        with open(self.json_path, 'w') as f:
+            json.dump(self.data, f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_convert_and_memmap(self):
+        """Converted store loads as a memmap and searches like the JSON data."""
+        convert_json_embeddings(self.json_path, self.store_path)
+        self.assertTrue(os.path.exists(sidecar_path(self.store_path)))
+
+        store = load_embedding_store(self.store_path)
+        self.assertIsInstance(store['matrix'], np.memmap)
+        self.assertEqual(store['matrix'].dtype, np.float32)
+        self.assertEqual(store['listing_ids'], [listing['listing_id'] for listing in self.data['listings']])
+        self.assertEqual(len(store['content_hashes']), 20)
+        self.assertNotIn('embedding', store['listings'][0])
+
+        query = self.data['listings'][5]['embedding']
+        from_store = PropertyVectorIndex.from_embedding_store(store).search(query, top_k=3)
+        from_json = PropertyVectorIndex.from_embeddings_data(self.data).search(query, top_k=3)
+        self.assertEqual([r['listing_id'] for r in from_store], [r['listing_id'] for r in from_json])
+        self.assertAlmostEqual(from_store[0]['similarity_score'], 1.0, places=5)
+
+    def test_apply_delta_embeds_only_upserts(self):
+        """Deletes drop rows, upserts replace or append them, and nothing else is re-embedded."""
+        convert_json_embeddings(self.json_path, self.store_path)
+        changed = dict(self.data['listings'][3], enhanced_description="Now with a pool")
+        added = {'listing_id': 5000, 'address': "1 New Rd, Nevada City", 'price': 450000,
+                 'enhanced_description': "Brand new listing"}
+        sent = []
+
+        def embed_texts(texts):
+            sent.extend(texts)
+            return [[1.0] + [0.0] * 15 for _ in texts]
+
+        apply_delta_to_store(self.store_path, [changed, added], [1004, 1005], embed_texts)
+
+        store = load_embedding_store(self.store_path)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(len(store['listing_ids']), 19)
+        self.assertNotIn(1004, store['listing_ids'])
+        self.assertEqual(store['listing_ids'][-2:], [1003, 5000])
+        self.assertEqual(store['listings'][-2]['enhanced_description'], "Now with a pool")
+        np.testing.assert_allclose(store['matrix'][-1], [1.0] + [0.0] * 15)
+
+    def test_matrix_from_another_save_is_rejected(self):
+        """A matrix published without its sidecar is caught even when the row count still matches."""
+        convert_json_embeddings(self.json_path, self.store_path)
+        # Same shape, different save: one row dropped and one appended
+        other_path = os.path.join(self.tmpdir.name, 'other.npy')
+        apply_delta_to_store(self.store_path, [{'listing_id': 5000, 'enhanced_description': "Appended"}], [1004],
+                             lambda texts: [[1.0] + [0.0] * 15 for _ in texts])
+        os.replace(self.store_path, other_path)
+        convert_json_embeddings(self.json_path, self.store_path)
+        os.replace(other_path, self.store_path)
+
+        with mock.patch('embedding_store.LOAD_RETRY_DELAY', 0):
+            with self.assertRaises(ValueError):
+                load_embedding_store(self.store_path)
+
+
+    def test_load_does_not_read_the_matrix_but_verify_does(self):
+        """Loads check the generation id only; an explicit verify catches a corrupted matrix."""
+        convert_json_embeddings(self.json_path, self.store_path)
+        with mock.patch('embedding_store.matrix_digest', side_effect=AssertionError("matrix was read")):
+            store = load_embedding_store(self.store_path)
+        self.assertEqual(store['matrix'].shape, (20, 16))
+        self.assertEqual(len(verify_embedding_store(self.store_path)['listing_ids']), 20)
+
+        corrupted = np.load(self.store_path, mmap_mode='r+')
+        corrupted[3, 0] += 1.0
+        corrupted.flush()
+        del corrupted
+        load_embedding_store(self.store_path)
+        with self.assertRaises(ValueError):
+            verify_embedding_store(self.store_path)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
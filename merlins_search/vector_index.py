@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Merlin's Shack Semantic Search - Vector Index
+Preloaded, L2-normalised embedding matrix for one-shot similarity search.
+"""
+
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+import numpy as np
+
+
+class PropertyVectorIndex:
+    """Contiguous float32 embedding matrix with a row -> listing mapping.
+
+    Built once at load time; every query is then a single matrix-vector
+    product followed by an argpartition top-k, instead of a Python loop
+    over listing dicts.
+    """
+
+    # Above this share of rows, a filtered search scores every row and picks the candidates
+    GATHER_MAX_FRACTION = 0.2
+
+    # Listings per block in top_k_batch; bounds the (queries x block) score matrix
+    BATCH_BLOCK_ROWS = 65536
+
+    # Spare rows reserved when with_appended() has to grow the matrix; later appends fill them in place
+    APPEND_SLOTS = 1024
+
+    def __init__(self, matrix: np.ndarray, listing_ids: np.ndarray, listings: List[Dict[str, Any]]):
+        """Wrap an already L2-normalised (n, d) float32 matrix."""
+        self.matrix = matrix
+        self.listing_ids = listing_ids
+        self.listings = listings
+        # ``matrix`` is a view of the first rows of ``_buffer``; ``_filled[0]`` is how many rows
+        # of the buffer any index has claimed, shared by every index over the same buffer
+        self._buffer = matrix
+        self._filled = [len(matrix)]
+
+    @classmethod
+    def from_embeddings_data(cls, embeddings_data: Dict[str, Any]) -> 'PropertyVectorIndex':
+        """Build an index from the {'listings': [...], 'metadata': {...}} embeddings format."""
+        listings = []
+        vectors = []
+        for listing in embeddings_data.get('listings', []):
+            embedding = listing.get('embedding')
+            if not embedding:
+                continue
+            vectors.append(embedding)
+            # Keep the listing without its embedding so results stay small
+            listings.append({key: value for key, value in listing.items() if key != 'embedding'})
+
+        if vectors:
+            matrix = np.array(vectors, dtype=np.float32)
+        else:
+            dimension = embeddings_data.get('metadata', {}).get('embedding_dimension') or 0
+            matrix = np.zeros((0, dimension), dtype=np.float32)
+
+        listing_ids = np.array([listing.get('listing_id') for listing in listings])
+        return cls(normalize_rows(matrix), listing_ids, listings)
+
+    @classmethod
+    def from_embedding_store(cls, store: Dict[str, Any]) -> 'PropertyVectorIndex':
+        """Wrap a loaded binary store; its memory-mapped matrix is used without copying."""
+        matrix = store['matrix']
+        if not store.get('metadata', {}).get('normalized'):
+            matrix = normalize_rows(matrix)
+        return cls(matrix, np.array(store['listing_ids']), store['listings'])
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    def with_appended(self, vectors: Sequence, listings: List[Dict[str, Any]]) -> 'PropertyVectorIndex':
+        """A new index with one row per listing added after the existing rows.
+
+        The vectors are written into spare slots at the end of the shared
+        buffer, past every row this index can see, so searches still reading
+        it are unaffected. When there are no free slots (or the matrix is a
+        read-only memory map) the matrix is copied once into a buffer with
+        APPEND_SLOTS spare rows.
+        """
+        if not listings:
+            return self
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(listings), -1))
+        if len(listings) and vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimension embeddings, got {vectors.shape[1]}")
+        size = len(self) + len(listings)
+
+        buffer, filled = self._buffer, self._filled
+        if not (filled[0] == len(self) and size <= len(buffer) and buffer.flags.writeable
+                and not isinstance(buffer, np.memmap)):
+            buffer = np.empty((size + self.APPEND_SLOTS, self.dimension), dtype=np.float32)
+            buffer[:len(self)] = self.matrix
+            filled = [len(self)]
+        buffer[len(self):size] = vectors
+        filled[0] = size
+
+        new_ids = np.array([listing.get('listing_id') for listing in listings])
+        index = PropertyVectorIndex(buffer[:size],
+                                    np.concatenate([self.listing_ids, new_ids]) if len(self) else new_ids,
+                                    self.listings + list(listings))
+        index._buffer, index._filled = buffer, filled
+        return index
+
+    def subset(self, rows: np.ndarray) -> 'PropertyVectorIndex':
+        """A new index of just ``rows`` (e.g. the live rows), in a freshly copied matrix."""
+        rows = np.asarray(rows, dtype=np.intp)
+        return PropertyVectorIndex(np.ascontiguousarray(self.matrix[rows]), self.listing_ids[rows],
+                                   [self.listings[row] for row in rows])
+
+    def normalize_query(self, query_embedding) -> Optional[np.ndarray]:
+        """Convert a query embedding to a unit-length float32 vector (None if unusable)."""
+        if query_embedding is None:
+            return None
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        if query_vec.shape != (self.dimension,):
+            return None
+        norm = np.linalg.norm(query_vec)
+        if norm == 0:
+            return None
+        return query_vec / norm
+
+    def top_k(self, query_embedding, top_k: int = 5,
+              rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the top_k most similar listings, best first.
+
+        ``rows`` restricts the search to those candidate rows (e.g. the rows
+        passing an attribute filter); only they are multiplied, so the scan
+        gets cheaper as the candidate set shrinks.
+        """
+        query_vec = self.normalize_query(query_embedding)
+        if query_vec is None or len(self) == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        if rows is None:
+            scores = self.matrix @ query_vec
+        else:
+            rows = np.asarray(rows, dtype=np.intp)
+            if len(rows) <= self.GATHER_MAX_FRACTION * len(self):
+                scores = self.matrix[rows] @ query_vec
+            else:
+                # Copying most of the matrix costs more than scoring all of it
+                scores = (self.matrix @ query_vec)[rows]
+        k = min(top_k, scores.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        best = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return (best if rows is None else rows[best]), scores[best]
+
+    def top_k_batch(self, query_embeddings: Sequence, top_k: Union[int, Sequence[int]] = 5,
+                    rows: Optional[Sequence[Optional[np.ndarray]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """top_k for many queries, returning one (rows, scores) pair per query.
+
+        ``top_k`` and ``rows`` may be given per query. Unfiltered queries are
+        stacked into a matrix Q and scored together as Q @ M.T, one block of
+        BATCH_BLOCK_ROWS listings at a time, keeping a running top-k per
+        query; the product runs as a single BLAS call per block. Filtered
+        queries have their own candidate rows and go through top_k.
+        """
+        count = len(query_embeddings)
+        limits = [top_k] * count if isinstance(top_k, int) else list(top_k)
+        rows = [None] * count if rows is None else list(rows)
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+        results: List[Tuple[np.ndarray, np.ndarray]] = [empty] * count
+
+        batched = []
+        for i, query_embedding in enumerate(query_embeddings):
+            if rows[i] is not None:
+                results[i] = self.top_k(query_embedding, limits[i], rows[i])
+                continue
+            query_vec = self.normalize_query(query_embedding)
+            if query_vec is not None and limits[i] > 0 and len(self):
+                batched.append((i, query_vec))
+        if not batched:
+            return results
+
+        queries = np.stack([query_vec for _, query_vec in batched])
+        k = min(max(limits[i] for i, _ in batched), len(self))
+        best_rows = np.empty((len(batched), 0), dtype=np.intp)
+        best_scores = np.empty((len(batched), 0), dtype=np.float32)
+        for start in range(0, len(self), self.BATCH_BLOCK_ROWS):
+            block = self.matrix[start:start + self.BATCH_BLOCK_ROWS]
+            scores = np.hstack([best_scores, queries @ block.T])
+            candidates = np.hstack([best_rows, np.broadcast_to(np.arange(start, start + len(block)),
+                                                               (len(batched), len(block)))])
+            if k < scores.shape[1]:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                candidates = np.take_along_axis(candidates, keep, axis=1)
+            best_rows, best_scores = candidates, scores
+
+        for position, (i, _) in enumerate(batched):
+            order = np.argsort(-best_scores[position], kind='stable')[:limits[i]]
+            results[i] = best_rows[position][order], best_scores[position][order]
+        return results
+
+    def search(self, query_embedding, top_k: int = 5, rows: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Return listing dicts with a 'similarity_score' for the best matches (among ``rows``, if given)."""
+        rows, scores = self.top_k(query_embedding, top_k, rows)
+
+        results = []
+        for row, score in zip(rows, scores):
+            result = self.listings[row].copy()
+            result['similarity_score'] = float(score)
+            results.append(result)
+
+        return results
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalise each row of a matrix into a new contiguous float32 array."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Zero vectors stay zero and simply score 0 against every query
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)